@@ -0,0 +1,190 @@
+# api/feature_cache.py
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from utils.logger import logger
+
+
+class FeatureCache:
+    """
+    Read-through LRU cache over vehicle_features.
+
+    get() serves hits from memory and loads misses from the database,
+    evicting the least recently used vehicle once ``max_size`` is reached.
+    A background watcher polls feature_build_runs and drops the whole
+    cache when a new build finishes, so hits never touch the database.
+
+    context() does the same for a vehicle's plant_id, model_type and shift
+    (the keys of api.risk_engine rules); those never change, so builds do
+    not clear them.
+    """
+
+    def __init__(self, engine, columns, max_size=100000, poll_interval=10.0):
+        self.engine = engine
+        self.columns = list(columns)
+        self.max_size = max_size
+        self.poll_interval = poll_interval
+
+        self._entries = OrderedDict()
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._build_run_id = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, vehicle_id):
+        with self._lock:
+            features = self._entries.get(vehicle_id)
+            if features is not None:
+                self._entries.move_to_end(vehicle_id)
+                self.hits += 1
+                return features
+            self.misses += 1
+
+        query = text(
+            f"SELECT {', '.join(self.columns)} FROM vehicle_features "
+            "WHERE vehicle_id = :vehicle_id"
+        )
+        with self.engine.connect() as conn:
+            row = conn.execute(query, {"vehicle_id": vehicle_id}).mappings().first()
+
+        if row is None:
+            return None
+
+        features = self._to_features(row)
+        self._put(vehicle_id, features)
+        return features
+
+    def context(self, vehicle_id):
+        """{plant_id, model_type, shift} of a vehicle, or {} when it is unknown."""
+        with self._lock:
+            context = self._contexts.get(vehicle_id)
+            if context is not None:
+                self._contexts.move_to_end(vehicle_id)
+                return context
+
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT plant_id, model_type, shift FROM vehicles WHERE vehicle_id = :vehicle_id"
+            ), {"vehicle_id": vehicle_id}).mappings().first()
+
+        if row is None:
+            return {}
+
+        context = dict(row)
+        with self._lock:
+            self._contexts[vehicle_id] = context
+            while len(self._contexts) > self.max_size:
+                self._contexts.popitem(last=False)
+        return context
+
+    def preload(self, plant_id=None, production_date_from=None, production_date_to=None):
+        """Bulk-load features for vehicles of a plant and/or production date range."""
+        conditions = []
+        params = {}
+
+        if plant_id is not None:
+            conditions.append("v.plant_id = :plant_id")
+            params["plant_id"] = plant_id
+        if production_date_from is not None:
+            conditions.append("v.production_date >= :production_date_from")
+            params["production_date_from"] = production_date_from
+        if production_date_to is not None:
+            conditions.append("v.production_date <= :production_date_to")
+            params["production_date_to"] = production_date_to
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        columns = ", ".join(f"f.{c}" for c in self.columns)
+
+        query = text(f"""
+            SELECT f.vehicle_id, {columns}
+            FROM vehicle_features f
+            JOIN vehicles v ON v.vehicle_id = f.vehicle_id
+            {where}
+            LIMIT :limit
+        """)
+        params["limit"] = self.max_size
+
+        loaded = 0
+        with self.engine.connect() as conn:
+            for row in conn.execute(query, params).mappings():
+                self._put(row["vehicle_id"], self._to_features(row))
+                loaded += 1
+
+        logger.info(f"Preloaded features for {loaded} vehicles")
+        return loaded
+
+    def invalidate(self, vehicle_ids=None):
+        """Drop the given vehicles, or everything when no ids are passed."""
+        with self._lock:
+            if vehicle_ids is None:
+                self._entries.clear()
+            else:
+                for vehicle_id in vehicle_ids:
+                    self._entries.pop(vehicle_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "build_run_id": self._build_run_id
+            }
+
+    def start_watcher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._build_run_id = self._latest_build_run()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="feature-build-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval)
+            self._thread = None
+
+    def _put(self, vehicle_id, features):
+        with self._lock:
+            self._entries[vehicle_id] = features
+            self._entries.move_to_end(vehicle_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _to_features(self, row):
+        # MySQL returns Decimal for SUM/AVG; the models expect plain numbers
+        return {
+            c: (None if row[c] is None else float(row[c]))
+            for c in self.columns
+        }
+
+    def _latest_build_run(self):
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(text(
+                    "SELECT MAX(run_id) FROM feature_build_runs WHERE finished_at IS NOT NULL"
+                )).scalar()
+        except Exception as e:
+            logger.warning(f"Could not read feature_build_runs: {e}")
+            return self._build_run_id
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            run_id = self._latest_build_run()
+            if run_id != self._build_run_id:
+                logger.info(f"Feature build run {run_id} finished, clearing feature cache")
+                self._build_run_id = run_id
+                self.invalidate()
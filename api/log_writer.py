@@ -0,0 +1,190 @@
+# api/log_writer.py
+
+import queue
+import threading
+import time
+
+from utils.logger import logger
+
+
+class BufferedLogWriter:
+    """
+    Background sink for log rows.
+
+    Rows are put on a bounded in-memory queue and a worker thread drains
+    it, writing each batch with one executemany (multi-row INSERT). A batch
+    is written when it reaches ``batch_size`` rows or when ``flush_interval``
+    seconds have passed since its first row, whichever comes first.
+
+    When the queue is full, submit() waits up to ``put_timeout`` seconds
+    (backpressure) and then drops the row, counting it in ``dropped``.
+    submit_many() never waits: rows that do not fit are dropped at once,
+    so a large batch cannot stall its request on a full queue.
+
+    ``on_write``, if given, is called from the worker with every batch
+    that was written successfully. ``on_flush``, if given, is called as
+    ``on_flush(seconds, rows)`` with the duration of every write.
+    """
+
+    def __init__(
+        self,
+        engine,
+        statement,
+        max_queue_size=10000,
+        batch_size=500,
+        flush_interval=1.0,
+        put_timeout=0.005,
+        name="log-writer",
+        on_write=None,
+        on_flush=None
+    ):
+        self.engine = engine
+        self.statement = statement
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.name = name
+        self.on_write = on_write
+        self.on_flush = on_flush
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """Queue one row. Returns False if it was dropped."""
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def submit_many(self, rows):
+        """Queue several rows without blocking. Returns the number accepted."""
+        accepted = 0
+        dropped = 0
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+                accepted += 1
+            except queue.Full:
+                dropped += 1
+
+        with self._lock:
+            self.submitted += accepted
+            self.dropped += dropped
+        return accepted
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth(),
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed
+            }
+
+    def stop(self, timeout=10.0):
+        """Stop the worker after flushing everything already queued."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Still flushing: its shutdown loop owns the rest of the queue
+                logger.warning(
+                    f"{self.name}: worker still running after {timeout:.0f}s, "
+                    f"{self.queue_depth()} rows left to it"
+                )
+                return
+            self._thread = None
+
+        # Anything left by a worker that never started
+        self._flush(self._drain(limit=None))
+
+    def _drain(self, limit):
+        rows = []
+        while limit is None or len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_event.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+        # Shutdown: write out whatever is still buffered
+        while True:
+            batch = self._drain(limit=self.batch_size)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self.statement, batch)
+        except Exception as e:
+            logger.error(f"{self.name}: failed to write {len(batch)} rows: {e}")
+            with self._lock:
+                self.failed += len(batch)
+            return
+
+        with self._lock:
+            self.written += len(batch)
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(time.perf_counter() - start, len(batch))
+            except Exception as e:
+                logger.error(f"{self.name}: on_flush callback failed: {e}")
+
+        if self.on_write is not None:
+            try:
+                self.on_write(batch)
+            except Exception as e:
+                logger.error(f"{self.name}: on_write callback failed: {e}")
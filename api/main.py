@@ -1,23 +1,213 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, ConfigDict
-import pandas as pd
+# First, so startup timing covers the imports below
+from api.startup import startup
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ConfigDict, ValidationError
 from fastapi import HTTPException
 
-from api.model_loader import load_models , get_model_version
-from api.risk_engine import calculate_risk
+from api.model_loader import (
+    model_holder,
+    ModelHolder,
+    version_cache,
+    ModelsNotLoaded,
+    MODEL_STARTUP_MODE,
+    WARMUP_SAMPLE_SIZE
+)
+from api.risk_engine import risk_policy
+from api.log_writer import BufferedLogWriter
+from api.feature_cache import FeatureCache
+from api.online_features import OnlineFeatureStore
+from api.prediction_cache import PredictionCache
+from api.shadow import ShadowScorer
+from api.metrics import registry, CONTENT_TYPE, RequestTimingMiddleware, StageTimer
+from ml.prediction_rollups import prediction_summary
+from ml.running_stats import LiveStatsAggregator
+from ml.utils import load_baseline_histograms
+from utils.logger import logger
 
+import os
 import time
 import json
-from sqlalchemy import create_engine
-from database.session import DATABASE_URL
-from sqlalchemy import text
+import datetime
+import numpy as np
+from typing import List, Optional
+from database.session import engine, get_async_engine, dispose_async_engine
+from database.models import ShadowPredictionLog
+from database.migrations import PREDICTION_LOG_COLUMNS
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 
-app = FastAPI(title="AI Powered Manufacturing Platform")
+# Models load in the background once the app starts (see lifespan); later
+# alias moves are hot-swapped
+version_cache.add_listener(model_holder.on_alias_change)
 
-# Load models once at startup (important)
-warranty_model, anomaly_model = load_models()
+# Upper bound on vehicles accepted by a single /predict/batch call
+MAX_BATCH_SIZE = 5000
+# Upper bound on events accepted by a single /ingest/events call
+MAX_INGEST_EVENTS = int(os.getenv("MAX_INGEST_EVENTS", "50000"))
 
-engine = create_engine(DATABASE_URL)
+PREDICTION_LOG_FIELDS = [
+    "model_alias", "model_version", "warranty_probability", "anomaly_flag",
+    "risk_level", "risk_rule", "request_payload", "latency_ms", "cache_hit"
+]
+
+
+def prediction_log_insert(fields=PREDICTION_LOG_FIELDS):
+    # Rows carry every field; columns missing from the table are left out here
+    return text(f"""
+    INSERT INTO prediction_logs
+    ({", ".join(fields)})
+    VALUES
+    ({", ".join(f":{field}" for field in fields)})
+    """)
+
+
+INSERT_PREDICTION_LOG = prediction_log_insert()
+
+FEATURE_NAMES = [
+    "total_error_count",
+    "avg_cycle_time",
+    "cycle_time_variance",
+    "rework_ratio",
+    "vendor_defect_ratio",
+    "avg_torque",
+    "torque_deviation"
+]
+
+PREDICT_STAGE_SECONDS = registry.histogram(
+    "predict_stage_seconds",
+    "Wall time per stage of the prediction path",
+    ["endpoint", "stage"]
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from the request reaching the app to the end of the response",
+    ["method", "path", "status"]
+)
+LOG_FLUSH_SECONDS = registry.histogram(
+    "prediction_log_flush_seconds",
+    "Database write time per batch of prediction log rows"
+)
+
+# Running per-feature statistics for drift monitoring, fed by the log writer
+live_stats = LiveStatsAggregator(
+    engine,
+    FEATURE_NAMES,
+    bucket_seconds=int(os.getenv("LIVE_STATS_BUCKET_SECONDS", "300"))
+)
+
+
+def load_drift_baseline(model_name="WarrantyModel", alias="production", *args):
+    # Count live values on the training histogram bins (ml.drift_monitor) of
+    # the production model's run
+    if model_name != "WarrantyModel" or alias != model_holder.alias:
+        return
+    try:
+        run_id, histograms = load_baseline_histograms(engine)
+    except Exception as e:
+        logger.warning(f"Could not load baseline histograms: {e}")
+        return
+    if run_id is not None and run_id != live_stats.histogram_run_id:
+        live_stats.set_baseline(run_id, histograms)
+
+
+version_cache.add_listener(load_drift_baseline)
+
+# Prediction logs are bulk-inserted by a background worker
+log_writer = BufferedLogWriter(
+    engine,
+    INSERT_PREDICTION_LOG,
+    max_queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "1.0")),
+    name="prediction-log-writer",
+    on_write=live_stats.update_from_log_rows,
+    on_flush=lambda seconds, rows: LOG_FLUSH_SECONDS.observe(seconds)
+)
+
+
+def prediction_log_columns():
+    """
+    Columns prediction_logs has, or None when it cannot be inspected.
+    Missing ones are added by ``python -m database.migrations``, not here.
+    """
+    try:
+        columns = {c["name"] for c in inspect(engine).get_columns("prediction_logs")}
+    except Exception as e:
+        logger.warning(f"Could not inspect prediction_logs: {e}")
+        return None
+    missing = [name for name in PREDICTION_LOG_COLUMNS if name not in columns]
+    if missing:
+        logger.warning(
+            f"prediction_logs lacks {', '.join(missing)}; logging without them "
+            "until `python -m database.migrations` is run"
+        )
+    return columns
+
+
+def configure_prediction_log():
+    columns = prediction_log_columns()
+    if columns is not None:
+        log_writer.statement = prediction_log_insert(
+            [field for field in PREDICTION_LOG_FIELDS if field in columns]
+        )
+
+
+def on_models_loaded():
+    seconds = startup.mark("ready")
+    if startup.within_budget():
+        logger.info(f"Models ready {seconds:.2f}s after start")
+    else:
+        logger.warning(
+            f"Models ready {seconds:.2f}s after start, over the "
+            f"{startup.budget:.0f}s startup budget (STARTUP_BUDGET_SECONDS)"
+        )
+
+    if MODEL_STARTUP_MODE == "cached":
+        # Started from the saved resolution; check it against the registry now.
+        # A moved alias reaches model_holder.on_alias_change and is hot-swapped.
+        for model_name in ("WarrantyModel", "AnomalyModel"):
+            try:
+                version_cache.refresh(model_name, model_holder.alias)
+            except Exception as e:
+                logger.warning(f"Could not confirm {model_name}@{model_holder.alias}: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    startup.mark("lifespan")
+    configure_prediction_log()
+    load_drift_baseline()
+    log_writer.start()
+    # /health answers while the models load; /ready and the predict routes wait for them
+    model_holder.load_async(use_saved=MODEL_STARTUP_MODE == "cached", on_loaded=on_models_loaded)
+    # Polls whatever the version cache holds; the model load fills it
+    if shadow.enabled:
+        ShadowPredictionLog.__table__.create(bind=engine, checkfirst=True)
+        shadow_log_writer.start()
+        challenger_holder.load_async(retry_interval=SHADOW_LOAD_RETRY_INTERVAL)
+    version_cache.start_watcher()
+    feature_cache.start_watcher()
+    yield
+    feature_cache.stop_watcher()
+    version_cache.stop_watcher()
+    shadow.stop()
+    shadow_log_writer.stop()
+    # Flush buffered prediction logs and open stat buckets before the process exits
+    log_writer.stop()
+    live_stats.flush(force=True)
+    engine.dispose()
+    await dispose_async_engine()
+
+
+app = FastAPI(title="AI Powered Manufacturing Platform", lifespan=lifespan)
+app.add_middleware(RequestTimingMiddleware, histogram=HTTP_REQUEST_SECONDS)
+
+
+@app.exception_handler(ModelsNotLoaded)
+async def models_not_loaded(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
 
 
 class VehicleInput(BaseModel):
@@ -31,66 +221,524 @@ class VehicleInput(BaseModel):
 
     model_config = ConfigDict(extra="forbid")
 
+
+# Online feature store for scoring by vehicle_id
+feature_cache = FeatureCache(
+    engine,
+    FEATURE_NAMES,
+    max_size=int(os.getenv("FEATURE_CACHE_SIZE", "100000")),
+    poll_interval=float(os.getenv("FEATURE_BUILD_POLL_INTERVAL", "10"))
+)
+
+# Per-vehicle aggregates updated by /ingest/events, ahead of the next feature build
+online_features = OnlineFeatureStore(
+    engine,
+    max_vehicles=int(os.getenv("ONLINE_FEATURE_MAX_VEHICLES", "100000")),
+    expected_stations=int(os.getenv("ONLINE_EXPECTED_STATIONS", "25"))
+)
+# The aggregates are per process: with several workers (WEB_CONCURRENCY, also
+# gunicorn's default -w) a vehicle's events may have gone to another worker, so
+# /predict/vehicle then scores from the feature build only
+PREFER_ONLINE_FEATURES = os.getenv(
+    "PREFER_ONLINE_FEATURES", "1" if int(os.getenv("WEB_CONCURRENCY", "1")) <= 1 else "0"
+) == "1"
+
+# Results for repeated payloads (retries, re-inspections); off unless PREDICTION_CACHE_SIZE > 0
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv("PREDICTION_CACHE_SIZE", "0")),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+)
+
+
+def clear_prediction_cache(model_name, alias, *args):
+    if alias == model_holder.alias:
+        prediction_cache.clear()
+
+
+version_cache.add_listener(clear_prediction_cache)
+
+# Shadow scoring: a SHADOW_FRACTION sample of live traffic is re-scored by the
+# SHADOW_ALIAS models after the response is sent. Off unless SHADOW_FRACTION > 0.
+SHADOW_FRACTION = float(os.getenv("SHADOW_FRACTION", "0"))
+SHADOW_ALIAS = os.getenv("SHADOW_ALIAS", "challenger")
+# Seconds between attempts when loading the challenger fails (e.g. registry down).
+# A missing challenger alias is not a failure: production stands in and the
+# alias watcher reloads once the alias is created.
+SHADOW_LOAD_RETRY_INTERVAL = float(os.getenv("SHADOW_LOAD_RETRY_INTERVAL", "300"))
+
+# A model without a challenger version is shadowed by its production version
+challenger_holder = ModelHolder(SHADOW_ALIAS, fallback_alias=model_holder.alias)
+
+shadow_log_writer = BufferedLogWriter(
+    engine,
+    ShadowPredictionLog.__table__.insert(),
+    max_queue_size=int(os.getenv("SHADOW_LOG_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("SHADOW_LOG_FLUSH_INTERVAL", "5.0")),
+    name="shadow-log-writer"
+)
+
+shadow = ShadowScorer(
+    challenger_holder,
+    risk_policy,
+    fraction=SHADOW_FRACTION,
+    workers=int(os.getenv("SHADOW_WORKERS", "2")),
+    max_pending=int(os.getenv("SHADOW_MAX_PENDING", "100")),
+    writer=shadow_log_writer
+)
+
+if shadow.enabled:
+    version_cache.add_listener(challenger_holder.on_alias_change)
+
+
+class StationEvent(BaseModel):
+    vehicle_id: str
+    station_id: str
+    cycle_time: float
+    error_count: int
+    rework_flag: bool
+    torque_value: float
+    temperature: Optional[float] = None
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class ComponentEvent(BaseModel):
+    vehicle_id: str
+    component_type: str
+    vendor_id: str
+    batch_id: Optional[str] = None
+    defect_flag: bool
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class EventBatch(BaseModel):
+    station_operations: List[StationEvent] = []
+    vendor_components: List[ComponentEvent] = []
+
+    model_config = ConfigDict(extra="forbid")
+
+
+def _serving_versions():
+    models = model_holder.current()
+    if models is None:
+        return []
+    return [
+        ({"model": "WarrantyModel"}, int(models.warranty_version)),
+        ({"model": "AnomalyModel"}, int(models.anomaly_version))
+    ]
+
+
+registry.gauge(
+    "serving_model_version",
+    "Registry version of the model pair being served",
+    _serving_versions
+)
+registry.gauge(
+    "registry_alias_version",
+    "Latest registry version seen for each model alias",
+    lambda: [
+        ({"model": model, "alias": alias}, int(version))
+        for (model, alias), version in version_cache.versions().items()
+    ]
+)
+registry.gauge(
+    "startup_phase_seconds",
+    "Seconds from process start to each startup phase (imports, lifespan, ready)",
+    lambda: [({"phase": phase}, seconds) for phase, seconds in startup.phases.items()]
+)
+registry.gauge(
+    "models_in_flight",
+    "Requests currently holding a lease on the served model pair",
+    lambda: model_holder.current().in_flight if model_holder.current() else 0
+)
+registry.gauge(
+    "prediction_log_queue_depth",
+    "Prediction log rows waiting for the background writer",
+    log_writer.queue_depth
+)
+registry.counter(
+    "prediction_log_rows_total",
+    "Prediction log rows by outcome",
+    lambda: [
+        ({"outcome": outcome}, log_writer.stats()[outcome])
+        for outcome in ("submitted", "written", "dropped", "failed")
+    ]
+)
+registry.gauge(
+    "feature_cache_entries",
+    "Vehicles held in the feature cache",
+    lambda: feature_cache.stats()["size"]
+)
+registry.counter(
+    "feature_cache_lookups_total",
+    "Feature cache lookups by result",
+    lambda: [
+        ({"result": "hit"}, feature_cache.stats()["hits"]),
+        ({"result": "miss"}, feature_cache.stats()["misses"])
+    ]
+)
+registry.counter(
+    "shadow_predictions_total",
+    "Rows sampled for shadow scoring by outcome",
+    lambda: [
+        ({"outcome": "scored"}, sum(pair["scored"] for pair in shadow.stats()["pairs"])),
+        ({"outcome": "dropped"}, shadow.stats()["dropped"]),
+        ({"outcome": "failed"}, shadow.stats()["failed"])
+    ]
+)
+registry.gauge(
+    "shadow_disagreement_rate",
+    "Share of shadow-scored rows where the challenger's risk level or anomaly flag differs",
+    lambda: [
+        ({"production": pair["production_version"], "challenger": pair["challenger_version"]},
+         pair["disagreement_rate"])
+        for pair in shadow.stats()["pairs"]
+    ]
+)
+registry.gauge(
+    "shadow_mean_abs_probability_diff",
+    "Mean |challenger - production| warranty probability over shadow-scored rows",
+    lambda: [
+        ({"production": pair["production_version"], "challenger": pair["challenger_version"]},
+         pair["mean_abs_probability_diff"])
+        for pair in shadow.stats()["pairs"]
+    ]
+)
+registry.gauge(
+    "prediction_cache_entries",
+    "Results held in the prediction cache",
+    lambda: prediction_cache.stats()["size"]
+)
+registry.counter(
+    "prediction_cache_lookups_total",
+    "Prediction cache lookups by result",
+    lambda: [
+        ({"result": "hit"}, prediction_cache.stats()["hits"]),
+        ({"result": "miss"}, prediction_cache.stats()["misses"])
+    ]
+)
+
+
 @app.get("/")
 def root():
     return {"message": "Welcome to the AI Powered Manufacturing Platform API!"}
 
 @app.get("/health")
 def health():
+    # Liveness: the process is up, models loaded or not
     return {"status": "healthy"}
 
+@app.get("/ready")
+def ready():
+    # Readiness: models are loaded and predictions can be served
+    models = model_holder.current()
+    if models is None:
+        return JSONResponse(status_code=503, content={"status": "loading", "startup": startup.phases})
+    return {
+        "status": "ready",
+        "warranty_model_version": models.warranty_version,
+        "anomaly_model_version": models.anomaly_version,
+        "startup": startup.phases,
+        "within_budget": startup.within_budget()
+    }
 
-@app.post("/predict")
-def predict(vehicle: VehicleInput):
+@app.get("/health/db")
+async def health_db():
+    # Async engine: the check never ties up a threadpool worker while waiting on the database
+    try:
+        async with get_async_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.error(f"Database health check failed: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "healthy", "pool": engine.pool.status()}
 
-    start_time = time.time()
 
-    input_df = pd.DataFrame([vehicle.model_dump()])
+@app.get("/metrics")
+def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
-    warranty_prob = warranty_model.predict(input_df)[0]
-    anomaly_flag = anomaly_model.predict(input_df)[0]
 
-    risk = calculate_risk(warranty_prob, anomaly_flag)
+@app.get("/cache/stats")
+def cache_stats():
+    return {"predictions": prediction_cache.stats(), "features": feature_cache.stats()}
 
-    latency = (time.time() - start_time) * 1000
 
-    # Fetch model versions
-    warranty_version = get_model_version("WarrantyModel")
-    anomaly_version = get_model_version("AnomalyModel")
+@app.get("/shadow/stats")
+def shadow_stats():
+    return shadow.stats()
 
-    print("Reached logging block")
 
-    # Insert log
-    insert_query = text("""
-    INSERT INTO prediction_logs
-    (model_alias, model_version, warranty_probability,
-     anomaly_flag, risk_level, request_payload, latency_ms)
-    VALUES
-    (:model_alias, :model_version, :warranty_probability,
-     :anomaly_flag, :risk_level, :request_payload, :latency_ms)
-    """)
+@app.get("/monitoring/predictions")
+def monitoring_predictions(hours: int = 24, model_version: Optional[str] = None):
+    # Hourly rollups written by ml.prediction_rollups, never the raw log
+    return prediction_summary(hours, model_version)
+
+
+def _start_timer(request):
+    """StageTimer with the time spent before the handler (body parsing and
+    validation) recorded, and the perf_counter time the request arrived."""
+    timer = StageTimer()
+    now = time.perf_counter()
+    received_at = getattr(request.state, "received_at", now)
+    timer.record("validation", now - received_at)
+    return timer, received_at
+
+
+def _score_and_log(payload, received_at, timer, endpoint, background_tasks=None, context=None):
+    # ``context``: plant_id / model_type / shift for keyed risk rules, when known
+    context = context or {}
+
+    # In-flight requests keep the pair they started with across a hot-swap.
+    # Versions come with the pair from the in-process cache, not the registry.
+    start = time.perf_counter()
+    with model_holder.lease() as models:
+        timer.record("registry_lookup", time.perf_counter() - start)
+        warranty_version = models.warranty_version
+        anomaly_version = models.anomaly_version
 
-    with engine.begin() as conn:
-        print("Inside transaction")
-        print("Connected DB:", conn.execute(text("SELECT DATABASE();")).fetchone())
-        result =conn.execute(
-        insert_query,
-        {
+        cached = None
+        if prediction_cache.enabled:
+            with timer.stage("cache_lookup"):
+                key = prediction_cache.key(
+                    payload, warranty_version, anomaly_version, risk_policy.version, context
+                )
+                cached = prediction_cache.get(key)
+
+        if cached is None:
+            warranty_probs, anomaly_flags = models.score([payload], timer)
+
+    if cached is not None:
+        warranty_prob, anomaly_flag, risk, rule = cached
+    else:
+        warranty_prob = float(warranty_probs[0])
+        anomaly_flag = int(anomaly_flags[0])
+
+        with timer.stage("risk"):
+            risk, rule = risk_policy.evaluate_one(warranty_prob, anomaly_flag, **context)
+        if prediction_cache.enabled:
+            prediction_cache.put(key, (warranty_prob, anomaly_flag, risk, rule))
+
+    latency = (time.perf_counter() - received_at) * 1000
+
+    with timer.stage("logging"):
+        model_holder.record_payloads([payload])
+
+        # Hand the row to the background writer; the DB commit is off the request path
+        log_writer.submit({
             "model_alias": "production",
             "model_version": warranty_version,
             "warranty_probability": float(warranty_prob),
             "anomaly_flag": int(anomaly_flag),
             "risk_level": risk,
-            "request_payload": json.dumps(vehicle.model_dump()),
-            "latency_ms": latency
+            "risk_rule": rule,
+            "request_payload": json.dumps(payload),
+            "latency_ms": latency,
+            "cache_hit": cached is not None
         })
-        print("Rows inserted:", result.rowcount)
-        
-      
+
+    PREDICT_STAGE_SECONDS.observe_all(timer.timings, "stage", endpoint=endpoint)
+
+    if shadow.enabled and background_tasks is not None:
+        # Runs after the response has been sent
+        background_tasks.add_task(
+            shadow.submit, [payload], [warranty_prob], [anomaly_flag], [risk],
+            (warranty_version, anomaly_version), context
+        )
 
     return {
         "warranty_probability": float(warranty_prob),
         "anomaly_flag": int(anomaly_flag),
         "risk_level": risk,
+        "risk_rule": rule,
         "latency_ms": latency
-    }
\ No newline at end of file
+    }
+
+
+@app.post("/predict")
+def predict(vehicle: VehicleInput, request: Request, background_tasks: BackgroundTasks):
+    timer, received_at = _start_timer(request)
+    return _score_and_log(vehicle.model_dump(), received_at, timer, "predict", background_tasks)
+
+
+@app.post("/predict/vehicle/{vehicle_id}")
+def predict_vehicle(vehicle_id: str, request: Request, background_tasks: BackgroundTasks):
+
+    timer, received_at = _start_timer(request)
+
+    with timer.stage("feature_lookup"):
+        # Freshest first: aggregates of ingested events, then the cached feature build
+        features = online_features.get(vehicle_id) if PREFER_ONLINE_FEATURES else None
+        if features is None:
+            # Served from memory on a hit; read-through to vehicle_features on a miss
+            features = feature_cache.get(vehicle_id)
+        # Only looked up when some risk rule is keyed by it
+        context = feature_cache.context(vehicle_id) if risk_policy.keyed else None
+    if features is None:
+        raise HTTPException(status_code=404, detail=f"No features for vehicle {vehicle_id}")
+
+    try:
+        vehicle = VehicleInput(**features)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Incomplete features for vehicle {vehicle_id}: {e}")
+
+    result = _score_and_log(
+        vehicle.model_dump(), received_at, timer, "vehicle", background_tasks, context
+    )
+    result["vehicle_id"] = vehicle_id
+    return result
+
+
+@app.post("/ingest/events")
+def ingest_events(batch: EventBatch):
+
+    total = len(batch.station_operations) + len(batch.vendor_components)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Empty batch")
+
+    if total > MAX_INGEST_EVENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size exceeds limit of {MAX_INGEST_EVENTS} events"
+        )
+
+    try:
+        touched = online_features.ingest(
+            [event.model_dump() for event in batch.station_operations],
+            [event.model_dump() for event in batch.vendor_components]
+        )
+    except IntegrityError as e:
+        raise HTTPException(status_code=422, detail=f"Events rejected by the database: {e.orig}")
+
+    # Cached build features of these vehicles are now out of date
+    feature_cache.invalidate(touched)
+
+    return {
+        "station_operations": len(batch.station_operations),
+        "vendor_components": len(batch.vendor_components),
+        "vehicles": len(touched),
+        "ready": [v for v in touched if online_features.is_ready(v)]
+    }
+
+
+@app.post("/features/preload")
+def preload_features(
+    plant_id: Optional[str] = None,
+    production_date_from: Optional[datetime.date] = None,
+    production_date_to: Optional[datetime.date] = None
+):
+    loaded = feature_cache.preload(plant_id, production_date_from, production_date_to)
+    return {"loaded": loaded, **feature_cache.stats()}
+
+
+@app.post("/predict/batch")
+def predict_batch(vehicles: List[VehicleInput], request: Request, background_tasks: BackgroundTasks):
+
+    if not vehicles:
+        raise HTTPException(status_code=400, detail="Empty batch")
+
+    if len(vehicles) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size exceeds limit of {MAX_BATCH_SIZE}"
+        )
+
+    timer, received_at = _start_timer(request)
+
+    with timer.stage("frame_build"):
+        payloads = [vehicle.model_dump() for vehicle in vehicles]
+
+    # One call per model over the vehicles not already in the prediction cache
+    start = time.perf_counter()
+    with model_holder.lease() as models:
+        timer.record("registry_lookup", time.perf_counter() - start)
+        warranty_version = models.warranty_version
+        anomaly_version = models.anomaly_version
+
+        if prediction_cache.enabled:
+            with timer.stage("cache_lookup"):
+                keys = [
+                    prediction_cache.key(payload, warranty_version, anomaly_version, risk_policy.version)
+                    for payload in payloads
+                ]
+                cached = [prediction_cache.get(key) for key in keys]
+        else:
+            cached = [None] * len(payloads)
+        misses = [i for i, result in enumerate(cached) if result is None]
+
+        if misses:
+            scored_probs, scored_flags = models.score([payloads[i] for i in misses], timer)
+
+    warranty_probs = np.empty(len(payloads))
+    anomaly_flags = np.empty(len(payloads), dtype=int)
+    risks = np.empty(len(payloads), dtype=object)
+    rules = np.empty(len(payloads), dtype=object)
+
+    for i, result in enumerate(cached):
+        if result is not None:
+            warranty_probs[i], anomaly_flags[i], risks[i], rules[i] = result
+
+    if misses:
+        warranty_probs[misses] = scored_probs.astype(float)
+        anomaly_flags[misses] = scored_flags.astype(int)
+
+        with timer.stage("risk"):
+            risks[misses], rules[misses] = risk_policy.evaluate(warranty_probs[misses], anomaly_flags[misses])
+
+        if prediction_cache.enabled:
+            for i in misses:
+                prediction_cache.put(
+                    keys[i], (float(warranty_probs[i]), int(anomaly_flags[i]), risks[i], rules[i])
+                )
+
+    latency = (time.perf_counter() - received_at) * 1000
+    # Amortized per-vehicle latency for the log rows
+    row_latency = latency / len(vehicles)
+
+    with timer.stage("logging"):
+        model_holder.record_payloads(payloads[:WARMUP_SAMPLE_SIZE])
+
+        rows = [
+            {
+                "model_alias": "production",
+                "model_version": warranty_version,
+                "warranty_probability": float(prob),
+                "anomaly_flag": int(flag),
+                "risk_level": risk,
+                "risk_rule": rule,
+                "request_payload": json.dumps(payload),
+                "latency_ms": row_latency,
+                "cache_hit": result is not None
+            }
+            for prob, flag, risk, rule, payload, result
+            in zip(warranty_probs, anomaly_flags, risks, rules, payloads, cached)
+        ]
+
+        log_writer.submit_many(rows)
+
+    PREDICT_STAGE_SECONDS.observe_all(timer.timings, "stage", endpoint="batch")
+
+    if shadow.enabled:
+        background_tasks.add_task(
+            shadow.submit, payloads, warranty_probs, anomaly_flags, risks,
+            (warranty_version, anomaly_version)
+        )
+
+    return {
+        "count": len(rows),
+        "latency_ms": latency,
+        "predictions": [
+            {
+                "warranty_probability": row["warranty_probability"],
+                "anomaly_flag": row["anomaly_flag"],
+                "risk_level": row["risk_level"],
+                "risk_rule": row["risk_rule"]
+            }
+            for row in rows
+        ]
+    }
+
+
+startup.mark("imports")
@@ -0,0 +1,216 @@
+# api/metrics.py
+
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Histograms are observed on the request path (a lock and a bisect per
+observation); gauges are callbacks evaluated only when /metrics is
+scraped, so queue depths and model versions cost nothing per request.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; the hot-path stages sit well below a millisecond
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def observe_all(self, timings, label, **labels):
+        """Observe a {label value: seconds} dict, e.g. StageTimer.timings."""
+        for value, seconds in timings.items():
+            self.observe(seconds, **{label: value}, **labels)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+
+        for key, values in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, values[-2]
+            yield f"{self.name}_count", labels, values[-1]
+
+
+class Gauge:
+    """
+    Value read from ``fn`` at scrape time.
+
+    ``fn`` returns a number, or a list of (labels dict, value) pairs for a
+    labelled gauge.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def samples(self):
+        result = self.fn()
+        if isinstance(result, (int, float)):
+            yield self.name, [], result
+            return
+        for labels, value in result:
+            if value is not None:
+                yield self.name, sorted(labels.items()), value
+
+
+class Counter(Gauge):
+    """Monotonic total read from ``fn`` at scrape time."""
+
+    kind = "counter"
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn):
+        return self.register(Gauge(name, documentation, fn))
+
+    def counter(self, name, documentation, fn):
+        return self.register(Counter(name, documentation, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Wall time per named stage of one request."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware that stamps every HTTP request with the time it
+    reached the app (``request.state.received_at``, perf_counter seconds)
+    and observes the full duration per route into ``histogram``.
+    """
+
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        scope.setdefault("state", {})["received_at"] = start
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Route template, not the raw path, to keep label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                path=path,
+                status=status["code"]
+            )
+
+
+registry = MetricsRegistry()
@@ -1,18 +1,601 @@
-import mlflow.pyfunc
-from mlflow.tracking import MlflowClient
+import gc
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from api.metrics import registry
+from api.shared_models import SharedModelStore, read_source, write_source
+from utils.logger import logger
+
+# mlflow and sklearn are imported where they are first used: neither is
+# needed for the API to start answering /health
 
 WARRANTY_MODEL_URI = "models:/WarrantyModel@production"
 ANOMALY_MODEL_URI = "models:/AnomalyModel@production"
 
+# Seconds a cached version is trusted if the watcher is not refreshing it
+MODEL_VERSION_TTL = float(os.getenv("MODEL_VERSION_TTL", "300"))
+# Seconds between registry polls by the alias watcher
+MODEL_ALIAS_POLL_INTERVAL = float(os.getenv("MODEL_ALIAS_POLL_INTERVAL", "30"))
+# Recent request payloads kept for warming up a newly loaded model
+WARMUP_SAMPLE_SIZE = int(os.getenv("MODEL_WARMUP_SAMPLE_SIZE", "64"))
+# Seconds to wait for in-flight requests on a replaced model before releasing it
+MODEL_DRAIN_TIMEOUT = float(os.getenv("MODEL_DRAIN_TIMEOUT", "30"))
+# Serve from pure-NumPy compiled pipelines when they match the pyfunc models
+FAST_INFERENCE = os.getenv("FAST_INFERENCE", "false").lower() in ("1", "true", "yes")
+# Serve compiled models memory-mapped from SHARED_MODEL_DIR, shared by all worker processes
+SHARED_MODELS = os.getenv("SHARED_MODELS", "false").lower() in ("1", "true", "yes")
+SHARED_MODEL_DIR = os.getenv("SHARED_MODEL_DIR")
+# Local copies of model artifacts, one directory per registered version
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", ".model_cache")
+# "registry": resolve aliases in the registry at startup. "cached": start from the
+# alias -> version resolution saved by the last run; the watcher re-checks it.
+MODEL_STARTUP_MODE = os.getenv("MODEL_STARTUP_MODE", "registry")
+# Seconds between attempts when the first model load fails
+MODEL_LOAD_RETRY_INTERVAL = float(os.getenv("MODEL_LOAD_RETRY_INTERVAL", "10"))
+
+WARRANTY_MODEL_NAME = "WarrantyModel"
+ANOMALY_MODEL_NAME = "AnomalyModel"
+
 def load_models():
+    import mlflow.pyfunc
+
     warranty_model = mlflow.pyfunc.load_model(WARRANTY_MODEL_URI)
     anomaly_model = mlflow.pyfunc.load_model(ANOMALY_MODEL_URI)
     return warranty_model, anomaly_model
 
 
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from mlflow.tracking import MlflowClient
+        _client = MlflowClient()
+    return _client
+
+
+def model_source(model_name, version):
+    """
+    "<run_id>|<artifact source>" of a registered version, or None when the
+    registry cannot be reached. Version numbers restart when a registry is
+    recreated; local copies are checked against this before they are used.
+    """
+    try:
+        model_version = get_client().get_model_version(model_name, str(version))
+    except Exception as e:
+        logger.warning(f"Could not look up the source of {model_name} v{version}: {e}")
+        return None
+    return f"{model_version.run_id}|{model_version.source}"
+
+
+def local_model_path(model_name, version, source=None):
+    """
+    Local directory with the artifacts of a registered model version,
+    downloaded on first use. A copy recorded with a different ``source``
+    (the registry was recreated and reused the version number) is
+    downloaded again; with ``source`` None, e.g. the registry is down, an
+    existing copy is trusted.
+    """
+    path = os.path.abspath(os.path.join(MODEL_CACHE_DIR, model_name, str(version)))
+    if os.path.exists(os.path.join(path, "MLmodel")):
+        if source is None or read_source(path) == source:
+            return path
+        logger.warning(f"Cached {model_name} v{version} is from another run, downloading it again")
+
+    import mlflow.artifacts
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f"{version}.tmp-", dir=os.path.dirname(path))
+    try:
+        mlflow.artifacts.download_artifacts(artifact_uri=f"models:/{model_name}/{version}", dst_path=tmp)
+        write_source(tmp, source)
+        # Another worker may have finished the same download first
+        if not os.path.exists(os.path.join(path, "MLmodel")) or read_source(path) != source:
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+
+def _resolved_aliases_file():
+    return os.path.join(MODEL_CACHE_DIR, "resolved_aliases.json")
+
+
+def read_resolved_aliases():
+    """{"<model>@<alias>": version} saved by the last successful load, or {}."""
+    try:
+        with open(_resolved_aliases_file()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_resolved_aliases(resolved):
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    tmp = f"{_resolved_aliases_file()}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(resolved, f)
+    os.replace(tmp, _resolved_aliases_file())
+
+
+def load_pyfunc(model_name, version, source=None):
+    import mlflow.pyfunc
+    return mlflow.pyfunc.load_model(local_model_path(model_name, version, source))
+
+
+class ModelsNotLoaded(RuntimeError):
+    pass
+
+
+REGISTRY_LOOKUP_SECONDS = registry.histogram(
+    "model_registry_lookup_seconds",
+    "MLflow get_model_version_by_alias round trips",
+    ["model"]
+)
+
+
+class ModelVersionCache:
+    """
+    In-process cache of registry alias -> model version.
 
-client = MlflowClient()
+    The request path only reads the cache. A background watcher polls
+    get_model_version_by_alias for every cached (model, alias) pair and
+    replaces an entry only when the alias has moved; listeners registered
+    with add_listener() are then called as
+    ``callback(model_name, alias, old_version, new_version)``.
+
+    Without a running watcher an entry is re-fetched once it is older
+    than ``ttl`` seconds; with one, requests always get the cached entry.
+
+    watch() adds a pair whose alias does not exist yet (version None), so
+    the watcher notices when it is created: listeners then get an
+    ``old_version`` of None.
+    """
+
+    def __init__(self, ttl=MODEL_VERSION_TTL, poll_interval=MODEL_ALIAS_POLL_INTERVAL):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+        self._entries = {}  # (model_name, alias) -> (version or None, checked_at)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def get(self, model_name, alias="production"):
+        key = (model_name, alias)
+        entry = self._entries.get(key)
+
+        # With the watcher running the entry is its job: never block a request
+        # on the registry, even while its polls fail and the entry ages
+        if entry is not None and entry[0] is not None and (
+            self.watching or time.monotonic() - entry[1] < self.ttl
+        ):
+            return entry[0]
+
+        try:
+            return self.refresh(model_name, alias)
+        except Exception as e:
+            if entry is None or entry[0] is None:
+                raise
+            logger.warning(f"Using stale version for {model_name}@{alias}: {e}")
+            return entry[0]
+
+    def refresh(self, model_name, alias="production"):
+        """Ask the registry for the alias target and update the cache."""
+        key = (model_name, alias)
+        with REGISTRY_LOOKUP_SECONDS.time(model=model_name):
+            version = get_client().get_model_version_by_alias(model_name, alias).version
+
+        with self._lock:
+            old = self._entries.get(key)
+            self._entries[key] = (version, time.monotonic())
+
+        if old is not None and old[0] != version:
+            if old[0] is None:
+                logger.info(f"{model_name}@{alias} created at version {version}")
+            else:
+                logger.info(f"{model_name}@{alias} moved from version {old[0]} to {version}")
+            for callback in list(self._listeners):
+                try:
+                    callback(model_name, alias, old[0], version)
+                except Exception as e:
+                    logger.error(f"Alias listener failed for {model_name}@{alias}: {e}")
+
+        return version
+
+    def prime(self, model_name, alias, version):
+        """Seed an entry without asking the registry (a saved resolution)."""
+        with self._lock:
+            self._entries.setdefault((model_name, alias), (version, time.monotonic()))
+
+    def watch(self, model_name, alias):
+        """Poll a pair whose alias may not exist yet; a no-op if it is cached."""
+        with self._lock:
+            self._entries.setdefault((model_name, alias), (None, time.monotonic()))
+
+    def versions(self):
+        return {key: entry[0] for key, entry in self._entries.items() if entry[0] is not None}
+
+    @property
+    def watching(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def start_watcher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="model-alias-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            for (model_name, alias), entry in list(self._entries.items()):
+                try:
+                    self.refresh(model_name, alias)
+                except Exception as e:
+                    if entry[0] is None:
+                        # A watched alias that has not been created yet
+                        logger.debug(f"{model_name}@{alias} still missing: {e}")
+                        continue
+                    # Keep serving the cached version if the registry is unreachable
+                    logger.warning(f"Alias poll failed for {model_name}@{alias}: {e}")
+
+
+version_cache = ModelVersionCache()
 
 def get_model_version(model_name, alias="production"):
-    mv = client.get_model_version_by_alias(model_name, alias)
-    return mv.version
\ No newline at end of file
+    return version_cache.get(model_name, alias)
+
+
+class _NullTimer:
+    @contextmanager
+    def stage(self, name):
+        yield
+
+
+_NO_TIMER = _NullTimer()
+
+
+class ServingModels:
+    """One warranty/anomaly model pair plus the registry versions it came from."""
+
+    def __init__(
+        self,
+        warranty,
+        anomaly,
+        warranty_version,
+        anomaly_version,
+        warranty_fast=None,
+        anomaly_fast=None
+    ):
+        self.warranty = warranty
+        self.anomaly = anomaly
+        self.warranty_version = warranty_version
+        self.anomaly_version = anomaly_version
+        # Compiled pipelines (ml.compiled_model) or None. With SHARED_MODELS a
+        # model may be compiled only, its pyfunc model then being None.
+        self.warranty_fast = warranty_fast
+        self.anomaly_fast = anomaly_fast
+        self.in_flight = 0
+
+    @property
+    def fast(self):
+        return self.warranty_fast is not None and self.anomaly_fast is not None
+
+    def score(self, payloads, timer=None):
+        """
+        Warranty predictions and anomaly flags for a list of feature dicts.
+
+        ``timer`` (api.metrics.StageTimer), if given, gets the frame_build,
+        warranty_predict and anomaly_predict stages.
+        """
+        timer = timer or _NO_TIMER
+
+        if self.fast:
+            with timer.stage("frame_build"):
+                # Each model in its own column order; built once when they agree
+                X_warranty = self.warranty_fast.to_matrix(payloads)
+                if self.anomaly_fast.input_columns == self.warranty_fast.input_columns:
+                    X_anomaly = X_warranty
+                else:
+                    X_anomaly = self.anomaly_fast.to_matrix(payloads)
+            with timer.stage("warranty_predict"):
+                warranty = self.warranty_fast.predict(X_warranty)
+            with timer.stage("anomaly_predict"):
+                anomaly = self.anomaly_fast.predict(X_anomaly)
+            return warranty, anomaly
+
+        with timer.stage("frame_build"):
+            input_df = pd.DataFrame(payloads)
+        with timer.stage("warranty_predict"):
+            warranty = _predict_frame(self.warranty, self.warranty_fast, input_df)
+        with timer.stage("anomaly_predict"):
+            anomaly = _predict_frame(self.anomaly, self.anomaly_fast, input_df)
+        return warranty, anomaly
+
+
+def _predict_frame(model, fast, input_df):
+    if model is None:
+        return fast.predict(input_df[fast.input_columns].to_numpy(dtype=np.float64))
+    return np.asarray(model.predict(input_df))
+
+
+class ModelHolder:
+    """
+    Serving slot for the production model pair with zero-downtime swaps.
+
+    Requests take a lease() on the current pair and keep using it until
+    they finish. reload_async() loads the alias targets on a background
+    thread, warms them up on recently served payloads, and replaces the
+    pair with a single reference assignment. The old pair is released
+    once its in-flight requests have drained.
+    """
+
+    # Every holder in the process, so shared-store pruning keeps all of their versions
+    instances = []
+
+    def __init__(self, alias="production", fallback_alias=None):
+        self.alias = alias
+        # Alias to use for a model that has no ``alias`` version in the registry
+        self.fallback_alias = fallback_alias
+        self.shared_store = SharedModelStore(SHARED_MODEL_DIR) if SHARED_MODELS else None
+        self._models = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        # Set by every reload request; a running reload goes round again while it is set
+        self._reload_pending = False
+        self._recent_payloads = deque(maxlen=WARMUP_SAMPLE_SIZE)
+        ModelHolder.instances.append(self)
+
+    def current(self):
+        return self._models
+
+    @property
+    def ready(self):
+        return self._models is not None
+
+    @contextmanager
+    def lease(self):
+        # Read and count under the lock _swap() takes, so a drain never misses a lease
+        with self._lock:
+            models = self._models
+            if models is None:
+                raise ModelsNotLoaded("Models are still loading")
+            models.in_flight += 1
+        try:
+            yield models
+        finally:
+            with self._lock:
+                models.in_flight -= 1
+
+    def record_payloads(self, payloads):
+        self._recent_payloads.extend(payloads)
+
+    def load(self, use_saved=False):
+        """
+        Load the alias targets synchronously and install them. With
+        ``use_saved`` the versions come from the resolution saved by the
+        last load instead of the registry, where one exists.
+        """
+        with self._reload_lock:
+            self._swap(self._load_pair(use_saved))
+
+    def load_async(self, use_saved=False, on_loaded=None, retry_interval=MODEL_LOAD_RETRY_INTERVAL):
+        """load() on a background thread, retried until it succeeds."""
+
+        def run():
+            while True:
+                try:
+                    self.load(use_saved)
+                    break
+                except Exception as e:
+                    logger.error(
+                        f"Model load ({self.alias}) failed, retrying in {retry_interval:.0f}s: {e}"
+                    )
+                    time.sleep(retry_interval)
+            if on_loaded is not None:
+                on_loaded()
+
+        thread = threading.Thread(target=run, name="model-load", daemon=True)
+        thread.start()
+        return thread
+
+    def reload_async(self):
+        self._reload_pending = True
+        thread = threading.Thread(target=self._reload, name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def _reload(self):
+        while self._reload_pending:
+            # A reload in progress checks the flag again once it is done
+            if not self._reload_lock.acquire(blocking=False):
+                return
+            try:
+                # Cleared before resolving: an alias move after this point sets it again
+                self._reload_pending = False
+                new = self._load_pair()
+                self._warm_up(new)
+                self._swap(new)
+            except Exception as e:
+                logger.error(f"Model reload failed, keeping current models: {e}")
+            finally:
+                self._reload_lock.release()
+
+    def _resolve(self, model_name, saved):
+        version = saved.get(f"{model_name}@{self.alias}")
+        if version is not None:
+            version_cache.prime(model_name, self.alias, version)
+            return version
+        try:
+            return version_cache.refresh(model_name, self.alias)
+        except Exception as e:
+            if self.fallback_alias is None:
+                raise
+            logger.info(f"No {model_name}@{self.alias} ({e}), using @{self.fallback_alias}")
+            # Keep polling the alias: its creation reaches on_alias_change and reloads
+            version_cache.watch(model_name, self.alias)
+            return version_cache.get(model_name, self.fallback_alias)
+
+    def _load_pair(self, use_saved=False):
+        saved = read_resolved_aliases() if use_saved else {}
+        warranty_version = self._resolve(WARRANTY_MODEL_NAME, saved)
+        anomaly_version = self._resolve(ANOMALY_MODEL_NAME, saved)
+
+        old = self._models
+
+        # Only load what changed; an unchanged model is shared with the old pair
+        if old is not None and old.warranty_version == warranty_version:
+            warranty, warranty_fast = old.warranty, old.warranty_fast
+        else:
+            warranty, warranty_fast = self._load_model(WARRANTY_MODEL_NAME, warranty_version)
+
+        if old is not None and old.anomaly_version == anomaly_version:
+            anomaly, anomaly_fast = old.anomaly, old.anomaly_fast
+        else:
+            anomaly, anomaly_fast = self._load_model(ANOMALY_MODEL_NAME, anomaly_version)
+
+        if self.shared_store is not None:
+            # Keep the version being replaced for workers that have not swapped yet,
+            # and whatever the other holders (e.g. a shadow challenger) serve
+            serving = [h.current() for h in ModelHolder.instances if h.current() is not None]
+            self.shared_store.prune(
+                WARRANTY_MODEL_NAME, {warranty_version} | {m.warranty_version for m in serving}
+            )
+            self.shared_store.prune(
+                ANOMALY_MODEL_NAME, {anomaly_version} | {m.anomaly_version for m in serving}
+            )
+
+        # A fallback version is not the alias target: nothing to save for cached startup
+        if self.fallback_alias is None:
+            resolved = read_resolved_aliases()
+            resolved[f"{WARRANTY_MODEL_NAME}@{self.alias}"] = warranty_version
+            resolved[f"{ANOMALY_MODEL_NAME}@{self.alias}"] = anomaly_version
+            try:
+                save_resolved_aliases(resolved)
+            except OSError as e:
+                logger.warning(f"Could not save resolved model versions: {e}")
+
+        return ServingModels(
+            warranty, anomaly, warranty_version, anomaly_version, warranty_fast, anomaly_fast
+        )
+
+    def _load_model(self, model_name, version):
+        """(pyfunc model or None, compiled model or None) for one registry version."""
+        source = model_source(model_name, version)
+
+        if self.shared_store is not None:
+            loaded = {}
+
+            def build():
+                loaded["model"] = load_pyfunc(model_name, version, source)
+                return self._compile(model_name, loaded["model"])
+
+            try:
+                compiled = self.shared_store.get(model_name, version, build, source)
+            except Exception as e:
+                logger.error(f"{model_name} v{version}: shared model unavailable ({e})")
+                compiled = None
+
+            # Mapped arrays only; this worker never unpickles the model
+            if compiled is not None:
+                return None, compiled
+
+            logger.warning(f"{model_name} v{version}: not shareable, loading pyfunc in this worker")
+            model = loaded.get("model") or load_pyfunc(model_name, version, source)
+            return model, None
+
+        model = load_pyfunc(model_name, version, source)
+        return model, self._compile(model_name, model) if FAST_INFERENCE else None
+
+    def _compile(self, model_name, model):
+        from ml.compiled_model import compile_pipeline, check_parity
+
+        try:
+            compiled = compile_pipeline(model.get_raw_model())
+        except Exception as e:
+            logger.warning(f"{model_name}: no compiled fast path ({e})")
+            return None
+
+        # Only serve the compiled model once it agrees with the pyfunc model
+        if self._recent_payloads:
+            sample = pd.DataFrame(list(self._recent_payloads))
+        else:
+            sample = model.input_example
+
+        if sample is None or len(sample) == 0:
+            logger.warning(f"{model_name}: no sample to verify compiled model, using pyfunc")
+            return None
+
+        mismatches = check_parity(compiled, model, sample)
+        if mismatches:
+            logger.warning(f"{model_name}: compiled model differs on {mismatches} rows, using pyfunc")
+            return None
+
+        logger.info(f"{model_name}: compiled fast path enabled")
+        return compiled
+
+    def _warm_up(self, models):
+        payloads = list(self._recent_payloads)
+        if not payloads:
+            logger.warning("No recent payloads to warm up new models with")
+            return
+
+        start = time.time()
+        models.score(payloads)
+        logger.info(f"Warmed up models on {len(payloads)} payloads in {(time.time() - start) * 1000:.1f} ms")
+
+    def _swap(self, new):
+        with self._lock:
+            old = self._models
+            self._models = new
+
+        logger.info(
+            f"Serving ({self.alias}) {WARRANTY_MODEL_NAME} v{new.warranty_version}, "
+            f"{ANOMALY_MODEL_NAME} v{new.anomaly_version}"
+        )
+
+        if old is None:
+            return
+
+        deadline = time.monotonic() + MODEL_DRAIN_TIMEOUT
+        while old.in_flight > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        if old.in_flight > 0:
+            logger.warning(f"Releasing old models with {old.in_flight} requests still in flight")
+
+        # Drop our reference so the replaced models can be collected
+        del old
+        gc.collect()
+
+    def on_alias_change(self, model_name, alias, old_version, new_version):
+        # A model served from the fallback alias follows that alias too
+        if alias in (self.alias, self.fallback_alias) and model_name in (WARRANTY_MODEL_NAME, ANOMALY_MODEL_NAME):
+            self.reload_async()
+
+
+model_holder = ModelHolder()
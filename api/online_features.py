@@ -0,0 +1,309 @@
+# api/online_features.py
+
+import datetime
+import math
+import threading
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import bindparam, text
+
+from database.models import StationOperation, VendorComponent
+from ml.running_stats import RunningStats
+from utils.logger import logger
+
+# Existing history of vehicles seen for the first time, aggregated like
+# feature_pipeline/build_features.py (VARIANCE / STDDEV are population)
+SEED_OPERATIONS = text("""
+    SELECT
+        vehicle_id,
+        COUNT(*) AS n_ops,
+        SUM(error_count) AS error_sum,
+        COUNT(error_count) AS error_n,
+        AVG(cycle_time) AS cycle_mean,
+        VARIANCE(cycle_time) AS cycle_var,
+        COUNT(cycle_time) AS cycle_n,
+        SUM(rework_flag) AS rework_sum,
+        COUNT(rework_flag) AS rework_n,
+        AVG(torque_value) AS torque_mean,
+        VARIANCE(torque_value) AS torque_var,
+        COUNT(torque_value) AS torque_n
+    FROM station_operations
+    WHERE vehicle_id IN :vehicle_ids
+    GROUP BY vehicle_id
+""").bindparams(bindparam("vehicle_ids", expanding=True))
+
+SEED_COMPONENTS = text("""
+    SELECT
+        vehicle_id,
+        SUM(defect_flag) AS defect_sum,
+        COUNT(defect_flag) AS defect_n
+    FROM vendor_components
+    WHERE vehicle_id IN :vehicle_ids
+    GROUP BY vehicle_id
+""").bindparams(bindparam("vehicle_ids", expanding=True))
+
+# Vehicle ids per seeding query
+SEED_CHUNK_SIZE = 1000
+
+
+def _seeded_stats(count, mean, variance):
+    # MySQL returns Decimal for AVG / VARIANCE
+    if not count:
+        return RunningStats()
+    return RunningStats(int(count), float(mean), float(variance) * int(count))
+
+
+class VehicleAggregate:
+    """Running per-vehicle sums behind the seven model features."""
+
+    def __init__(self):
+        self.n_ops = 0
+        self.error_sum = 0
+        self.error_n = 0
+        self.cycle = RunningStats()
+        self.rework_sum = 0
+        self.rework_n = 0
+        self.torque = RunningStats()
+        self.defect_sum = 0
+        self.defect_n = 0
+
+    def seed_operations(self, row):
+        self.n_ops = int(row.n_ops)
+        self.error_sum = int(row.error_sum or 0)
+        self.error_n = int(row.error_n)
+        self.cycle = _seeded_stats(row.cycle_n, row.cycle_mean, row.cycle_var)
+        self.rework_sum = int(row.rework_sum or 0)
+        self.rework_n = int(row.rework_n)
+        self.torque = _seeded_stats(row.torque_n, row.torque_mean, row.torque_var)
+
+    def seed_components(self, row):
+        self.defect_sum = int(row.defect_sum or 0)
+        self.defect_n = int(row.defect_n)
+
+    def add_operations(self, events):
+        # NULLs are skipped, as SQL aggregates do
+        self.n_ops += len(events)
+
+        errors = [e["error_count"] for e in events if e["error_count"] is not None]
+        self.error_sum += sum(errors)
+        self.error_n += len(errors)
+
+        reworks = [e["rework_flag"] for e in events if e["rework_flag"] is not None]
+        self.rework_sum += sum(reworks)
+        self.rework_n += len(reworks)
+
+        self.cycle.update([e["cycle_time"] for e in events if e["cycle_time"] is not None])
+        self.torque.update([e["torque_value"] for e in events if e["torque_value"] is not None])
+
+    def add_components(self, events):
+        defects = [e["defect_flag"] for e in events if e["defect_flag"] is not None]
+        self.defect_sum += sum(defects)
+        self.defect_n += len(defects)
+
+    def features(self):
+        def ratio(total, n):
+            return total / n if n else None
+
+        return {
+            "total_error_count": self.error_sum if self.error_n else None,
+            "avg_cycle_time": float(self.cycle.mean) if self.cycle.count else None,
+            "cycle_time_variance": ratio(self.cycle.m2, self.cycle.count),
+            "rework_ratio": ratio(self.rework_sum, self.rework_n),
+            "vendor_defect_ratio": ratio(self.defect_sum, self.defect_n),
+            "avg_torque": float(self.torque.mean) if self.torque.count else None,
+            "torque_deviation": (
+                math.sqrt(self.torque.m2 / self.torque.count) if self.torque.count else None
+            )
+        }
+
+
+class OnlineFeatureStore:
+    """
+    Per-vehicle feature aggregates updated as events are ingested.
+
+    ingest() bulk-inserts station operations and vendor components and
+    folds them into in-memory VehicleAggregates, so a vehicle can be scored
+    as soon as its last station reports instead of after the next
+    build_features() run. A vehicle seen for the first time is seeded from
+    its rows already in the database. get() returns the features once the
+    vehicle has ``expected_stations`` operations and at least one component.
+
+    Aggregates are per process and only see events ingested through this
+    store, so it is meant for a single API worker: with several, a worker
+    does not see the events other workers ingested. Least recently touched
+    vehicles are dropped past ``max_vehicles`` and re-seeded from the
+    database when they come back.
+    """
+
+    def __init__(self, engine, max_vehicles=100000, expected_stations=25):
+        self.engine = engine
+        self.max_vehicles = max_vehicles
+        self.expected_stations = expected_stations
+
+        self._vehicles = OrderedDict()
+        # Guards the in-memory state only; the database is read and written outside it
+        self._lock = threading.Lock()
+        # vehicle_id -> Event set once the ingest seeding it has merged
+        self._seeding = {}
+        # vehicle_id -> ingests between claim and merge; not evicted meanwhile
+        self._in_flight = defaultdict(int)
+
+        self.operations_ingested = 0
+        self.components_ingested = 0
+        self.evictions = 0
+
+    def ingest(self, operations=(), components=()):
+        """
+        Write a batch of events and update the aggregates.
+
+        ``operations`` / ``components`` are lists of dicts with the
+        station_operations / vendor_components columns. Returns the ids of
+        the touched vehicles.
+        """
+        operations = list(operations)
+        components = list(components)
+
+        now = datetime.datetime.now()
+        for event in operations:
+            event.setdefault("operation_timestamp", now)
+
+        by_vehicle_ops = defaultdict(list)
+        for event in operations:
+            by_vehicle_ops[event["vehicle_id"]].append(event)
+
+        by_vehicle_components = defaultdict(list)
+        for event in components:
+            by_vehicle_components[event["vehicle_id"]].append(event)
+
+        touched = list(dict.fromkeys(list(by_vehicle_ops) + list(by_vehicle_components)))
+        if not touched:
+            return []
+
+        claimed = self._claim(touched)
+        try:
+            # Seed before the insert, so the new rows are not read back
+            seeded = self._seed(claimed)
+
+            with self.engine.begin() as conn:
+                if operations:
+                    conn.execute(StationOperation.__table__.insert(), operations)
+                if components:
+                    conn.execute(VendorComponent.__table__.insert(), components)
+        except Exception:
+            with self._lock:
+                self._release(touched, claimed)
+            raise
+
+        with self._lock:
+            self._vehicles.update(seeded)
+
+            for vehicle_id in touched:
+                aggregate = self._vehicles.get(vehicle_id)
+                if aggregate is None:
+                    # Invalidated meanwhile; re-seeded with these rows next time
+                    continue
+                if vehicle_id in by_vehicle_ops:
+                    aggregate.add_operations(by_vehicle_ops[vehicle_id])
+                if vehicle_id in by_vehicle_components:
+                    aggregate.add_components(by_vehicle_components[vehicle_id])
+                self._vehicles.move_to_end(vehicle_id)
+
+            self._release(touched, claimed)
+            self._evict()
+
+            self.operations_ingested += len(operations)
+            self.components_ingested += len(components)
+
+        return touched
+
+    def get(self, vehicle_id):
+        """Features for a vehicle, or None if it is unknown or not complete yet."""
+        with self._lock:
+            aggregate = self._vehicles.get(vehicle_id)
+            if aggregate is None or not self._ready(aggregate):
+                return None
+            return aggregate.features()
+
+    def is_ready(self, vehicle_id):
+        with self._lock:
+            aggregate = self._vehicles.get(vehicle_id)
+            return aggregate is not None and self._ready(aggregate)
+
+    def invalidate(self, vehicle_ids=None):
+        with self._lock:
+            if vehicle_ids is None:
+                self._vehicles.clear()
+            else:
+                for vehicle_id in vehicle_ids:
+                    self._vehicles.pop(vehicle_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "vehicles": len(self._vehicles),
+                "operations_ingested": self.operations_ingested,
+                "components_ingested": self.components_ingested,
+                "evictions": self.evictions
+            }
+
+    def _ready(self, aggregate):
+        return aggregate.n_ops >= self.expected_stations and aggregate.defect_n > 0
+
+    def _claim(self, vehicle_ids):
+        """
+        Mark ``vehicle_ids`` in flight and claim the unknown ones for seeding.
+        Waits while another ingest is seeding any of them, since its seed
+        query must not see this batch's rows.
+        """
+        while True:
+            with self._lock:
+                waiting = [self._seeding[v] for v in vehicle_ids if v in self._seeding]
+                if not waiting:
+                    claimed = [v for v in vehicle_ids if v not in self._vehicles]
+                    for vehicle_id in claimed:
+                        self._seeding[vehicle_id] = threading.Event()
+                    for vehicle_id in vehicle_ids:
+                        self._in_flight[vehicle_id] += 1
+                    return claimed
+
+            for event in waiting:
+                event.wait()
+
+    def _release(self, vehicle_ids, claimed):
+        # Called with self._lock held
+        for vehicle_id in vehicle_ids:
+            self._in_flight[vehicle_id] -= 1
+            if not self._in_flight[vehicle_id]:
+                del self._in_flight[vehicle_id]
+        for vehicle_id in claimed:
+            self._seeding.pop(vehicle_id).set()
+
+    def _evict(self):
+        # Called with self._lock held; vehicles with an ingest in flight are
+        # kept, so they cannot be re-seeded with rows that ingest will add again
+        for _ in range(len(self._vehicles)):
+            if len(self._vehicles) <= self.max_vehicles:
+                break
+            vehicle_id = next(iter(self._vehicles))
+            if vehicle_id in self._in_flight:
+                self._vehicles.move_to_end(vehicle_id)
+                continue
+            del self._vehicles[vehicle_id]
+            self.evictions += 1
+
+    def _seed(self, vehicle_ids):
+        """New VehicleAggregates for ``vehicle_ids`` from their rows in the database."""
+        aggregates = {vehicle_id: VehicleAggregate() for vehicle_id in vehicle_ids}
+        if not vehicle_ids:
+            return aggregates
+
+        with self.engine.connect() as conn:
+            for i in range(0, len(vehicle_ids), SEED_CHUNK_SIZE):
+                params = {"vehicle_ids": vehicle_ids[i:i + SEED_CHUNK_SIZE]}
+                for row in conn.execute(SEED_OPERATIONS, params):
+                    aggregates[row.vehicle_id].seed_operations(row)
+                for row in conn.execute(SEED_COMPONENTS, params):
+                    aggregates[row.vehicle_id].seed_components(row)
+
+        logger.debug(f"Seeded online aggregates for {len(vehicle_ids)} vehicles")
+        return aggregates
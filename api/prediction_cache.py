@@ -0,0 +1,89 @@
+# api/prediction_cache.py
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of prediction results with a per-entry TTL.
+
+    Keys hash the canonical JSON of a feature payload together with the
+    warranty and anomaly model versions and the risk rules version, so a
+    result is only reused for the exact inputs, model pair and rules that
+    produced it. ``max_size`` 0
+    disables the cache.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (result, stored_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clears = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @staticmethod
+    def key(payload, warranty_version, anomaly_version, risk_version, context=None):
+        # Sorted keys, and floats so 3 and 3.0 hash the same
+        canonical = json.dumps(
+            {k: float(v) for k, v in payload.items()}, sort_keys=True, separators=(",", ":")
+        )
+        raw = f"{warranty_version}|{anomaly_version}|{risk_version}|{canonical}"
+        if context:
+            # The risk rule, and so the cached result, depends on the context
+            raw += "|" + json.dumps(context, sort_keys=True, separators=(",", ":"))
+        return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.clears += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "clears": self.clears
+            }
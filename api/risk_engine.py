@@ -1,10 +1,176 @@
-def calculate_risk(probability, anomaly_flag):
+# api/risk_engine.py
+
+"""
+Table-driven risk policy.
+
+Rules come from a versioned JSON file (RISK_RULES_PATH, default
+api/risk_rules.json):
+
+    {
+      "version": 2,
+      "rules": [
+        {"id": "default", "high": 0.7, "medium": 0.4, "anomaly": "HIGH"},
+        {"id": "plant_b_suv", "match": {"plant_id": "Plant_B", "model_type": "SUV"},
+         "high": 0.6, "medium": 0.35, "anomaly": "HIGH"}
+      ]
+    }
+
+A probability above ``high`` is HIGH, above ``medium`` MEDIUM, otherwise
+LOW; an anomaly (flag -1) raises the level to at least ``anomaly``
+(null: anomalies do not change the level). A rule's optional ``match``
+keys it by plant_id, model_type and/or shift; each row uses the most
+specific matching rule, and exactly one rule must have no ``match``.
+
+RiskPolicy.evaluate() classifies whole arrays at once and returns the
+risk levels and the id (``<rule id>@v<version>``) of the rule used;
+classify() returns the same as integer codes, which is what bulk and
+offline scoring should use (no per-row Python objects). Context columns
+are arrays, or pandas categoricals for the fastest matching.
+
+In the API only /predict/vehicle/{id} has a context (looked up from the
+vehicles table); /predict and /predict/batch take features alone and are
+classified with the rule without ``match``.
+"""
+
+import json
+import os
+
+import numpy as np
+
+RISK_RULES_PATH = os.getenv(
+    "RISK_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_rules.json")
+)
+
+CONTEXT_KEYS = ("plant_id", "model_type", "shift")
+LEVELS = np.array(["LOW", "MEDIUM", "HIGH"], dtype=object)
+_LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+
+
+def _matches(column, value):
+    # pandas categoricals (Series or Categorical) compare on their integer codes
+    column = getattr(column, "cat", column)
+    categories = getattr(column, "categories", None)
+    if categories is not None:
+        codes = np.asarray(column.codes)
+        if value not in categories:
+            return np.zeros(len(codes), dtype=bool)
+        return codes == categories.get_loc(value)
+    return np.asarray(column) == value
+
+
+class RiskPolicy:
+
+    def __init__(self, rules, version):
+        self.version = version
+        self.rules = list(rules)
+
+        fallback = [i for i, rule in enumerate(self.rules) if not rule.get("match")]
+        if len(fallback) != 1:
+            raise ValueError(f"Risk rules v{version}: need exactly one rule without 'match', found {len(fallback)}")
+        self.fallback = fallback[0]
+
+        for rule in self.rules:
+            unknown = set(rule.get("match") or {}) - set(CONTEXT_KEYS)
+            if unknown:
+                raise ValueError(f"Risk rule {rule['id']}: unknown match keys {sorted(unknown)}")
+            if not rule["medium"] <= rule["high"]:
+                raise ValueError(f"Risk rule {rule['id']}: medium threshold above high")
+
+        self.ids = np.array([f"{rule['id']}@v{version}" for rule in self.rules], dtype=object)
+        self.high = np.array([rule["high"] for rule in self.rules], dtype=float)
+        self.medium = np.array([rule["medium"] for rule in self.rules], dtype=float)
+        # -1: anomalies leave the level unchanged
+        self.anomaly = np.array(
+            [_LEVEL_CODES[rule["anomaly"]] if rule.get("anomaly") else -1 for rule in self.rules]
+        )
 
-    if probability > 0.7 or anomaly_flag == -1:
-        return "HIGH"
+        # Most specific first, file order among equals
+        self._keyed = sorted(
+            (i for i in range(len(self.rules)) if i != self.fallback),
+            key=lambda i: -len(self.rules[i]["match"])
+        )
+
+    @property
+    def keyed(self):
+        """Whether any rule depends on the plant_id / model_type / shift context."""
+        return bool(self._keyed)
+
+    @classmethod
+    def load(cls, path=RISK_RULES_PATH):
+        with open(path) as f:
+            table = json.load(f)
+        return cls(table["rules"], table["version"])
+
+    def select(self, n, context=None):
+        """
+        Index of the rule used for each of ``n`` rows with the given
+        context columns; a plain int when every row uses the fallback rule.
+        """
+        context = {k: v for k, v in (context or {}).items() if v is not None}
+        if not context or not self._keyed:
+            return self.fallback
+
+        index = np.full(n, self.fallback)
+        assigned = np.zeros(n, dtype=bool)
+        for i in self._keyed:
+            mask = ~assigned
+            for key, value in self.rules[i]["match"].items():
+                if key not in context:
+                    mask = None
+                    break
+                mask &= _matches(context[key], value)
+            if mask is not None:
+                index[mask] = i
+                assigned |= mask
+
+        return index
+
+    def classify(self, probabilities, anomaly_flags, plant_id=None, model_type=None, shift=None):
+        """
+        (level codes, rule indices) for arrays of probabilities and anomaly
+        flags: codes index LEVELS, rule indices index ``ids``.
+        """
+        probabilities = np.asarray(probabilities, dtype=float)
+        anomalous = np.asarray(anomaly_flags) == -1
+
+        # An int when one rule covers every row: scalar thresholds, no gathers
+        index = self.select(
+            len(probabilities), {"plant_id": plant_id, "model_type": model_type, "shift": shift}
+        )
+
+        level = (probabilities > self.medium[index]).astype(np.int8)
+        level += probabilities > self.high[index]
+        np.maximum(level, np.where(anomalous, self.anomaly[index], -1), out=level, casting="unsafe")
+
+        return level, np.broadcast_to(index, level.shape)
+
+    def evaluate(self, probabilities, anomaly_flags, plant_id=None, model_type=None, shift=None):
+        """(risk levels, rule ids) for arrays of probabilities and anomaly flags."""
+        level, index = self.classify(probabilities, anomaly_flags, plant_id, model_type, shift)
+        return LEVELS[level], self.ids[index]
+
+    def evaluate_one(self, probability, anomaly_flag, plant_id=None, model_type=None, shift=None):
+        """evaluate() for a single prediction, without array overhead."""
+        index = self.fallback
+        context = {"plant_id": plant_id, "model_type": model_type, "shift": shift}
+        for i in self._keyed:
+            if all(context[key] == value for key, value in self.rules[i]["match"].items()):
+                index = i
+                break
+
+        level = int(probability > self.medium[index]) + int(probability > self.high[index])
+        if anomaly_flag == -1:
+            level = max(level, self.anomaly[index])
+
+        return LEVELS[level], self.ids[index]
+
+
+risk_policy = RiskPolicy.load()
+
+
+def calculate_risk(probability, anomaly_flag):
+    return risk_policy.evaluate_one(probability, anomaly_flag)[0]
 
-    elif probability > 0.4:
-        return "MEDIUM"
 
-    else:
-        return "LOW"
\ No newline at end of file
+def calculate_risk_batch(probabilities, anomaly_flags):
+    return risk_policy.evaluate(probabilities, anomaly_flags)[0]
@@ -0,0 +1,183 @@
+# api/shadow.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.logger import logger
+
+
+class ShadowStats:
+    """Running agreement between one production pair and one challenger pair."""
+
+    def __init__(self):
+        self.scored = 0
+        self.risk_disagreements = 0
+        self.anomaly_disagreements = 0
+        self.disagreements = 0
+        # challenger - production warranty probability
+        self.diff_sum = 0.0
+        self.abs_diff_sum = 0.0
+        self.diff_sum_sq = 0.0
+        self.max_abs_diff = 0.0
+
+    def update(self, diff, risk_differs, anomaly_differs):
+        self.scored += len(diff)
+        self.risk_disagreements += int(risk_differs.sum())
+        self.anomaly_disagreements += int(anomaly_differs.sum())
+        self.disagreements += int((risk_differs | anomaly_differs).sum())
+        self.diff_sum += float(diff.sum())
+        self.abs_diff_sum += float(np.abs(diff).sum())
+        self.diff_sum_sq += float(np.dot(diff, diff))
+        self.max_abs_diff = max(self.max_abs_diff, float(np.abs(diff).max()))
+
+    def summary(self):
+        n = max(self.scored, 1)
+        return {
+            "scored": self.scored,
+            "disagreement_rate": self.disagreements / n,
+            "risk_disagreement_rate": self.risk_disagreements / n,
+            "anomaly_disagreement_rate": self.anomaly_disagreements / n,
+            "mean_probability_diff": self.diff_sum / n,
+            "mean_abs_probability_diff": self.abs_diff_sum / n,
+            "rms_probability_diff": (self.diff_sum_sq / n) ** 0.5,
+            "max_abs_probability_diff": self.max_abs_diff
+        }
+
+
+class ShadowScorer:
+    """
+    Scores a random ``fraction`` of live requests with a second model pair
+    (``holder``, usually the ``challenger`` alias) and compares it with what
+    production returned.
+
+    submit() is meant to run after the response has been sent: it only
+    samples rows and hands them to a small thread pool, and drops them when
+    ``max_pending`` batches are already waiting, so a slow challenger never
+    backs up into the request path. Agreement is kept per (production,
+    challenger) version pair; compared rows go to ``writer`` (a
+    BufferedLogWriter) for bulk insertion.
+    """
+
+    def __init__(self, holder, policy, fraction=0.0, workers=2, max_pending=100, writer=None):
+        self.holder = holder
+        self.policy = policy
+        self.fraction = fraction
+        self.max_pending = max_pending
+        self.writer = writer
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shadow")
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+        self._stats = {}  # (production versions, challenger versions) -> ShadowStats
+
+        self.pending = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def enabled(self):
+        return self.fraction > 0
+
+    def submit(self, payloads, warranty_probs, anomaly_flags, risks, production_versions, context=None):
+        """
+        Queue a sample of one request's rows for shadow scoring. ``context``
+        is the risk rule context production was classified with.
+        """
+        if not self.enabled or not self.holder.ready:
+            return
+
+        with self._lock:
+            keep = np.flatnonzero(self._rng.random(len(payloads)) < self.fraction)
+            if len(keep) == 0:
+                return
+            if self.pending >= self.max_pending:
+                self.dropped += len(keep)
+                return
+            self.pending += 1
+
+        self._pool.submit(
+            self._score,
+            [payloads[i] for i in keep],
+            np.asarray(warranty_probs, dtype=float)[keep],
+            np.asarray(anomaly_flags, dtype=int)[keep],
+            np.asarray(risks, dtype=object)[keep],
+            production_versions,
+            context or {}
+        )
+
+    def _score(self, payloads, warranty_probs, anomaly_flags, risks, production_versions, context):
+        try:
+            with self.holder.lease() as challenger:
+                challenger_versions = (challenger.warranty_version, challenger.anomaly_version)
+                # Nothing to learn from scoring production against itself
+                if challenger_versions == production_versions:
+                    return
+                challenger_probs, challenger_flags = challenger.score(payloads)
+
+            challenger_probs = np.asarray(challenger_probs, dtype=float)
+            challenger_flags = np.asarray(challenger_flags, dtype=int)
+            challenger_risks, _ = self.policy.evaluate(challenger_probs, challenger_flags, **context)
+
+            diff = challenger_probs - warranty_probs
+            risk_differs = challenger_risks != risks
+            anomaly_differs = challenger_flags != anomaly_flags
+
+            key = (production_versions, challenger_versions)
+            with self._lock:
+                self._stats.setdefault(key, ShadowStats()).update(diff, risk_differs, anomaly_differs)
+
+            if self.writer is not None:
+                self.writer.submit_many(
+                    {
+                        "production_version": production_versions[0],
+                        "challenger_version": challenger_versions[0],
+                        "production_anomaly_version": production_versions[1],
+                        "challenger_anomaly_version": challenger_versions[1],
+                        "warranty_probability": float(prob),
+                        "challenger_probability": float(challenger_prob),
+                        "anomaly_flag": int(flag),
+                        "challenger_anomaly_flag": int(challenger_flag),
+                        "risk_level": risk,
+                        "challenger_risk_level": challenger_risk
+                    }
+                    for prob, challenger_prob, flag, challenger_flag, risk, challenger_risk in zip(
+                        warranty_probs, challenger_probs, anomaly_flags, challenger_flags,
+                        risks, challenger_risks
+                    )
+                )
+        except Exception as e:
+            logger.error(f"Shadow scoring failed: {e}")
+            with self._lock:
+                self.failed += len(payloads)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self):
+        challenger = self.holder.current()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "fraction": self.fraction,
+                "alias": self.holder.alias,
+                "challenger_version": challenger.warranty_version if challenger else None,
+                "challenger_anomaly_version": challenger.anomaly_version if challenger else None,
+                "pending": self.pending,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "pairs": [
+                    {
+                        "production_version": production[0],
+                        "production_anomaly_version": production[1],
+                        "challenger_version": challenger_versions[0],
+                        "challenger_anomaly_version": challenger_versions[1],
+                        **stats.summary()
+                    }
+                    for (production, challenger_versions), stats in self._stats.items()
+                ]
+            }
+
+    def stop(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
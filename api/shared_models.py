@@ -0,0 +1,120 @@
+# api/shared_models.py
+
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from ml.compiled_model import CompiledPipeline
+from utils.logger import logger
+
+# Registry source a local model copy was made from (api.model_loader.model_source)
+SOURCE_FILE = "source.txt"
+
+
+def read_source(path):
+    """Source recorded in a local model copy, or None."""
+    try:
+        with open(os.path.join(path, SOURCE_FILE)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_source(path, source):
+    if source is not None:
+        with open(os.path.join(path, SOURCE_FILE), "w") as f:
+            f.write(source)
+
+
+def _default_root():
+    # tmpfs when available: the mapped pages never touch the disk
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "manufacturing-models")
+
+
+class SharedModelStore:
+    """
+    Compiled models (ml.compiled_model) saved once per registry version
+    and memory-mapped read-only by every API worker process.
+
+    The first worker to ask for a version builds and saves it under an
+    exclusive file lock; the others wait on the lock, then map the same
+    files, so memory grows with model versions rather than with workers
+    and no worker after the first unpickles anything.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or _default_root()
+
+    def path(self, model_name, version):
+        return os.path.join(self.root, f"{model_name}-v{version}")
+
+    def get(self, model_name, version, build, source=None):
+        """
+        Mapped CompiledPipeline for ``model_name`` ``version``.
+
+        ``build()`` is called, at most once across processes, when no
+        saved copy exists; it returns a CompiledPipeline, or None when
+        the model cannot be compiled (nothing is saved and None returned).
+        ``source`` (api.model_loader.model_source) is saved with the copy;
+        a copy saved from another source, i.e. a registry that reused the
+        version number, is rebuilt. With ``source`` None any copy is used.
+        """
+        path = self.path(model_name, version)
+        if self._usable(path, source):
+            return CompiledPipeline.load(path)
+
+        with self._lock(model_name, version):
+            # Another worker may have saved it while we waited for the lock
+            if not self._usable(path, source):
+                compiled = build()
+                if compiled is None:
+                    return None
+                self._save(compiled, path, source)
+                logger.info(f"Saved shared {model_name} v{version} to {path}")
+
+        return CompiledPipeline.load(path)
+
+    def prune(self, model_name, keep_versions):
+        """Delete saved versions of ``model_name`` not in ``keep_versions``."""
+        # Workers still mapping a deleted version keep their pages until they unmap
+        keep = {os.path.basename(self.path(model_name, v)) for v in keep_versions}
+        prefix = f"{model_name}-v"
+
+        for name in os.listdir(self.root):
+            # Saved versions only: not lock files or another worker's in-progress save
+            if name.startswith(prefix) and name[len(prefix):].isdigit() and name not in keep:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def _complete(self, path):
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    def _usable(self, path, source):
+        if not self._complete(path):
+            return False
+        return source is None or read_source(path) == source
+
+    def _save(self, compiled, path, source=None):
+        # Save next to the target and rename, so readers never see a partial directory
+        tmp = tempfile.mkdtemp(prefix=os.path.basename(path) + ".tmp-", dir=self.root)
+        try:
+            os.chmod(tmp, 0o755)
+            compiled.save(tmp)
+            write_source(tmp, source)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    @contextmanager
+    def _lock(self, model_name, version):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.path(model_name, version) + ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,35 @@
+# api/startup.py
+
+"""
+Startup timing for the API process.
+
+Imported first by api/main.py, so ``STARTED_AT`` is as close to process
+start as the app can see. Phases are marked with seconds since then; once
+the models are loaded the total is checked against STARTUP_BUDGET_SECONDS.
+"""
+
+import os
+import time
+
+STARTED_AT = time.perf_counter()
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "20"))
+
+
+class StartupTracker:
+
+    def __init__(self, started_at=STARTED_AT, budget=STARTUP_BUDGET_SECONDS):
+        self.started_at = started_at
+        self.budget = budget
+        self.phases = {}  # phase -> seconds since started_at
+
+    def mark(self, phase):
+        self.phases[phase] = time.perf_counter() - self.started_at
+        return self.phases[phase]
+
+    def within_budget(self, phase="ready"):
+        seconds = self.phases.get(phase)
+        return seconds is not None and seconds <= self.budget
+
+
+startup = StartupTracker()
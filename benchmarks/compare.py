@@ -0,0 +1,84 @@
+# benchmarks/compare.py
+
+"""
+Compare two benchmark result files from benchmarks/run.py.
+
+    python -m benchmarks.compare old.json new.json [--threshold 0.1]
+
+Prints every shared metric with its relative change and exits with
+status 1 when any timing or throughput metric regressed by more than
+``--threshold``. Throughput metrics (*_per_sec, rps) are better when
+higher; timings (*_seconds, *_ms) when lower. Other metrics (row counts
+and the like) are listed but never count as regressions.
+"""
+
+import argparse
+import json
+import sys
+
+
+def _direction(metric):
+    if metric.endswith("_per_sec") or metric == "rps":
+        return 1
+    if metric.endswith("_seconds") or metric.endswith("_ms"):
+        return -1
+    return 0
+
+
+def _index(report):
+    return {
+        (entry["benchmark"], entry["size"], metric): value
+        for entry in report["results"]
+        for metric, value in entry["metrics"].items()
+        if isinstance(value, (int, float))
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """Rows of (benchmark, size, metric, old, new, change, regressed)."""
+    old_values = _index(old)
+    new_values = _index(new)
+
+    rows = []
+    for key in sorted(old_values.keys() & new_values.keys(), key=str):
+        before, after = old_values[key], new_values[key]
+        change = (after - before) / before if before else 0.0
+        direction = _direction(key[2])
+        regressed = direction != 0 and -direction * change > threshold
+        rows.append((*key, before, after, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"old: {old.get('commit')}  new: {new.get('commit')}")
+    if old.get("machine") != new.get("machine"):
+        print("warning: results come from different machines")
+
+    rows = compare(old, new, args.threshold)
+    regressions = 0
+
+    for benchmark, size, metric, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        regressions += regressed
+        print(
+            f"{benchmark:<20} {str(size):>8} {metric:<36} "
+            f"{before:>14.4f} {after:>14.4f} {change:>+9.1%} {flag}"
+        )
+
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
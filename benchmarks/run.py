@@ -0,0 +1,403 @@
+# benchmarks/run.py
+
+"""
+Benchmark suite on one machine, with SQLite and a file MLflow store
+standing in for MySQL and the MLflow server (see benchmarks/env.py).
+
+For every data size (vehicles) it times data generation, the full and
+incremental feature builds, feature loading, both trainers and the
+combined trainer, and the live-stat / drift computations. It then times
+API cold starts (to /health and to /ready, with registry and cached
+model resolution), serves the trained models with uvicorn and loads
+/predict at each concurrency level, recording p50/p95/p99 latency and
+requests/sec.
+
+Results are written as JSON (one record per benchmark and size) so runs
+on different commits can be compared with benchmarks/compare.py:
+
+    python -m benchmarks.run --sizes 1000,5000 --output benchmarks/results/new.json
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks import env
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED = 42
+# Environment variables that change what is being measured
+RECORDED_SETTINGS = ["FAST_INFERENCE", "LOG_BATCH_SIZE", "LOG_FLUSH_INTERVAL", "TRAIN_WORKERS", "TRAIN_N_JOBS",
+                     "PREDICTION_CACHE_SIZE", "SHARED_MODELS", "STARTUP_BUDGET_SECONDS",
+                     "FEATURE_BUILD_WORKERS"]
+# Vehicle id ranges in the sharded feature build
+BUILD_SHARDS = 8
+
+PAYLOAD = {
+    "total_error_count": 3,
+    "avg_cycle_time": 50.2,
+    "cycle_time_variance": 3.1,
+    "rework_ratio": 0.05,
+    "vendor_defect_ratio": 0.1,
+    "avg_torque": 98.4,
+    "torque_deviation": 4.2
+}
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def bench_generate(size, workdir, workers):
+    from data_generation import generate_data
+
+    # SQLite takes one writer at a time, so the db target runs on one worker
+    seconds, totals = _timed(generate_data.main, num_vehicles=size, seed=SEED, target="db", workers=1)
+    rows = sum(totals.values())
+
+    csv_dir = os.path.join(workdir, "generated_csv")
+    csv_seconds, csv_totals = _timed(
+        generate_data.main, num_vehicles=size, seed=SEED, target="csv", output_dir=csv_dir, workers=workers
+    )
+    shutil.rmtree(csv_dir, ignore_errors=True)
+
+    return {
+        "rows": rows,
+        "db_seconds": seconds,
+        "db_rows_per_sec": rows / seconds,
+        "csv_seconds": csv_seconds,
+        "csv_rows_per_sec": sum(csv_totals.values()) / csv_seconds
+    }
+
+
+def bench_build_features(size):
+    from data_generation import generate_data
+    from feature_pipeline.build_features import build_features
+
+    full_seconds, vehicles = _timed(build_features, full_rebuild=True, shards=0)
+
+    # 1% new vehicles, then an incremental build over just those
+    new_vehicles = max(size // 100, 1)
+    generate_data.main(num_vehicles=new_vehicles, seed=SEED + 1, target="db", workers=1)
+    incremental_seconds, updated = _timed(build_features)
+
+    sharded_seconds, sharded_vehicles = _timed(
+        build_features, full_rebuild=True, shards=BUILD_SHARDS
+    )
+
+    return {
+        "vehicles": vehicles,
+        "full_seconds": full_seconds,
+        "full_vehicles_per_sec": vehicles / full_seconds,
+        "incremental_vehicles": updated,
+        "incremental_seconds": incremental_seconds,
+        "sharded_seconds": sharded_seconds,
+        "sharded_vehicles_per_sec": sharded_vehicles / sharded_seconds
+    }
+
+
+def bench_load_features():
+    from ml.utils import FEATURE_CACHE_DIR, load_feature_data
+
+    shutil.rmtree(FEATURE_CACHE_DIR, ignore_errors=True)
+    cold_seconds, df = _timed(load_feature_data)
+    warm_seconds, _ = _timed(load_feature_data)
+
+    return {"rows": len(df), "cold_seconds": cold_seconds, "warm_seconds": warm_seconds}
+
+
+def bench_train():
+    from ml import train_all, train_anomaly, train_supervised
+
+    supervised_seconds, _ = _timed(train_supervised.train)
+    anomaly_seconds, _ = _timed(train_anomaly.train)
+    combined_seconds, (_, stages) = _timed(train_all.train_all)
+
+    return {
+        "supervised_seconds": supervised_seconds,
+        "anomaly_seconds": anomaly_seconds,
+        "separate_seconds": supervised_seconds + anomaly_seconds,
+        "train_all_seconds": combined_seconds,
+        **{f"train_all_{stage}_seconds": seconds for stage, seconds in stages.items()}
+    }
+
+
+def _store_baseline_stats(engine):
+    import pandas as pd
+    from sqlalchemy import text
+
+    df = pd.read_sql("SELECT * FROM vehicle_features", engine)
+    rows = [
+        {"feature_name": col, "mean_value": float(df[col].mean()), "std_value": float(df[col].std())}
+        for col in PAYLOAD
+    ]
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM feature_baseline_stats"))
+        conn.execute(text(
+            "INSERT INTO feature_baseline_stats (feature_name, mean_value, std_value) "
+            "VALUES (:feature_name, :mean_value, :std_value)"
+        ), rows)
+    return df
+
+
+def bench_drift(engine, bucket_seconds=300):
+    from ml.drift_monitor import compute_live_stats, detect_drift
+    from ml.running_stats import LiveStatsAggregator
+    from ml.utils import load_baseline_histograms
+
+    features = _store_baseline_stats(engine)
+    payloads = features[list(PAYLOAD)].to_dict("records")
+
+    # One day of traffic: every payload scored once, spread over the buckets
+    aggregator = LiveStatsAggregator(engine, list(PAYLOAD), bucket_seconds=bucket_seconds)
+    run_id, histograms = load_baseline_histograms(engine)
+    if run_id is not None:
+        aggregator.set_baseline(run_id, histograms)
+
+    n_buckets = 24 * 3600 // bucket_seconds
+    now = datetime.datetime.utcnow()
+
+    def write_buckets():
+        for i, chunk in enumerate(np.array_split(np.arange(len(payloads)), n_buckets)):
+            if len(chunk):
+                aggregator.update([payloads[j] for j in chunk], now - datetime.timedelta(seconds=i * bucket_seconds))
+        return aggregator.flush(force=True)
+
+    write_seconds, rows = _timed(write_buckets)
+    live_seconds, _ = _timed(compute_live_stats)
+    drift_seconds, report = _timed(detect_drift)
+
+    return {
+        "payloads": len(payloads),
+        "bucket_rows": rows,
+        "bucket_write_seconds": write_seconds,
+        "compute_live_stats_seconds": live_seconds,
+        "detect_drift_seconds": drift_seconds,
+        "features_checked": len(report["features"])
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(client, url, deadline):
+    import httpx
+
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return True
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def bench_startup(timeout=120):
+    """Seconds from launching a uvicorn process to /health and to /ready."""
+    import httpx
+
+    results = {}
+    env_vars = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])))
+
+    # registry first: its load saves the resolution the cached start reads
+    for mode in ("registry", "cached"):
+        port = _free_port()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+            env=dict(env_vars, MODEL_STARTUP_MODE=mode),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            base = f"http://127.0.0.1:{port}"
+            deadline = start + timeout
+            with httpx.Client(timeout=5) as client:
+                if not _wait_for(client, f"{base}/health", deadline):
+                    raise RuntimeError(f"API did not start within {timeout}s ({mode})")
+                results[f"{mode}_health_seconds"] = time.perf_counter() - start
+
+                if not _wait_for(client, f"{base}/ready", deadline):
+                    raise RuntimeError(f"Models did not load within {timeout}s ({mode})")
+                results[f"{mode}_ready_seconds"] = time.perf_counter() - start
+
+                phases = client.get(f"{base}/ready").json()["startup"]
+                results[f"{mode}_imports_seconds"] = phases["imports"]
+        finally:
+            process.terminate()
+            process.wait(30)
+
+    return results
+
+
+def bench_predict(concurrency_levels, requests_per_level, warmup=50):
+    import httpx
+    import uvicorn
+
+    from api.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    url = f"http://127.0.0.1:{port}/predict"
+    results = {}
+
+    try:
+        with httpx.Client() as client:
+            # Models load in the background after startup
+            if not _wait_for(client, f"http://127.0.0.1:{port}/ready", time.perf_counter() + 120):
+                raise RuntimeError("Models did not load")
+            for _ in range(warmup):
+                client.post(url, json=PAYLOAD).raise_for_status()
+
+        for concurrency in concurrency_levels:
+            per_worker = requests_per_level // concurrency
+
+            def worker(_):
+                latencies = []
+                errors = 0
+                with httpx.Client(timeout=30) as client:
+                    for _ in range(per_worker):
+                        start = time.perf_counter()
+                        response = client.post(url, json=PAYLOAD)
+                        latencies.append(time.perf_counter() - start)
+                        errors += response.status_code != 200
+                return latencies, errors
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(worker, range(concurrency)))
+            wall = time.perf_counter() - start
+
+            latencies = np.concatenate([o[0] for o in outcomes]) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            results[concurrency] = {
+                "requests": len(latencies),
+                "errors": sum(o[1] for o in outcomes),
+                "rps": len(latencies) / wall,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "mean_ms": float(latencies.mean())
+            }
+    finally:
+        server.should_exit = True
+        thread.join(30)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--sizes", default="1000,5000", help="Comma-separated vehicle counts")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated /predict client counts")
+    parser.add_argument("--requests", type=int, default=2000, help="/predict requests per concurrency level")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes for CSV generation")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temp dir)")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--skip", default="", help="Comma-separated benchmarks to skip (startup and predict serve the models from train)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+    skip = set(filter(None, args.skip.split(",")))
+
+    commit, dirty = _git_commit()
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"{(commit or 'unknown')[:12]}.json")
+    output = os.path.abspath(output)
+
+    workdir = args.workdir
+    if workdir is None:
+        import tempfile
+        workdir = tempfile.mkdtemp(prefix="benchmarks-")
+
+    engine = env.setup(workdir)
+    from utils.logger import logger
+
+    results = []
+
+    def record(name, size, metrics):
+        results.append({"benchmark": name, "size": size, "metrics": metrics})
+        logger.info(f"[benchmark] {name} size={size}: {json.dumps(metrics, default=float)}")
+
+    for size in sizes:
+        env.reset_data(engine)
+
+        steps = [
+            ("generate", lambda: bench_generate(size, workdir, args.workers)),
+            ("build_features", lambda: bench_build_features(size)),
+            ("load_features", bench_load_features),
+            ("train", bench_train),
+            ("drift", lambda: bench_drift(engine)),
+        ]
+        for name, step in steps:
+            if name not in skip:
+                record(name, size, step())
+
+    if "startup" not in skip:
+        record("startup", None, bench_startup())
+
+    if "predict" not in skip:
+        # Served with the models trained on the last size
+        for concurrency, metrics in bench_predict(concurrency_levels, args.requests).items():
+            record(f"predict_c{concurrency}", None, metrics)
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.datetime.utcnow().isoformat(),
+        "machine": {
+            "platform": platform.platform(),
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count()
+        },
+        "settings": {name: os.getenv(name) for name in RECORDED_SETTINGS},
+        "results": results
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=float)
+
+    logger.info(f"Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,53 @@
 # data_generation/generate_data.py
 
-import uuid
-import random
+"""
+Synthetic vehicles, station operations, vendor components and warranty
+claims.
+
+Each table is drawn a whole column at a time with NumPy, in chunks of
+vehicles. Chunks are spread over a process pool, and each chunk gets its
+own random stream derived from (seed, first vehicle), so a given seed
+produces the same data whatever the worker count.
+
+Targets:
+    db   Core bulk inserts into the configured database
+    csv  one CSV file per table and chunk under --output-dir, plus
+         load_data.sql with the LOAD DATA LOCAL INFILE statements
+
+    python -m data_generation.generate_data --vehicles 1000000 --workers 8
+    python -m data_generation.generate_data --vehicles 1000000 --target csv --output-dir /tmp/gen
+"""
+
+import argparse
 import datetime
-from database.session import SessionLocal
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from database.migrations import migrate
+from database.session import engine
 from database.models import Vehicle, StationOperation, VendorComponent, WarrantyClaim
 from utils.logger import logger
 
 NUM_VEHICLES = 5000
 NUM_STATIONS = 25
 
+# Vehicles per chunk (one task for the process pool)
+CHUNK_VEHICLES = 10000
+# Rows per executemany in the db target
+INSERT_BATCH_SIZE = 20000
+
+HIGH_RISK_RATE = 0.05
+
+MODEL_TYPES = ["SUV", "Sedan", "Truck"]
+PLANTS = ["Plant_A", "Plant_B"]
+SHIFTS = ["Morning", "Evening", "Night"]
+COMPONENTS = ["Engine", "Transmission", "Brake"]
+
 VENDORS = ["Xelix", "Neon", "Physher"]
 VENDOR_DEFECT_PROB = {
     "Xelix": 0.03,
@@ -17,100 +55,256 @@ VENDOR_DEFECT_PROB = {
     "Physher": 0.01
 }
 
-def generate_vehicle():
+# Table order respects the foreign keys on vehicles
+TABLES = [
+    (Vehicle, ["vehicle_id", "model_type", "plant_id", "production_date", "shift"]),
+    (StationOperation, [
+        "vehicle_id", "station_id", "cycle_time", "error_count", "rework_flag",
+        "torque_value", "temperature", "operation_timestamp"
+    ]),
+    (VendorComponent, ["vehicle_id", "component_type", "vendor_id", "batch_id", "defect_flag"]),
+    (WarrantyClaim, ["vehicle_id", "warranty_flag", "claim_type", "days_to_claim"]),
+]
+
+
+def _choice(rng, values, size):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+
+
+def _uuid4(rng, size):
+    raw = rng.integers(0, 256, size=(size, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    return np.array([str(uuid.UUID(bytes=row.tobytes())) for row in raw], dtype=object)
+
+
+def generate_vehicles(rng, n):
+    today = datetime.date.today()
+    dates = np.array([today - datetime.timedelta(days=d) for d in range(366)], dtype=object)
+
+    return {
+        "vehicle_id": _uuid4(rng, n),
+        "model_type": _choice(rng, MODEL_TYPES, n),
+        "plant_id": _choice(rng, PLANTS, n),
+        "production_date": dates[rng.integers(0, 366, n)],
+        "shift": _choice(rng, SHIFTS, n)
+    }
+
+
+def generate_station_data(rng, vehicle_ids, high_risk, first_timestamp):
+    n = len(vehicle_ids) * NUM_STATIONS
+    risky = np.repeat(high_risk, NUM_STATIONS)
+
+    cycle_time = rng.uniform(40, 60, n)
+    # Inject anomaly
+    slow = risky & (rng.random(n) < 0.3)
+    cycle_time[slow] *= rng.uniform(1.2, 1.5, int(slow.sum()))
+
+    return {
+        "vehicle_id": np.repeat(vehicle_ids, NUM_STATIONS),
+        "station_id": np.tile(
+            np.array([f"Station_{i+1}" for i in range(NUM_STATIONS)], dtype=object), len(vehicle_ids)
+        ),
+        "cycle_time": cycle_time,
+        "error_count": np.where(risky, rng.integers(1, 6, n), rng.integers(0, 4, n)),
+        "rework_flag": rng.random(n) < np.where(risky, 0.3, 0.1),
+        "torque_value": np.where(risky, rng.uniform(80, 130, n), rng.uniform(90, 110, n)),
+        "temperature": rng.uniform(20, 40, n),
+        # Distinct, increasing timestamps like row-by-row inserts, so the
+        # incremental feature build's >= watermark only re-reads the last one
+        # (station_operations.operation_timestamp keeps microseconds on MySQL)
+        "operation_timestamp": (
+            first_timestamp + np.arange(n).astype("timedelta64[us]")
+        ).astype(object)
+    }
+
+
+def generate_vendor_data(rng, vehicle_ids):
+    n = len(vehicle_ids) * len(COMPONENTS)
+
+    vendor_index = rng.integers(0, len(VENDORS), n)
+    defect_prob = np.array([VENDOR_DEFECT_PROB[v] for v in VENDORS])[vendor_index]
+
+    return {
+        "vehicle_id": np.repeat(vehicle_ids, len(COMPONENTS)),
+        "component_type": np.tile(np.array(COMPONENTS, dtype=object), len(vehicle_ids)),
+        "vendor_id": np.asarray(VENDORS, dtype=object)[vendor_index],
+        "batch_id": np.char.add("BATCH_", rng.integers(1000, 10000, n).astype(str)).astype(object),
+        "defect_flag": rng.random(n) < defect_prob
+    }
+
+
+def generate_warranty(rng, vehicle_ids, high_risk):
+    n = len(vehicle_ids)
+    warranty_flag = rng.random(n) < np.where(high_risk, 0.4, 0.05)
+    days = rng.integers(30, 366, n).astype(object)
+    days[~warranty_flag] = None
+
+    return {
+        "vehicle_id": vehicle_ids,
+        "warranty_flag": warranty_flag,
+        "claim_type": np.where(warranty_flag, "Mechanical", None).astype(object),
+        "days_to_claim": days
+    }
+
+
+def generate_chunk(seed, start, count, base_time=None):
+    """
+    Columns of every table for vehicles [start, start + count). Operation
+    timestamps count up in microseconds from ``base_time`` (the run's start,
+    default now) offset by the chunk's first operation, so chunks generated
+    in parallel do not overlap.
+    """
+    rng = np.random.default_rng([seed, start])
+    if base_time is None:
+        base_time = datetime.datetime.now()
+    first_timestamp = np.datetime64(base_time, "us") + np.timedelta64(start * NUM_STATIONS, "us")
+
+    vehicles = generate_vehicles(rng, count)
+    vehicle_ids = vehicles["vehicle_id"]
+    high_risk = rng.random(count) < HIGH_RISK_RATE
+
     return {
-        "vehicle_id": str(uuid.uuid4()),
-        "model_type": random.choice(["SUV", "Sedan", "Truck"]),
-        "plant_id": random.choice(["Plant_A", "Plant_B"]),
-        "production_date": datetime.date.today() - datetime.timedelta(days=random.randint(0, 365)),
-        "shift": random.choice(["Morning", "Evening", "Night"])
+        Vehicle.__tablename__: vehicles,
+        StationOperation.__tablename__: generate_station_data(rng, vehicle_ids, high_risk, first_timestamp),
+        VendorComponent.__tablename__: generate_vendor_data(rng, vehicle_ids),
+        WarrantyClaim.__tablename__: generate_warranty(rng, vehicle_ids, high_risk),
     }
 
-def generate_station_data(vehicle_id, high_risk=False):
-    operations = []
-    for i in range(NUM_STATIONS):
-        base_cycle = random.uniform(40, 60)
-
-        # Inject anomaly
-        if high_risk and random.random() < 0.3:
-            base_cycle *= random.uniform(1.2, 1.5)
-
-        operation = StationOperation(
-            vehicle_id=vehicle_id,
-            station_id=f"Station_{i+1}",
-            cycle_time=base_cycle,
-            error_count=random.randint(0, 3) if not high_risk else random.randint(1, 5),
-            rework_flag=random.random() < 0.1 if not high_risk else random.random() < 0.3,
-            torque_value=random.uniform(90, 110) if not high_risk else random.uniform(80, 130),
-            temperature=random.uniform(20, 40),
-            operation_timestamp=datetime.datetime.now()
+
+def _write_db(chunk):
+    with engine.begin() as conn:
+        for model, columns in TABLES:
+            data = chunk[model.__tablename__]
+            values = [data[c].tolist() for c in columns]
+            rows = [dict(zip(columns, row)) for row in zip(*values)]
+
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                conn.execute(model.__table__.insert(), rows[i:i + INSERT_BATCH_SIZE])
+
+
+def _csv_path(output_dir, table, start):
+    return os.path.join(output_dir, f"{table}_{start:010d}.csv")
+
+
+def _write_csv(chunk, output_dir, start):
+    for model, columns in TABLES:
+        df = pd.DataFrame(chunk[model.__tablename__], columns=columns)
+        # LOAD DATA expects 0/1 for booleans and \N for NULL
+        for col in df.columns:
+            if df[col].dtype == bool:
+                df[col] = df[col].astype(np.int8)
+        df.to_csv(
+            _csv_path(output_dir, model.__tablename__, start),
+            index=False, header=False, na_rep="\\N"
         )
 
-        operations.append(operation)
-    return operations
-
-def generate_vendor_data(vehicle_id):
-    components = []
-    for comp in ["Engine", "Transmission", "Brake"]:
-        vendor = random.choice(VENDORS)
-        defect = random.random() < VENDOR_DEFECT_PROB[vendor]
-
-        components.append(
-            VendorComponent(
-                vehicle_id=vehicle_id,
-                component_type=comp,
-                vendor_id=vendor,
-                batch_id=f"BATCH_{random.randint(1000,9999)}",
-                defect_flag=defect
+
+def write_load_script(output_dir, starts):
+    """load_data.sql with one LOAD DATA statement per generated file."""
+    lines = []
+    for model, columns in TABLES:
+        for start in starts:
+            path = os.path.abspath(_csv_path(output_dir, model.__tablename__, start))
+            lines.append(
+                f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {model.__tablename__} "
+                f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                f"({', '.join(columns)});"
             )
-        )
-    return components
 
-def generate_warranty(vehicle_id, high_risk):
-    warranty_flag = False
+    script = os.path.join(output_dir, "load_data.sql")
+    with open(script, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return script
+
+
+def _init_worker():
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+
 
-    if high_risk:
-        warranty_flag = random.random() < 0.4
+def _run_chunk(seed, start, count, target, output_dir, base_time):
+    chunk = generate_chunk(seed, start, count, base_time)
+
+    if target == "csv":
+        _write_csv(chunk, output_dir, start)
     else:
-        warranty_flag = random.random() < 0.05
+        _write_db(chunk)
 
-    return WarrantyClaim(
-        vehicle_id=vehicle_id,
-        warranty_flag=warranty_flag,
-        claim_type="Mechanical" if warranty_flag else None,
-        days_to_claim=random.randint(30, 365) if warranty_flag else None
-    )
+    return {table: len(columns["vehicle_id"]) for table, columns in chunk.items()}
+
+
+def main(num_vehicles=NUM_VEHICLES, seed=None, target="db", output_dir="generated_data",
+         workers=None, chunk_vehicles=CHUNK_VEHICLES):
 
-def main():
-    session = SessionLocal()
-    logger.info("Starting synthetic data generation...")
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**32)
+    workers = workers or os.cpu_count()
 
-    for i in range(NUM_VEHICLES):
-        high_risk = random.random() < 0.05  # 5% risky vehicles
+    if target == "db":
+        for model, _ in TABLES:
+            model.__table__.create(bind=engine, checkfirst=True)
+        migrate(engine)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+
+    starts = list(range(0, num_vehicles, chunk_vehicles))
+    logger.info(
+        f"Generating {num_vehicles} vehicles (seed={seed}, target={target}, "
+        f"{len(starts)} chunks on {workers} workers)..."
+    )
 
-        vehicle_data = generate_vehicle()
-        vehicle = Vehicle(**vehicle_data)
+    totals = {model.__tablename__: 0 for model, _ in TABLES}
+    started = time.perf_counter()
+    base_time = datetime.datetime.now()
 
-        session.add(vehicle)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(
+                _run_chunk, seed, start, min(chunk_vehicles, num_vehicles - start),
+                target, output_dir, base_time
+            )
+            for start in starts
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            for table, rows in future.result().items():
+                totals[table] += rows
 
-        station_ops = generate_station_data(vehicle.vehicle_id, high_risk)
-        for op in station_ops:
-            session.add(op)
+            rows = sum(totals.values())
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"{done}/{len(starts)} chunks, {rows} rows, {rows / elapsed:,.0f} rows/sec"
+            )
 
-        vendor_data = generate_vendor_data(vehicle.vehicle_id)
-        for comp in vendor_data:
-            session.add(comp)
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
 
-        warranty = generate_warranty(vehicle.vehicle_id, high_risk)
-        session.add(warranty)
+    if target == "csv":
+        script = write_load_script(output_dir, starts)
+        logger.info(f"Wrote CSV files and {script}")
 
-        if i % 500 == 0:
-            logger.info(f"Inserted {i} vehicles...")
-            session.commit()
+    logger.info(
+        f"Data generation complete: {rows} rows in {elapsed:.1f}s "
+        f"({rows / elapsed:,.0f} rows/sec) - {totals}"
+    )
+    return totals
 
-    session.commit()
-    session.close()
-    logger.info("Data generation complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic manufacturing data")
+    parser.add_argument("--vehicles", type=int, default=NUM_VEHICLES, help="Vehicles to generate")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed (random when omitted)")
+    parser.add_argument("--target", choices=["db", "csv"], default="db", help="Insert into the database or write CSV files")
+    parser.add_argument("--output-dir", default="generated_data", help="Directory for --target csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_VEHICLES, help="Vehicles per chunk")
+    args = parser.parse_args()
+
+    main(
+        num_vehicles=args.vehicles,
+        seed=args.seed,
+        target=args.target,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        chunk_vehicles=args.chunk_size
+    )
@@ -0,0 +1,50 @@
+# database/migrations.py
+
+"""
+Schema changes to tables created before the current models.
+
+Run once per deployment, before starting the API:
+
+    python -m database.migrations
+
+data_generation.generate_data runs it too when it creates the tables.
+The API only checks which prediction_logs columns exist and logs without
+the missing ones.
+"""
+
+from sqlalchemy import inspect, text
+
+from database.session import engine
+from utils.logger import logger
+
+# Columns added to prediction_logs after the table was first created
+PREDICTION_LOG_COLUMNS = {
+    "cache_hit": "BOOLEAN NOT NULL DEFAULT 0",
+    "risk_rule": "VARCHAR(64)"
+}
+
+
+def add_prediction_log_columns(bind=engine):
+    """Add the PREDICTION_LOG_COLUMNS prediction_logs lacks; returns the names added."""
+    inspector = inspect(bind)
+    if not inspector.has_table("prediction_logs"):
+        logger.info("No prediction_logs table yet, nothing to migrate")
+        return []
+
+    columns = {c["name"] for c in inspector.get_columns("prediction_logs")}
+    added = []
+    with bind.begin() as conn:
+        for name, ddl in PREDICTION_LOG_COLUMNS.items():
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE prediction_logs ADD COLUMN {name} {ddl}"))
+                logger.info(f"Added {name} column to prediction_logs")
+                added.append(name)
+    return added
+
+
+def migrate(bind=engine):
+    add_prediction_log_columns(bind)
+
+
+if __name__ == "__main__":
+    migrate()
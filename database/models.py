@@ -1,11 +1,28 @@
 # database/models.py
 
-from sqlalchemy import Column, String, Float, Integer, Boolean, Date, DateTime, ForeignKey
+from sqlalchemy import Column, String, Float, Double, Integer, Boolean, Date, DateTime, ForeignKey, Text, func
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import declarative_base
 import datetime
 
 Base = declarative_base()
 
+# MySQL's plain DATETIME drops fractional seconds; operation timestamps and
+# the feature build watermark need them to stay distinct and ordered.
+# Existing tables: ALTER TABLE station_operations MODIFY operation_timestamp DATETIME(6),
+# ALTER TABLE feature_build_runs MODIFY operations_watermark DATETIME(6)
+PreciseDateTime = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+
+# Set by the database on insert and by SQLAlchemy on update, so the
+# incremental feature build also sees rows changed in place. Raw SQL
+# UPDATEs must set it themselves. Existing tables:
+# ALTER TABLE vendor_components ADD COLUMN updated_at DATETIME DEFAULT CURRENT_TIMESTAMP, ADD INDEX (updated_at)
+# ALTER TABLE warranty_claims ADD COLUMN updated_at DATETIME DEFAULT CURRENT_TIMESTAMP, ADD INDEX (updated_at)
+# ALTER TABLE feature_build_runs ADD COLUMN component_updated_watermark DATETIME,
+#     ADD COLUMN claim_updated_watermark DATETIME
+def updated_at_column():
+    return Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
 class Vehicle(Base):
     __tablename__ = "vehicles"
 
@@ -28,7 +45,7 @@ class StationOperation(Base):
     rework_flag = Column(Boolean)
     torque_value = Column(Float)
     temperature = Column(Float)
-    operation_timestamp = Column(DateTime)
+    operation_timestamp = Column(PreciseDateTime)
 
 
 class VendorComponent(Base):
@@ -40,6 +57,7 @@ class VendorComponent(Base):
     vendor_id = Column(String(50))
     batch_id = Column(String(50))
     defect_flag = Column(Boolean)
+    updated_at = updated_at_column()
 
 
 class WarrantyClaim(Base):
@@ -49,4 +67,102 @@ class WarrantyClaim(Base):
     vehicle_id = Column(String(36), ForeignKey("vehicles.vehicle_id"))
     warranty_flag = Column(Boolean)
     claim_type = Column(String(50))
-    days_to_claim = Column(Integer)
\ No newline at end of file
+    days_to_claim = Column(Integer)
+    updated_at = updated_at_column()
+
+class FeatureBuildRun(Base):
+    __tablename__ = "feature_build_runs"
+
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    mode = Column(String(20))
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime)
+    # Source-table positions covered by this run
+    operations_watermark = Column(PreciseDateTime)
+    component_updated_watermark = Column(DateTime)
+    claim_updated_watermark = Column(DateTime)
+    vehicles_updated = Column(Integer)
+
+
+class FeatureStatsBucket(Base):
+    __tablename__ = "feature_stats_buckets"
+
+    bucket_row_id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket_start = Column(DateTime, index=True)
+    feature_name = Column(String(64))
+    count = Column(Integer)
+    mean = Column(Double)
+    m2 = Column(Double)
+    min_value = Column(Double)
+    max_value = Column(Double)
+    # Serialized ml.running_stats.QuantileSketch
+    sketch = Column(Text)
+    # Counts on the baseline histogram bins of training run histogram_run_id
+    histogram_run_id = Column(String(32))
+    bin_counts = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class FeatureBaselineHistogram(Base):
+    __tablename__ = "feature_baseline_histograms"
+
+    histogram_id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String(32), index=True)
+    feature_name = Column(String(64))
+    # JSON lists: n_bins + 1 edges (training min, interior quantiles, max) and n_bins counts
+    bin_edges = Column(Text)
+    counts = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class PredictionLogHourly(Base):
+    __tablename__ = "prediction_log_hourly"
+
+    rollup_id = Column(Integer, primary_key=True, autoincrement=True)
+    hour_start = Column(DateTime, index=True)
+    model_version = Column(String(20))
+    request_count = Column(Integer)
+    cache_hits = Column(Integer)
+    anomaly_count = Column(Integer)
+    risk_low = Column(Integer)
+    risk_medium = Column(Integer)
+    risk_high = Column(Integer)
+    warranty_probability_sum = Column(Double)
+    latency_sum_ms = Column(Double)
+    latency_p50_ms = Column(Double)
+    latency_p95_ms = Column(Double)
+    latency_p99_ms = Column(Double)
+    latency_max_ms = Column(Double)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class PredictionFeatureHourly(Base):
+    __tablename__ = "prediction_feature_hourly"
+
+    rollup_id = Column(Integer, primary_key=True, autoincrement=True)
+    hour_start = Column(DateTime, index=True)
+    model_version = Column(String(20))
+    feature_name = Column(String(64))
+    count = Column(Integer)
+    value_sum = Column(Double)
+    value_sum_sq = Column(Double)
+    min_value = Column(Double)
+    max_value = Column(Double)
+
+
+class ShadowPredictionLog(Base):
+    __tablename__ = "shadow_prediction_logs"
+
+    log_id = Column(Integer, primary_key=True, autoincrement=True)
+    prediction_timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    # Warranty / anomaly model versions behind each side
+    production_version = Column(String(20))
+    challenger_version = Column(String(20))
+    production_anomaly_version = Column(String(20))
+    challenger_anomaly_version = Column(String(20))
+    warranty_probability = Column(Double)
+    challenger_probability = Column(Double)
+    anomaly_flag = Column(Integer)
+    challenger_anomaly_flag = Column(Integer)
+    risk_level = Column(String(20))
+    challenger_risk_level = Column(String(20))
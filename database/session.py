@@ -1,9 +1,152 @@
 # database/session.py
 
-from sqlalchemy import create_engine
+"""
+The one place database engines are created.
+
+Everything is configured from the environment:
+
+    DATABASE_URL          SQLAlchemy URL (default: local MySQL AIDB);
+                          sqlite:///path.db works for local runs
+    ASYNC_DATABASE_URL    URL for the async engine (default: DATABASE_URL
+                          with the async driver, aiomysql / aiosqlite)
+    DB_POOL_SIZE          connections kept open per process
+    DB_MAX_OVERFLOW       extra connections allowed under bursts
+    DB_POOL_TIMEOUT       seconds to wait for a free connection
+    DB_POOL_RECYCLE       seconds before a connection is replaced (keep it
+                          below MySQL's wait_timeout)
+    DB_POOL_PRE_PING      test connections on checkout (true / false)
+
+Modules share the process-wide ``engine`` instead of creating their own.
+The API's handlers are plain ``def`` routes run on FastAPI's threadpool and
+use it too (feature lookups, /ingest/events, the log writers); the async
+engine only backs GET /health/db, which must answer without a free worker
+thread.
+"""
+
+import math
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://root:@localhost/AIDB")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Sync driver -> async driver for the default ASYNC_DATABASE_URL
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+class _Variance:
+    # MySQL VARIANCE / STDDEV are population statistics
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(float(value))
+
+    def finalize(self):
+        if not self.values:
+            return None
+        mean = sum(self.values) / len(self.values)
+        return sum((v - mean) ** 2 for v in self.values) / len(self.values)
+
+
+class _Stddev(_Variance):
+    def finalize(self):
+        variance = super().finalize()
+        return None if variance is None else math.sqrt(variance)
+
+
+def _on_sqlite_connect(dbapi_conn, record):
+    # The feature build aggregates with VARIANCE / STDDEV, which SQLite lacks
+    dbapi_conn.create_aggregate("VARIANCE", 1, _Variance)
+    dbapi_conn.create_aggregate("STDDEV", 1, _Stddev)
+    # WAL lets the API's background writers and request threads overlap
+    dbapi_conn.execute("PRAGMA journal_mode=WAL")
+    dbapi_conn.execute("PRAGMA synchronous=NORMAL")
+
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_options(url):
+    if _is_sqlite(url):
+        # One file, no server: pool sizing and pre-ping do not apply
+        options = {"connect_args": {"check_same_thread": False, "timeout": DB_POOL_TIMEOUT}}
+        if make_url(url).database in (None, "", ":memory:"):
+            # Every connection would otherwise get its own empty database
+            options["poolclass"] = StaticPool
+        return options
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def create_db_engine(url=None, **overrides):
+    """Engine for ``url`` (default DATABASE_URL) with the pool settings above."""
+    url = url or DATABASE_URL
+    new_engine = create_engine(url, **{**_engine_options(url), **overrides})
+
+    if _is_sqlite(url):
+        event.listen(new_engine, "connect", _on_sqlite_connect)
+
+    return new_engine
+
+
+def async_database_url(url=None):
+    if ASYNC_DATABASE_URL and url is None:
+        return ASYNC_DATABASE_URL
+
+    parsed = make_url(url or DATABASE_URL)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver known for {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url=None, **overrides):
+    """AsyncEngine for async FastAPI handlers (GET /health/db); needs aiomysql / aiosqlite."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_url(url)
+    return create_async_engine(url, **{**_engine_options(url), **overrides})
+
+
+_async_engine = None
+
+
+def get_async_engine():
+    """Process-wide AsyncEngine, created on first use."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+    return _async_engine
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
 
-DATABASE_URL = "mysql+pymysql://root:@localhost/AIDB"
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
\ No newline at end of file
+engine = create_db_engine()
+SessionLocal = sessionmaker(bind=engine)
@@ -1,19 +1,30 @@
 # feature_pipeline/build_features.py
 
-from database.session import SessionLocal
-from sqlalchemy import text
+import argparse
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from database.session import SessionLocal, engine
+from database.models import FeatureBuildRun, StationOperation, VendorComponent, WarrantyClaim
+from sqlalchemy import MetaData, Table, bindparam, func, text
 from utils.logger import logger
 
-def build_features():
-    session = SessionLocal()
-    logger.info("Starting feature aggregation...")
+# Vehicle ids per DELETE / INSERT ... SELECT statement in incremental mode
+INCREMENTAL_CHUNK_SIZE = 1000
+# Full rebuilds split into this many vehicle id ranges (0 or 1: one INSERT ... SELECT)
+FEATURE_BUILD_SHARDS = int(os.getenv("FEATURE_BUILD_SHARDS", "0"))
+# Shards aggregated at once, each on its own connection
+FEATURE_BUILD_WORKERS = int(os.getenv("FEATURE_BUILD_WORKERS", "4"))
+# Incremental builds re-scan this far behind the previous watermarks, for
+# rows committed late with an earlier timestamp
+FEATURE_BUILD_LOOKBACK_SECONDS = int(os.getenv("FEATURE_BUILD_LOOKBACK_SECONDS", "60"))
 
-    # Clear existing feature table
-    session.execute(text("DELETE FROM vehicle_features"))
-    session.commit()
+STAGING_TABLE = "vehicle_features_staging"
+RETIRED_TABLE = "vehicle_features_old"
 
-    aggregation_query = """
-    INSERT INTO vehicle_features (
+FEATURE_COLUMNS = """
     vehicle_id,
     total_error_count,
     avg_cycle_time,
@@ -23,8 +34,10 @@ def build_features():
     avg_torque,
     torque_deviation,
     warranty_flag
-)
+"""
 
+# {where} / {outer_where} restrict the aggregation to a subset of vehicles
+AGGREGATION_SELECT = """
 SELECT
     v.vehicle_id,
     s.total_error_count,
@@ -48,6 +61,7 @@ JOIN (
         AVG(torque_value) AS avg_torque,
         STDDEV(torque_value) AS torque_deviation
     FROM station_operations
+    {where}
     GROUP BY vehicle_id
 ) s ON v.vehicle_id = s.vehicle_id
 
@@ -56,17 +70,273 @@ JOIN (
         vehicle_id,
         AVG(defect_flag) AS vendor_defect_ratio
     FROM vendor_components
+    {where}
     GROUP BY vehicle_id
 ) vc ON v.vehicle_id = vc.vehicle_id
 
-JOIN warranty_claims wc ON v.vehicle_id = wc.vehicle_id;
+JOIN warranty_claims wc ON v.vehicle_id = wc.vehicle_id
+{outer_where}
+"""
+
+
+def aggregation_query(condition=None, target="vehicle_features"):
+    """
+    INSERT ... SELECT of the per-vehicle aggregates into ``target``.
+
+    ``condition`` is a filter on the vehicle id written with a ``{vid}``
+    placeholder, e.g. ``"{vid} IN :vehicle_ids"``.
     """
+    if condition:
+        where = "WHERE " + condition.format(vid="vehicle_id")
+        outer_where = "WHERE " + condition.format(vid="v.vehicle_id")
+    else:
+        where = outer_where = ""
 
-    session.execute(text(aggregation_query))
+    select = AGGREGATION_SELECT.format(where=where, outer_where=outer_where)
+    return f"INSERT INTO {target} ({FEATURE_COLUMNS}) {select}"
+
+
+def _current_watermarks(session):
+    return {
+        "operations_watermark": session.query(
+            func.max(StationOperation.operation_timestamp)
+        ).scalar(),
+        "component_updated_watermark": session.query(
+            func.max(VendorComponent.updated_at)
+        ).scalar(),
+        "claim_updated_watermark": session.query(
+            func.max(WarrantyClaim.updated_at)
+        ).scalar()
+    }
+
+
+def _last_run(session):
+    return (
+        session.query(FeatureBuildRun)
+        .filter(FeatureBuildRun.finished_at.isnot(None))
+        .order_by(FeatureBuildRun.run_id.desc())
+        .first()
+    )
+
+
+def _record_run(session, mode, started_at, watermarks, vehicles_updated):
+    session.add(FeatureBuildRun(
+        mode=mode,
+        started_at=started_at,
+        finished_at=datetime.datetime.utcnow(),
+        vehicles_updated=vehicles_updated,
+        **watermarks
+    ))
     session.commit()
-    session.close()
 
-    logger.info("Feature aggregation complete.")
+
+def _full_rebuild(session):
+    # Delete and re-insert in one transaction so readers never see an empty table
+    session.execute(text("DELETE FROM vehicle_features"))
+    result = session.execute(text(aggregation_query()))
+    session.commit()
+    return result.rowcount
+
+
+def _shard_bounds(shards):
+    """
+    (lo, hi) vehicle id ranges of about equal size; ``None`` leaves a side open.
+    Boundaries are read off the vehicles primary key, so any id scheme splits evenly.
+    """
+    with engine.connect() as conn:
+        total = conn.execute(text("SELECT COUNT(*) FROM vehicles")).scalar()
+        boundaries = []
+        for i in range(1, shards):
+            boundary = conn.execute(
+                text("SELECT vehicle_id FROM vehicles ORDER BY vehicle_id LIMIT 1 OFFSET :offset"),
+                {"offset": total * i // shards}
+            ).scalar()
+            if boundary is not None and (not boundaries or boundary > boundaries[-1]):
+                boundaries.append(boundary)
+
+    edges = [None] + boundaries + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _shard_condition(lo, hi):
+    parts = []
+    if lo is not None:
+        parts.append("{vid} >= :lo")
+    if hi is not None:
+        parts.append("{vid} < :hi")
+    return " AND ".join(parts) or None
+
+
+def _create_staging_table():
+    # Same columns, keys and defaults as vehicle_features
+    metadata = MetaData()
+    source = Table("vehicle_features", metadata, autoload_with=engine)
+    staging = source.to_metadata(MetaData(), name=STAGING_TABLE)
+    staging.drop(engine, checkfirst=True)
+    staging.create(engine)
+
+
+def _build_shard(lo, hi):
+    start = time.perf_counter()
+    # Its own short transaction: locks on the source rows of one id range only
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(aggregation_query(_shard_condition(lo, hi), target=STAGING_TABLE)),
+            {"lo": lo, "hi": hi}
+        )
+    return result.rowcount, time.perf_counter() - start
+
+
+def _swap_in_staging():
+    # Readers see the old table or the new one, never a partial build
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "mysql":
+            conn.execute(text(
+                f"RENAME TABLE vehicle_features TO {RETIRED_TABLE}, {STAGING_TABLE} TO vehicle_features"
+            ))
+            conn.execute(text(f"DROP TABLE {RETIRED_TABLE}"))
+        elif dialect == "sqlite":
+            # SQLite DDL is transactional
+            conn.execute(text("DROP TABLE vehicle_features"))
+            conn.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO vehicle_features"))
+        else:
+            conn.execute(text("DELETE FROM vehicle_features"))
+            conn.execute(text(f"INSERT INTO vehicle_features SELECT * FROM {STAGING_TABLE}"))
+            conn.execute(text(f"DROP TABLE {STAGING_TABLE}"))
+
+
+def _sharded_rebuild(shards, workers):
+    bounds = _shard_bounds(shards)
+    _create_staging_table()
+    logger.info(f"Building {len(bounds)} shards into {STAGING_TABLE} with {workers} workers...")
+
+    started = time.perf_counter()
+    total = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_build_shard, lo, hi): i for i, (lo, hi) in enumerate(bounds)}
+            for done, future in enumerate(as_completed(futures), 1):
+                rows, seconds = future.result()
+                total += rows
+                logger.info(
+                    f"Shard {futures[future] + 1}/{len(bounds)}: {rows} vehicles in {seconds:.2f}s "
+                    f"({done}/{len(bounds)} done, {time.perf_counter() - started:.1f}s elapsed)"
+                )
+    except BaseException:
+        Table(STAGING_TABLE, MetaData()).drop(engine, checkfirst=True)
+        raise
+
+    swap_start = time.perf_counter()
+    _swap_in_staging()
+    logger.info(f"Published {total} vehicles in {time.perf_counter() - swap_start:.2f}s")
+    return total
+
+
+def _changed_vehicles(session, last_run):
+    """
+    Vehicles with station operations, vendor components or claims added or
+    updated since ``last_run``, re-scanning FEATURE_BUILD_LOOKBACK_SECONDS
+    behind each watermark. Rebuilding a vehicle twice is harmless.
+    """
+    lookback = datetime.timedelta(seconds=FEATURE_BUILD_LOOKBACK_SECONDS)
+
+    def since(watermark):
+        return watermark - lookback if watermark else datetime.datetime.min
+
+    return session.execute(text("""
+        SELECT vehicle_id FROM station_operations
+        WHERE operation_timestamp >= :operations_since
+        UNION
+        SELECT vehicle_id FROM vendor_components
+        WHERE updated_at >= :components_since
+        UNION
+        SELECT vehicle_id FROM warranty_claims
+        WHERE updated_at >= :claims_since
+    """), {
+        "operations_since": since(last_run.operations_watermark),
+        "components_since": since(last_run.component_updated_watermark),
+        "claims_since": since(last_run.claim_updated_watermark)
+    }).scalars().all()
+
+
+def _incremental_build(session, last_run):
+    affected = _changed_vehicles(session, last_run)
+
+    logger.info(f"{len(affected)} vehicles changed since run {last_run.run_id}")
+
+    # Upsert: replace the affected rows, all chunks within one transaction
+    condition = "{vid} IN :vehicle_ids"
+    delete_query = text(
+        "DELETE FROM vehicle_features WHERE " + condition.format(vid="vehicle_id")
+    ).bindparams(bindparam("vehicle_ids", expanding=True))
+    insert_query = text(
+        aggregation_query(condition)
+    ).bindparams(bindparam("vehicle_ids", expanding=True))
+
+    for i in range(0, len(affected), INCREMENTAL_CHUNK_SIZE):
+        chunk = {"vehicle_ids": affected[i:i + INCREMENTAL_CHUNK_SIZE]}
+        session.execute(delete_query, chunk)
+        session.execute(insert_query, chunk)
+
+    session.commit()
+    return len(affected)
+
+
+def build_features(full_rebuild=False, shards=FEATURE_BUILD_SHARDS, workers=FEATURE_BUILD_WORKERS):
+    FeatureBuildRun.__table__.create(bind=engine, checkfirst=True)
+
+    session = SessionLocal()
+    started_at = datetime.datetime.utcnow()
+
+    try:
+        # Read the watermarks first: rows arriving during the build are
+        # picked up by the next incremental run
+        watermarks = _current_watermarks(session)
+        last_run = None if full_rebuild else _last_run(session)
+
+        if last_run is None and shards > 1:
+            logger.info(f"Starting sharded feature rebuild ({shards} shards)...")
+            # The shards run on their own connections: end this transaction first
+            session.commit()
+            updated = _sharded_rebuild(shards, workers)
+            mode = "sharded"
+        elif last_run is None:
+            logger.info("Starting full feature rebuild...")
+            updated = _full_rebuild(session)
+            mode = "full"
+        else:
+            logger.info(f"Starting incremental feature build from run {last_run.run_id}...")
+            updated = _incremental_build(session, last_run)
+            mode = "incremental"
+
+        _record_run(session, mode, started_at, watermarks, updated)
+    finally:
+        session.close()
+
+    logger.info(f"Feature aggregation complete ({mode}, {updated} vehicles).")
+    return updated
+
 
 if __name__ == "__main__":
-    build_features()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Aggregate vehicle_features")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild every vehicle instead of only those changed since the last run"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=FEATURE_BUILD_SHARDS,
+        help="Split a full rebuild into this many vehicle id ranges, built in parallel"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=FEATURE_BUILD_WORKERS,
+        help="Shards built at once"
+    )
+    args = parser.parse_args()
+
+    build_features(full_rebuild=args.full, shards=args.shards, workers=args.workers)
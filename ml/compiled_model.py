@@ -0,0 +1,509 @@
+# ml/compiled_model.py
+
+"""
+Pure-NumPy evaluation of the fitted pipelines logged by
+ml/train_supervised.py and ml/train_anomaly.py.
+
+compile_pipeline() pulls the fitted ColumnTransformer parameters
+(clip/log1p and Yeo-Johnson + standardization) and the tree arrays of the
+RandomForestClassifier or IsolationForest out of a sklearn Pipeline and
+returns an object that scores a fixed-order float matrix without pandas,
+input validation or per-estimator dispatch. Predictions match
+Pipeline.predict; use check_parity() to verify that on real payloads
+before serving from a compiled model.
+
+CompiledPipeline.save() writes a compiled model as plain .npy arrays plus
+a JSON manifest; CompiledPipeline.load() memory-maps them back read-only,
+so processes loading the same directory share one copy of the trees.
+With ``compact=True`` thresholds are stored as float32 (rounded down, so
+splits on float32 inputs are unchanged), feature indices as int16 and
+node values quantized to uint16.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# sklearn is only imported to compile; loading and scoring need NumPy alone
+
+# Values used to recognise the element-wise FunctionTransformer steps
+_PROBE = np.array([-1e6, -2.0, -1.0, -0.9995, -0.999, -0.5, 0.0, 0.25, 1.0, 3.0, 1e3])
+
+
+def _identify_function(step):
+    """Map a fitted FunctionTransformer onto a known element-wise op."""
+    probe = _PROBE.reshape(-1, 1)
+
+    with np.errstate(all="ignore"):
+        out = np.asarray(step.transform(probe.copy()), dtype=float).ravel()
+
+        if np.array_equal(out, _PROBE):
+            return ("identity",)
+
+        if np.array_equal(out, np.log1p(_PROBE), equal_nan=True):
+            return ("log1p",)
+
+        # clip(x, a_min, None): the lowest probe reveals a_min
+        a_min = out[0]
+        if np.isfinite(a_min) and np.array_equal(out, np.clip(_PROBE, a_min, None)):
+            return ("clip", float(a_min))
+
+    raise NotImplementedError(f"Cannot compile FunctionTransformer step {step!r}")
+
+
+def _float32_floor(x):
+    """Largest float32 <= x: ``x32 <= t`` then holds exactly when ``x32 <= t64``."""
+    out = x.astype(np.float32)
+    above = out.astype(np.float64) > x
+    out[above] = np.nextafter(out[above], np.float32(-np.inf))
+    return out
+
+
+def _quantize(values, bits=16):
+    """Linear quantization to unsigned ints; returns (codes, scale, offset)."""
+    lo, hi = float(values.min()), float(values.max())
+    levels = 2 ** bits - 1
+    scale = (hi - lo) / levels if hi > lo else 1.0
+    codes = np.rint((values - lo) / scale).astype(np.uint16 if bits == 16 else np.uint8)
+    return codes, scale, lo
+
+
+def _apply_function(op, x):
+    if op[0] == "identity":
+        return x
+    if op[0] == "log1p":
+        return np.log1p(x)
+    if op[0] == "clip":
+        return np.clip(x, op[1], None)
+    raise ValueError(f"Unknown op {op[0]}")
+
+
+def _yeo_johnson(x, lambdas):
+    # Same formulation as scipy.stats.yeojohnson, one lambda per column
+    out = np.zeros_like(x)
+    eps = np.finfo(x.dtype).eps
+
+    for i, lmbda in enumerate(lambdas):
+        col = x[:, i]
+        pos = col >= 0
+
+        if abs(lmbda) < eps:
+            out[pos, i] = np.log1p(col[pos])
+        else:
+            out[pos, i] = np.expm1(lmbda * np.log1p(col[pos])) / lmbda
+
+        if abs(lmbda - 2) > eps:
+            out[~pos, i] = -np.expm1((2 - lmbda) * np.log1p(-col[~pos])) / (2 - lmbda)
+        else:
+            out[~pos, i] = -np.log1p(-col[~pos])
+
+    return out
+
+
+class CompiledPreprocessor:
+    """
+    Fitted ColumnTransformer as a list of blocks over input column indices.
+
+    Each block is a dict with a ``kind`` ("function" or "yeo_johnson"), the
+    input ``columns`` it reads and its parameters. Output columns follow
+    the block order, as in ColumnTransformer.
+    """
+
+    def __init__(self, input_columns, blocks):
+        self.input_columns = list(input_columns)
+        self.blocks = blocks
+
+    @classmethod
+    def from_column_transformer(cls, ct):
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import FunctionTransformer, PowerTransformer
+
+        input_columns = list(ct.feature_names_in_)
+        index = {name: i for i, name in enumerate(input_columns)}
+        blocks = []
+
+        for name, transformer, columns in ct.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+
+            columns = [index[c] if isinstance(c, str) else int(c) for c in columns]
+
+            if transformer == "passthrough":
+                blocks.append({"kind": "function", "columns": columns, "ops": []})
+                continue
+
+            steps = [s for _, s in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+            ops = []
+
+            for step in steps:
+                if isinstance(step, FunctionTransformer):
+                    ops.append(_identify_function(step))
+                elif isinstance(step, PowerTransformer) and step.method == "yeo-johnson":
+                    if ops:
+                        raise NotImplementedError("Yeo-Johnson must be the first step of its block")
+                    block = {
+                        "kind": "yeo_johnson",
+                        "columns": columns,
+                        "lambdas": np.asarray(step.lambdas_, dtype=float),
+                        "mean": None,
+                        "scale": None
+                    }
+                    if step.standardize:
+                        block["mean"] = np.asarray(step._scaler.mean_, dtype=float)
+                        block["scale"] = np.asarray(step._scaler.scale_, dtype=float)
+                    break
+                else:
+                    raise NotImplementedError(f"Cannot compile transformer {name}: {step!r}")
+            else:
+                block = {"kind": "function", "columns": columns, "ops": ops}
+
+            blocks.append(block)
+
+        return cls(input_columns, blocks)
+
+    def to_dict(self):
+        blocks = []
+        for block in self.blocks:
+            block = dict(block)
+            if block["kind"] == "function":
+                block["ops"] = [list(op) for op in block["ops"]]
+            else:
+                for key in ("lambdas", "mean", "scale"):
+                    if block[key] is not None:
+                        block[key] = block[key].tolist()
+            blocks.append(block)
+        return {"input_columns": self.input_columns, "blocks": blocks}
+
+    @classmethod
+    def from_dict(cls, data):
+        blocks = []
+        for block in data["blocks"]:
+            block = dict(block)
+            if block["kind"] == "function":
+                block["ops"] = [tuple(op) for op in block["ops"]]
+            else:
+                for key in ("lambdas", "mean", "scale"):
+                    if block[key] is not None:
+                        block[key] = np.asarray(block[key], dtype=float)
+            blocks.append(block)
+        return cls(data["input_columns"], blocks)
+
+    def transform(self, X):
+        out = []
+
+        for block in self.blocks:
+            x = X[:, block["columns"]]
+
+            if block["kind"] == "function":
+                for op in block["ops"]:
+                    x = _apply_function(op, x)
+            else:
+                x = _yeo_johnson(x, block["lambdas"])
+                if block["mean"] is not None:
+                    x = (x - block["mean"]) / block["scale"]
+
+            out.append(x)
+
+        return np.concatenate(out, axis=1)
+
+
+class CompiledForest:
+    """
+    All trees of an ensemble flattened into contiguous node arrays.
+
+    ``roots`` holds the root node of every tree. Leaves point to
+    themselves, so a fixed number of ``max_depth`` steps takes every row
+    to its leaf. ``value`` holds the per-node output (class probabilities
+    for a classifier, path length for an isolation tree).
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 value_scale=None, value_offset=0.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        # Set when ``value`` holds quantized codes: value * scale + offset
+        self.value_scale = value_scale
+        self.value_offset = value_offset
+
+    @classmethod
+    def from_trees(cls, trees, node_values, feature_maps=None):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for i, tree in enumerate(trees):
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n, dtype=np.int32)
+
+            feature = np.where(is_leaf, 0, tree.feature)
+            if feature_maps is not None:
+                feature = np.asarray(feature_maps[i])[feature]
+
+            features.append(feature.astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int32))
+            values.append(node_values[i])
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            np.concatenate(features),
+            np.concatenate(thresholds),
+            np.concatenate(lefts),
+            np.concatenate(rights),
+            np.concatenate(values),
+            np.asarray(roots, dtype=np.int32),
+            int(max_depth)
+        )
+
+    ARRAYS = ("feature", "threshold", "left", "right", "value", "roots")
+
+    def save(self, path, compact=False):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        meta = {"max_depth": self.max_depth, "value_scale": self.value_scale, "value_offset": self.value_offset}
+
+        if compact and self.value_scale is None:
+            if self.feature.max(initial=0) <= np.iinfo(np.int16).max:
+                arrays["feature"] = self.feature.astype(np.int16)
+            arrays["threshold"] = _float32_floor(np.asarray(self.threshold, dtype=np.float64))
+            arrays["value"], meta["value_scale"], meta["value_offset"] = _quantize(np.asarray(self.value))
+
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"forest_{name}.npy"), array, allow_pickle=False)
+        return meta
+
+    @classmethod
+    def load(cls, path, meta, mmap_mode="r"):
+        arrays = {
+            name: np.load(os.path.join(path, f"forest_{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in cls.ARRAYS
+        }
+        return cls(
+            max_depth=meta["max_depth"],
+            value_scale=meta.get("value_scale"),
+            value_offset=meta.get("value_offset", 0.0),
+            **arrays
+        )
+
+    def apply(self, X):
+        """Leaf node index of every row in every tree, shape (n_trees, n_rows)."""
+        # Trees split on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])
+        node = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return node
+
+    def leaf_values(self, leaves):
+        """Node values at the indices from apply(), dequantized if needed."""
+        values = self.value[leaves]
+        if self.value_scale is None:
+            return values
+        return values * self.value_scale + self.value_offset
+
+
+def _average_path_length(n_samples):
+    n = np.asarray(n_samples, dtype=float)
+    out = np.zeros_like(n)
+    mask = n > 2
+    out[n == 2] = 1.0
+    out[mask] = 2.0 * (np.log(n[mask] - 1.0) + np.euler_gamma) - 2.0 * (n[mask] - 1.0) / n[mask]
+    return out
+
+
+class CompiledClassifier:
+    """RandomForestClassifier: averaged leaf class probabilities."""
+
+    kind = "classifier"
+
+    def __init__(self, forest, classes):
+        self.forest = forest
+        self.classes = classes
+
+    @classmethod
+    def from_estimator(cls, rf):
+        node_values = []
+        for est in rf.estimators_:
+            proba = est.tree_.value[:, 0, :rf.n_classes_].astype(np.float64)
+            normalizer = proba.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            node_values.append(proba / normalizer)
+
+        forest = CompiledForest.from_trees([est.tree_ for est in rf.estimators_], node_values)
+        return cls(forest, np.asarray(rf.classes_))
+
+    def predict_proba(self, X):
+        leaves = self.forest.apply(X)
+        return self.forest.leaf_values(leaves).mean(axis=0)
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def save(self, path, compact=False):
+        np.save(os.path.join(path, "classes.npy"), self.classes, allow_pickle=False)
+        return {"forest": self.forest.save(path, compact)}
+
+    @classmethod
+    def load(cls, path, meta, mmap_mode="r"):
+        classes = np.load(os.path.join(path, "classes.npy"), allow_pickle=False)
+        return cls(CompiledForest.load(path, meta["forest"], mmap_mode), classes)
+
+
+class CompiledIsolationForest:
+    """IsolationForest: mean path length -> anomaly score -> +1/-1."""
+
+    kind = "isolation_forest"
+
+    def __init__(self, forest, n_estimators, max_samples, offset):
+        self.forest = forest
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.offset = offset
+
+    @classmethod
+    def from_estimator(cls, iforest):
+        trees = [est.tree_ for est in iforest.estimators_]
+
+        # Depth of the leaf plus the expected depth of the unbuilt subtree below it
+        node_values = [
+            tree.compute_node_depths() + _average_path_length(tree.n_node_samples) - 1.0
+            for tree in trees
+        ]
+
+        feature_maps = None
+        if iforest._max_features != iforest.n_features_in_:
+            feature_maps = iforest.estimators_features_
+
+        forest = CompiledForest.from_trees(trees, node_values, feature_maps)
+        return cls(forest, len(trees), iforest._max_samples, float(iforest.offset_))
+
+    def score_samples(self, X):
+        depths = self.forest.leaf_values(self.forest.apply(X)).sum(axis=0)
+        denominator = self.n_estimators * _average_path_length([self.max_samples])[0]
+        if denominator == 0:
+            return -np.ones(len(depths))
+        return -(2 ** (-depths / denominator))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def save(self, path, compact=False):
+        return {
+            "forest": self.forest.save(path, compact),
+            "n_estimators": self.n_estimators,
+            "max_samples": int(self.max_samples),
+            "offset": self.offset
+        }
+
+    @classmethod
+    def load(cls, path, meta, mmap_mode="r"):
+        return cls(
+            CompiledForest.load(path, meta["forest"], mmap_mode),
+            meta["n_estimators"],
+            meta["max_samples"],
+            meta["offset"]
+        )
+
+
+class CompiledPipeline:
+    """Preprocessor + tree ensemble over a fixed-order float feature matrix."""
+
+    def __init__(self, preprocessor, model):
+        self.preprocessor = preprocessor
+        self.model = model
+
+    @property
+    def input_columns(self):
+        return self.preprocessor.input_columns
+
+    def to_matrix(self, records):
+        """Fixed-order float64 matrix from a list of feature dicts."""
+        return np.array(
+            [[record[c] for c in self.input_columns] for record in records],
+            dtype=np.float64
+        ).reshape(-1, len(self.input_columns))
+
+    def predict(self, X):
+        return self.model.predict(self.preprocessor.transform(np.asarray(X, dtype=np.float64)))
+
+    def predict_records(self, records):
+        return self.predict(self.to_matrix(records))
+
+    def save(self, path, compact=False):
+        """Write the arrays and a manifest.json to the directory ``path``."""
+        os.makedirs(path, exist_ok=True)
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "compact": compact,
+            "preprocessor": self.preprocessor.to_dict(),
+            "kind": self.model.kind,
+            "model": self.model.save(path, compact)
+        }
+        # Written last: a directory with a manifest is complete
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a saved pipeline; tree arrays are memory-mapped with ``mmap_mode``."""
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        if manifest["format"] != MANIFEST_FORMAT:
+            raise ValueError(f"Unsupported compiled model format {manifest['format']} in {path}")
+
+        model_cls = MODEL_KINDS[manifest["kind"]]
+        return cls(
+            CompiledPreprocessor.from_dict(manifest["preprocessor"]),
+            model_cls.load(path, manifest["model"], mmap_mode)
+        )
+
+
+MANIFEST_FORMAT = 1
+MODEL_KINDS = {cls.kind: cls for cls in (CompiledClassifier, CompiledIsolationForest)}
+
+
+def compile_pipeline(pipeline):
+    """Compile a fitted Pipeline([preprocessor, RandomForest | IsolationForest])."""
+    from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+    preprocessor = CompiledPreprocessor.from_column_transformer(pipeline.steps[0][1])
+    estimator = pipeline.steps[-1][1]
+
+    if isinstance(estimator, RandomForestClassifier):
+        model = CompiledClassifier.from_estimator(estimator)
+    elif isinstance(estimator, IsolationForest):
+        model = CompiledIsolationForest.from_estimator(estimator)
+    else:
+        raise NotImplementedError(f"Cannot compile estimator {estimator!r}")
+
+    return CompiledPipeline(preprocessor, model)
+
+
+def check_parity(compiled, reference, sample_df):
+    """
+    Compare compiled predictions with ``reference.predict`` (a sklearn
+    Pipeline or MLflow pyfunc model) on ``sample_df``.
+
+    Returns the number of rows whose prediction differs.
+    """
+    expected = np.asarray(reference.predict(sample_df))
+    actual = compiled.predict(sample_df[compiled.input_columns].to_numpy(dtype=np.float64))
+    return int((expected != actual).sum())
@@ -1,61 +1,141 @@
+import datetime
+
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
-from database.session import DATABASE_URL
+from sqlalchemy import select
+from database.session import engine
+from database.models import FeatureStatsBucket
+from ml.running_stats import merge_feature_rows
+from ml.utils import load_baseline_histograms
 
-engine = create_engine(DATABASE_URL)
+# Smoothing for empty bins in PSI
+PSI_EPSILON = 1e-6
 
-def compute_live_stats():
+def _merged_live_features(hours=24, histogram_run_id=None):
 
-    query = """
-        SELECT request_payload
-        FROM prediction_logs
-        WHERE prediction_timestamp >= NOW() - INTERVAL 1 DAY
-    """
+    # Pre-aggregated buckets written by the API (ml.running_stats), merged here
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    query = select(FeatureStatsBucket).where(FeatureStatsBucket.bucket_start >= since)
+
+    FeatureStatsBucket.__table__.create(bind=engine, checkfirst=True)
+
+    with engine.connect() as conn:
+        rows = conn.execute(query).all()
 
-    df = pd.read_sql(query, engine)
+    return merge_feature_rows(rows, histogram_run_id)
 
-    if df.empty:
+def compute_live_stats(hours=24):
+
+    merged = _merged_live_features(hours)
+
+    if not merged:
         print("No recent data.")
         return None
 
-    # Expand JSON payload
-    expanded = df["request_payload"].apply(pd.Series)
-
     live_stats = {}
 
-    for col in expanded.columns:
-        live_stats[col] = {
-            "mean": expanded[col].mean(),
-            "std": expanded[col].std()
-        }
+    for col, stats in merged.items():
+        live_stats[col] = stats.summary()
 
     return live_stats
 
-def detect_drift(threshold_mean=0.3, threshold_std=0.5):
+def distribution_metrics(baseline_counts, live_counts, edges):
+    """
+    PSI, KS and Wasserstein-1 for all features at once.
+
+    All arguments are (n_features, n_bins) arrays (edges: n_bins + 1).
+    Wasserstein integrates the CDF gap over the training bin widths, so it
+    is in the feature's own units.
+    """
+    baseline_counts = np.asarray(baseline_counts, dtype=float)
+    live_counts = np.asarray(live_counts, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+
+    p = baseline_counts / baseline_counts.sum(axis=1, keepdims=True)
+    q = live_counts / live_counts.sum(axis=1, keepdims=True)
+
+    p_smooth = np.clip(p, PSI_EPSILON, None)
+    q_smooth = np.clip(q, PSI_EPSILON, None)
+    psi = ((q_smooth - p_smooth) * np.log(q_smooth / p_smooth)).sum(axis=1)
 
-    live_stats = compute_live_stats()
+    cdf_gap = np.abs(np.cumsum(p, axis=1) - np.cumsum(q, axis=1))
+    ks = cdf_gap.max(axis=1)
+    wasserstein = (cdf_gap * np.diff(edges, axis=1)).sum(axis=1)
 
-    if not live_stats:
-        return False
+    return psi, ks, wasserstein
 
-    baseline_query = "SELECT * FROM feature_baseline_stats"
-    baseline_df = pd.read_sql(baseline_query, engine)
+def _live_bin_counts(stats, edges):
 
-    drift_detected = False
+    # Exact counts taken by the API on these bins
+    if stats.bin_counts is not None and stats.bin_counts.sum() > 0:
+        return stats.bin_counts
 
-    for _, row in baseline_df.iterrows():
-        feature = row["feature_name"]
+    # Buckets written before the API knew the bins: approximate from the sketch
+    cdf = np.concatenate([[0.0], stats.sketch.cdf(edges[1:-1]), [1.0]])
+    return np.diff(cdf) * stats.sketch.count
 
-        if feature in live_stats:
-            baseline_mean = row["mean_value"]
-            live_mean = live_stats[feature]["mean"]
-            baseline_std = row["std_value"]
-            live_std = live_stats[feature]["std"]
+def detect_drift(
+    threshold_mean=0.3,
+    threshold_std=0.5,
+    threshold_psi=0.2,
+    threshold_ks=0.1
+):
+    """
+    Per-feature drift report.
+
+    Returns {"drift_detected": bool, "features": {name: {...}}} with the
+    relative mean/std change against feature_baseline_stats and PSI, KS
+    and Wasserstein against the stored training histograms.
+    """
 
-            mean_change = abs(live_mean - baseline_mean) / (abs(baseline_mean) + 1e-6)
-            std_change = abs(live_std - baseline_std) / (abs(baseline_std) + 1e-6)
+    report = {"drift_detected": False, "features": {}}
 
-            if mean_change > threshold_mean or std_change > threshold_std:
-                drift_detected = True
+    histogram_run_id, histograms = load_baseline_histograms(engine)
+    live = _merged_live_features(histogram_run_id=histogram_run_id)
 
-    return drift_detected
\ No newline at end of file
+    if not live:
+        print("No recent data.")
+        return report
+
+    # Distribution-level metrics: one vectorized pass over the binned arrays
+    features = [f for f in histograms if f in live]
+
+    if features:
+        edges = np.stack([histograms[f][0] for f in features])
+        baseline_counts = np.stack([histograms[f][1] for f in features])
+        live_counts = np.stack([_live_bin_counts(live[f], edges[i]) for i, f in enumerate(features)])
+
+        psi, ks, wasserstein = distribution_metrics(baseline_counts, live_counts, edges)
+
+        for i, feature in enumerate(features):
+            report["features"][feature] = {
+                "psi": float(psi[i]),
+                "ks": float(ks[i]),
+                "wasserstein": float(wasserstein[i]),
+                "drift": bool(psi[i] > threshold_psi or ks[i] > threshold_ks)
+            }
+
+    # Moment-level checks against feature_baseline_stats
+    baseline_df = pd.read_sql("SELECT * FROM feature_baseline_stats", engine)
+    baseline_df = baseline_df[baseline_df["feature_name"].isin(list(live))]
+
+    if not baseline_df.empty:
+        names = baseline_df["feature_name"].to_numpy()
+        baseline_mean = baseline_df["mean_value"].to_numpy(dtype=float)
+        baseline_std = baseline_df["std_value"].to_numpy(dtype=float)
+        live_mean = np.array([live[f].stats.mean for f in names])
+        live_std = np.array([live[f].stats.std for f in names])
+
+        mean_change = np.abs(live_mean - baseline_mean) / (np.abs(baseline_mean) + 1e-6)
+        std_change = np.abs(live_std - baseline_std) / (np.abs(baseline_std) + 1e-6)
+        moment_drift = (mean_change > threshold_mean) | (std_change > threshold_std)
+
+        for i, feature in enumerate(names):
+            entry = report["features"].setdefault(feature, {"drift": False})
+            entry["mean_change"] = float(mean_change[i])
+            entry["std_change"] = float(std_change[i])
+            entry["drift"] = bool(entry["drift"] or moment_drift[i])
+
+    report["drift_detected"] = any(f["drift"] for f in report["features"].values())
+
+    return report
@@ -0,0 +1,434 @@
+# ml/prediction_rollups.py
+
+"""
+Maintenance of the prediction_logs table.
+
+Each run of maintain():
+
+1. rolls finished hours of raw log rows into prediction_log_hourly
+   (request counts, cache hits, latency percentiles, risk-level mix) and
+   prediction_feature_hourly (per-feature count, sum, sum of squares,
+   min and max), per model version;
+2. drops raw rows older than PREDICTION_LOG_RETENTION_DAYS, but never an
+   hour that has not been rolled up yet. On MySQL, once the table has been
+   partitioned by day (``--partition``), whole partitions are dropped and
+   the next days' partitions are created ahead of time; otherwise rows are
+   deleted in short batches.
+
+prediction_summary() answers monitoring questions from the rollups alone.
+
+    python -m ml.prediction_rollups              # one pass, e.g. from cron
+    python -m ml.prediction_rollups --every 900  # keep running
+    python -m ml.prediction_rollups --partition  # one-off, MySQL only
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, inspect, select, text
+
+from database.models import PredictionFeatureHourly, PredictionLogHourly
+from database.session import engine
+from utils.logger import logger
+
+PREDICTION_LOG_RETENTION_DAYS = int(os.getenv("PREDICTION_LOG_RETENTION_DAYS", "30"))
+# Rows are written by a buffered writer: leave an hour open this long after it ends
+ROLLUP_GRACE_SECONDS = int(os.getenv("ROLLUP_GRACE_SECONDS", "300"))
+# Hours read per query when catching up, bounding memory on a long backlog
+ROLLUP_WINDOW_HOURS = 24
+# Raw rows per DELETE when the table is not partitioned
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "10000"))
+# Daily partitions kept ready ahead of today
+PARTITION_DAYS_AHEAD = 7
+
+HOUR = datetime.timedelta(hours=1)
+RISK_LEVELS = ["LOW", "MEDIUM", "HIGH"]
+
+RAW_ROWS = text("""
+    SELECT prediction_timestamp, model_version, warranty_probability, anomaly_flag,
+           risk_level, request_payload, latency_ms, cache_hit
+    FROM prediction_logs
+    WHERE prediction_timestamp >= :start AND prediction_timestamp < :end
+""")
+
+
+def _floor_hour(ts):
+    return pd.Timestamp(ts).floor("h").to_pydatetime()
+
+
+def _db_now(conn):
+    # The database's clock: prediction_timestamp is its CURRENT_TIMESTAMP
+    return pd.Timestamp(conn.execute(text("SELECT CURRENT_TIMESTAMP")).scalar()).to_pydatetime()
+
+
+def _create_rollup_tables():
+    PredictionLogHourly.__table__.create(bind=engine, checkfirst=True)
+    PredictionFeatureHourly.__table__.create(bind=engine, checkfirst=True)
+
+
+def ensure_tables():
+    _create_rollup_tables()
+
+    # Every pass reads prediction_logs by time
+    indexes = inspect(engine).get_indexes("prediction_logs")
+    if not any(ix["column_names"] == ["prediction_timestamp"] for ix in indexes):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX ix_prediction_logs_timestamp ON prediction_logs (prediction_timestamp)"
+            ))
+        logger.info("Added prediction_timestamp index to prediction_logs")
+
+
+def rolled_up_until(conn):
+    """End of the last rolled-up hour, or None before the first rollup."""
+    last = conn.execute(select(func.max(PredictionLogHourly.hour_start))).scalar()
+    return None if last is None else pd.Timestamp(last).to_pydatetime() + HOUR
+
+
+def hourly_rollups(df):
+    """
+    (hourly rows, feature rows) as lists of dicts for the raw log rows in
+    ``df``, grouped by hour and model version.
+    """
+    if df.empty:
+        return [], []
+
+    df = df.assign(
+        hour_start=pd.to_datetime(df["prediction_timestamp"]).dt.floor("h"),
+        model_version=df["model_version"].fillna("").astype(str)
+    )
+    payloads = pd.DataFrame.from_records(
+        [json.loads(p) if p else {} for p in df["request_payload"]], index=df.index
+    ).apply(pd.to_numeric, errors="coerce")
+
+    risk = pd.get_dummies(df["risk_level"]).reindex(columns=RISK_LEVELS, fill_value=0)
+    keys = ["hour_start", "model_version"]
+
+    hourly = []
+    features = []
+    for (hour_start, version), group in df.groupby(keys, sort=True):
+        hour_start = hour_start.to_pydatetime()
+        latency = group["latency_ms"].to_numpy(dtype=np.float64)
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        counts = risk.loc[group.index].sum()
+
+        hourly.append({
+            "hour_start": hour_start,
+            "model_version": version,
+            "request_count": len(group),
+            "cache_hits": int(group["cache_hit"].fillna(0).astype(bool).sum()),
+            # IsolationForest convention: -1 is an anomaly, 1 is normal
+            "anomaly_count": int((group["anomaly_flag"] == -1).sum()),
+            "risk_low": int(counts["LOW"]),
+            "risk_medium": int(counts["MEDIUM"]),
+            "risk_high": int(counts["HIGH"]),
+            "warranty_probability_sum": float(group["warranty_probability"].sum()),
+            "latency_sum_ms": float(latency.sum()),
+            "latency_p50_ms": float(p50),
+            "latency_p95_ms": float(p95),
+            "latency_p99_ms": float(p99),
+            "latency_max_ms": float(latency.max())
+        })
+
+        values = payloads.loc[group.index]
+        for name, column in values.items():
+            column = column.dropna().to_numpy(dtype=np.float64)
+            if len(column) == 0:
+                continue
+            features.append({
+                "hour_start": hour_start,
+                "model_version": version,
+                "feature_name": name,
+                "count": len(column),
+                "value_sum": float(column.sum()),
+                "value_sum_sq": float(np.dot(column, column)),
+                "min_value": float(column.min()),
+                "max_value": float(column.max())
+            })
+
+    return hourly, features
+
+
+def rollup(now=None):
+    """Roll every finished hour not yet in the rollup tables; returns hours written."""
+    with engine.connect() as conn:
+        now = now or _db_now(conn)
+        start = rolled_up_until(conn)
+        if start is None:
+            first = conn.execute(text("SELECT MIN(prediction_timestamp) FROM prediction_logs")).scalar()
+            if first is None:
+                return 0
+            start = _floor_hour(first)
+
+    end = _floor_hour(now - datetime.timedelta(seconds=ROLLUP_GRACE_SECONDS))
+    written = 0
+
+    while start < end:
+        window_end = min(start + ROLLUP_WINDOW_HOURS * HOUR, end)
+
+        with engine.connect() as conn:
+            df = pd.read_sql(RAW_ROWS, conn, params={"start": start, "end": window_end})
+        hourly, features = hourly_rollups(df)
+
+        # Replace the window's rollups in one transaction, so a rerun is harmless
+        with engine.begin() as conn:
+            for table in (PredictionLogHourly, PredictionFeatureHourly):
+                conn.execute(delete(table).where(
+                    table.hour_start >= start, table.hour_start < window_end
+                ))
+            if hourly:
+                conn.execute(PredictionLogHourly.__table__.insert(), hourly)
+            if features:
+                conn.execute(PredictionFeatureHourly.__table__.insert(), features)
+
+        logger.info(f"Rolled up {len(df)} prediction logs from {start} to {window_end}")
+        written += len(hourly)
+        start = window_end
+
+    return written
+
+
+# --- Partitioning (MySQL) -------------------------------------------------
+
+def _to_days(day):
+    # MySQL TO_DAYS(): day number counted from year 0
+    return day.toordinal() + 365
+
+
+def _partition_name(day):
+    return f"p{day:%Y%m%d}"
+
+
+def _partition_bounds(conn):
+    """{partition name: TO_DAYS upper bound} of prediction_logs, or None when not partitioned."""
+    rows = conn.execute(text("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'prediction_logs'
+          AND PARTITION_NAME IS NOT NULL
+    """)).all()
+    if not rows:
+        return None
+    return {name: (None if bound == "MAXVALUE" else int(bound)) for name, bound in rows}
+
+
+def _partition_clause(days):
+    # Partition p<day> holds the rows of the day before ``day``
+    parts = [
+        f"PARTITION {_partition_name(day)} VALUES LESS THAN (TO_DAYS('{day:%Y-%m-%d}'))"
+        for day in days
+    ]
+    return ", ".join(parts + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+
+
+def partition_table(retention_days=PREDICTION_LOG_RETENTION_DAYS):
+    """
+    One-off: partition prediction_logs by day (MySQL). The partition key
+    must be part of the primary key, so it becomes (log_id, prediction_timestamp).
+    """
+    if engine.dialect.name != "mysql":
+        raise RuntimeError(f"Partitioning needs MySQL, not {engine.dialect.name}")
+
+    with engine.begin() as conn:
+        if _partition_bounds(conn) is not None:
+            logger.info("prediction_logs is already partitioned")
+            return
+        today = _db_now(conn).date()
+        first = conn.execute(text("SELECT MIN(prediction_timestamp) FROM prediction_logs")).scalar()
+        first_day = max(
+            pd.Timestamp(first).date() if first is not None else today,
+            today - datetime.timedelta(days=retention_days)
+        )
+        days = pd.date_range(
+            first_day + datetime.timedelta(days=1),
+            today + datetime.timedelta(days=PARTITION_DAYS_AHEAD + 1)
+        ).date
+
+        logger.info(f"Partitioning prediction_logs into {len(days) + 1} partitions...")
+        conn.execute(text(f"""
+            ALTER TABLE prediction_logs
+            DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, prediction_timestamp)
+            PARTITION BY RANGE (TO_DAYS(prediction_timestamp)) ({_partition_clause(days)})
+        """))
+
+
+def _add_partitions(conn, bounds, today):
+    # Split pmax so the next PARTITION_DAYS_AHEAD days each have their own partition
+    last = max((b for b in bounds.values() if b is not None), default=_to_days(today))
+    days = [
+        today + datetime.timedelta(days=i)
+        for i in range(1, PARTITION_DAYS_AHEAD + 2)
+        if _to_days(today + datetime.timedelta(days=i)) > last
+    ]
+    if days:
+        conn.execute(text(
+            f"ALTER TABLE prediction_logs REORGANIZE PARTITION pmax INTO ({_partition_clause(days)})"
+        ))
+        logger.info(f"Added {len(days)} prediction_logs partitions")
+
+
+def _drop_partitions(conn, bounds, cutoff):
+    # Only partitions wholly before the cutoff
+    expired = [
+        name for name, bound in bounds.items()
+        if bound is not None and bound <= _to_days(cutoff.date())
+    ]
+    # A partitioned table must keep at least one partition
+    if expired and len(expired) < len(bounds):
+        conn.execute(text(f"ALTER TABLE prediction_logs DROP PARTITION {', '.join(expired)}"))
+        logger.info(f"Dropped prediction_logs partitions {', '.join(expired)}")
+
+
+def _delete_batches(cutoff):
+    # Short transactions, so the API's log inserts never wait long on locks
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(text("""
+                SELECT log_id FROM prediction_logs
+                WHERE prediction_timestamp < :cutoff
+                ORDER BY log_id LIMIT :batch
+            """), {"cutoff": cutoff, "batch": RETENTION_BATCH_SIZE}).scalars().all()
+            if not ids:
+                return deleted
+            conn.execute(text("""
+                DELETE FROM prediction_logs
+                WHERE log_id >= :first AND log_id <= :last AND prediction_timestamp < :cutoff
+            """), {"first": ids[0], "last": ids[-1], "cutoff": cutoff})
+        deleted += len(ids)
+
+
+def apply_retention(retention_days=PREDICTION_LOG_RETENTION_DAYS, now=None):
+    """Drop raw rows past the retention window that are already rolled up."""
+    with engine.connect() as conn:
+        now = now or _db_now(conn)
+        rolled_until = rolled_up_until(conn)
+
+    if rolled_until is None:
+        return 0
+    cutoff = min(now - datetime.timedelta(days=retention_days), rolled_until)
+
+    if engine.dialect.name == "mysql":
+        with engine.begin() as conn:
+            bounds = _partition_bounds(conn)
+            if bounds is not None:
+                _drop_partitions(conn, bounds, cutoff)
+                _add_partitions(conn, _partition_bounds(conn), now.date())
+
+    # Partitions only go a day at a time: rows of the cutoff's own day go by DELETE
+    deleted = _delete_batches(cutoff)
+    if deleted:
+        logger.info(f"Deleted {deleted} prediction logs before {cutoff}")
+    return deleted
+
+
+def maintain(retention_days=PREDICTION_LOG_RETENTION_DAYS):
+    ensure_tables()
+    start = time.perf_counter()
+    hours = rollup()
+    deleted = apply_retention(retention_days)
+    logger.info(
+        f"Prediction log maintenance: {hours} hourly rollups, {deleted} rows deleted "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return hours, deleted
+
+
+# --- Monitoring reads -----------------------------------------------------
+
+def prediction_summary(hours=24, model_version=None):
+    """Request, latency, risk and per-feature summary of the last ``hours`` finished hours."""
+    _create_rollup_tables()
+
+    with engine.connect() as conn:
+        since = _floor_hour(_db_now(conn)) - hours * HOUR
+        query = select(PredictionLogHourly).where(PredictionLogHourly.hour_start >= since)
+        feature_query = select(PredictionFeatureHourly).where(PredictionFeatureHourly.hour_start >= since)
+        if model_version is not None:
+            query = query.where(PredictionLogHourly.model_version == str(model_version))
+            feature_query = feature_query.where(
+                PredictionFeatureHourly.model_version == str(model_version)
+            )
+        hourly = pd.read_sql(query, conn)
+        features = pd.read_sql(feature_query, conn)
+
+    requests = int(hourly["request_count"].sum())
+    if requests == 0:
+        return {"hours": hours, "requests": 0}
+
+    summary = {
+        "hours": hours,
+        "requests": requests,
+        "cache_hit_rate": hourly["cache_hits"].sum() / requests,
+        "anomaly_rate": hourly["anomaly_count"].sum() / requests,
+        "mean_warranty_probability": hourly["warranty_probability_sum"].sum() / requests,
+        "risk_mix": {
+            level: hourly[f"risk_{level.lower()}"].sum() / requests for level in RISK_LEVELS
+        },
+        # Percentiles do not merge across hours: report the worst hour
+        "latency_ms": {
+            "mean": hourly["latency_sum_ms"].sum() / requests,
+            "worst_hour_p50": hourly["latency_p50_ms"].max(),
+            "worst_hour_p95": hourly["latency_p95_ms"].max(),
+            "worst_hour_p99": hourly["latency_p99_ms"].max(),
+            "max": hourly["latency_max_ms"].max()
+        },
+        "features": {}
+    }
+
+    sums = features.groupby("feature_name").agg(
+        count=("count", "sum"),
+        value_sum=("value_sum", "sum"),
+        value_sum_sq=("value_sum_sq", "sum"),
+        min_value=("min_value", "min"),
+        max_value=("max_value", "max")
+    )
+    for name, row in sums.iterrows():
+        mean = row["value_sum"] / row["count"]
+        variance = max(row["value_sum_sq"] / row["count"] - mean ** 2, 0.0)
+        summary["features"][name] = {
+            "count": int(row["count"]),
+            "mean": mean,
+            "std": variance ** 0.5,
+            "min": row["min_value"],
+            "max": row["max_value"]
+        }
+
+    # numpy scalars -> plain floats for JSON
+    return json.loads(json.dumps(summary, default=float))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up and expire prediction_logs")
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=PREDICTION_LOG_RETENTION_DAYS,
+        help="Days of raw prediction logs to keep"
+    )
+    parser.add_argument(
+        "--every",
+        type=float,
+        default=0,
+        help="Repeat every N seconds instead of running once"
+    )
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="Partition prediction_logs by day first (MySQL, one-off)"
+    )
+    args = parser.parse_args()
+
+    if args.partition:
+        partition_table(args.retention_days)
+
+    while True:
+        maintain(args.retention_days)
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -1,32 +1,350 @@
-from ml.train_supervised import train as train_model
-from ml.drift_monitor import detect_drift
+import argparse
+import copy
+import datetime
+import os
+import time
+
+import mlflow.sklearn
+import numpy as np
+import pandas as pd
 from mlflow.tracking import MlflowClient
+from sklearn.metrics import roc_auc_score
+from sklearn.pipeline import Pipeline
+from sqlalchemy import text
+
+from database.session import engine
+
+from ml.train_supervised import (
+    build_classifier,
+    hash_vehicle_ids,
+    load_training_ids,
+    log_run,
+    promote,
+    split_train_test,
+    vehicle_id_hashes
+)
+from ml.drift_monitor import detect_drift
+from ml.utils import build_preprocessor, load_feature_data, production_run_id, split_features
 
 MODEL_NAME = "WarrantyModel"
 
-def retrain_if_needed():
+# warm_start: add trees fitted on the recent window to the production forest
+# window:     refit preprocessor and forest on the recent window only
+# full:       refit on every row (the original behaviour)
+RETRAIN_MODE = os.getenv("RETRAIN_MODE", "warm_start")
+# Most recent vehicle_features rows (by snapshot time) used by warm_start / window
+RETRAIN_WINDOW_ROWS = int(os.getenv("RETRAIN_WINDOW_ROWS", "50000"))
+# Trees added per warm-start retrain
+RETRAIN_ADD_TREES = int(os.getenv("RETRAIN_ADD_TREES", "25"))
+# Oldest trees are dropped beyond this, so the forest slides with the data
+RETRAIN_MAX_TREES = int(os.getenv("RETRAIN_MAX_TREES", "200"))
+
+RETRAIN_MODES = ("warm_start", "window", "full")
+# Alias given to a retrained candidate that beats production offline when
+# REQUIRE_SHADOW_PROMOTION is set; it is shadow-scored by the API and
+# promoted by promote_challenger()
+CHALLENGER_ALIAS = "challenger"
+# Off: a candidate with a better held-out AUC goes straight to production.
+# On: it becomes the challenger and needs the API's shadow scoring
+# (SHADOW_FRACTION > 0) before promote_challenger() moves production.
+REQUIRE_SHADOW_PROMOTION = os.getenv("REQUIRE_SHADOW_PROMOTION", "0") == "1"
+# promote_challenger(): shadow-scored rows needed against the current
+# production version, and the largest share of them allowed a different risk level
+PROMOTE_MIN_SHADOW_ROWS = int(os.getenv("PROMOTE_MIN_SHADOW_ROWS", "1000"))
+PROMOTE_MAX_RISK_DISAGREEMENT = float(os.getenv("PROMOTE_MAX_RISK_DISAGREEMENT", "0.1"))
+# Share of the rows held out to compare candidate and production: the
+# newest rows production was not trained on
+HOLDOUT_FRACTION = 0.2
+
+
+def load_production_model():
+    """Production sklearn pipeline, or None when no version has the alias yet."""
+    try:
+        return mlflow.sklearn.load_model(f"models:/{MODEL_NAME}@production")
+    except Exception as e:
+        print("No production model to start from:", e)
+        return None
+
+
+def recent_window(df, rows=RETRAIN_WINDOW_ROWS):
+    """The ``rows`` most recently built rows of a vehicle_features frame."""
+    if rows is None or len(df) <= rows:
+        return df
+    return df.sort_values("feature_snapshot_timestamp", kind="stable").tail(rows)
+
+
+def production_training(production_run):
+    """
+    (training id hashes, run start time) of the production run; the ids are
+    None for runs that did not log them.
+    """
+    if production_run is None:
+        return None, None
+    run = MlflowClient().get_run(production_run)
+    # Local time, like the database's CURRENT_TIMESTAMP snapshot times
+    started = datetime.datetime.fromtimestamp(run.info.start_time / 1000)
+    return load_training_ids(production_run), started
+
+
+def seen_by_production(df, training_ids, started):
+    """
+    Mask of the rows production may have been trained on: its logged
+    training ids, or without them every row built before its run started.
+    None when nothing is known about production.
+    """
+    if training_ids is not None:
+        return np.isin(hash_vehicle_ids(df["vehicle_id"]), training_ids)
+    if started is not None:
+        return (pd.to_datetime(df["feature_snapshot_timestamp"]) <= started).to_numpy()
+    return None
+
+
+def holdout_split(df, seen=None):
+    """
+    X_train, X_test, y_train, y_test. The test slice is the newest
+    HOLDOUT_FRACTION of the rows, taken from rows outside ``seen`` (rows
+    production was trained on, see seen_by_production) so production's AUC
+    is not measured on its own training data. Falls back to the usual random
+    split when that slice is empty or has one class only.
+    """
+    order = np.argsort(df["feature_snapshot_timestamp"].to_numpy(), kind="stable")
+    df = df.iloc[order]
+    unseen = np.flatnonzero(~seen[order]) if seen is not None else np.arange(len(df))
+
+    n_test = min(max(int(len(df) * HOLDOUT_FRACTION), 1), len(unseen))
+    X, y = split_features(df)
+
+    test = np.zeros(len(df), dtype=bool)
+    test[unseen[len(unseen) - n_test:]] = True
+
+    if n_test == 0 or y[test].nunique() < 2:
+        print("Not enough rows unseen by production to hold out; production AUC may be optimistic.")
+        return split_train_test(X, y)
+    return X[~test], X[test], y[~test], y[test]
+
+
+def warm_start(production, X_train, y_train, add_trees=RETRAIN_ADD_TREES, max_trees=RETRAIN_MAX_TREES):
+    """
+    Copy of the production pipeline with ``add_trees`` more trees fitted on
+    X_train. The fitted preprocessor is kept as is, since the existing trees
+    split on its output.
+    """
+    pipeline = copy.deepcopy(production)
+    preprocessor = pipeline.named_steps["preprocessor"]
+    clf = pipeline.named_steps["classifier"]
+
+    clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + add_trees)
+    clf.fit(preprocessor.transform(X_train), y_train)
+
+    # Keep the newest trees only
+    if max_trees and len(clf.estimators_) > max_trees:
+        clf.estimators_ = clf.estimators_[-max_trees:]
+    clf.set_params(warm_start=False, n_estimators=len(clf.estimators_))
+
+    return pipeline
+
+
+def refit(X_train, y_train, n_jobs=None):
+    pipeline = Pipeline([
+        ("preprocessor", build_preprocessor(X_train)),
+        ("classifier", build_classifier(n_jobs)),
+    ])
+    pipeline.fit(X_train, y_train)
+    return pipeline
+
+
+def retrain(mode=RETRAIN_MODE, window_rows=RETRAIN_WINDOW_ROWS):
+    """
+    Fit a candidate in ``mode`` and register it. If it beats production on
+    the same held-out slice it gets the challenger alias, to be shadow-scored
+    on live traffic and promoted by promote_challenger(); with no production
+    model yet it is promoted directly. Returns (candidate AUC, production
+    AUC or None, challenger / promoted version or None).
+    """
+    if mode not in RETRAIN_MODES:
+        raise ValueError(f"Unknown retrain mode {mode!r}, expected one of {RETRAIN_MODES}")
+
+    timings = {}
+    total_start = time.perf_counter()
+
+    start = time.perf_counter()
+    production = load_production_model()
+    if production is None and mode == "warm_start":
+        mode = "full"
+
+    production_ids, production_started = production_training(
+        production_run_id() if production is not None else None
+    )
 
-    if not detect_drift():
+    df = load_feature_data().dropna()
+    if mode != "full":
+        df = recent_window(df, window_rows)
+    # Held-out slice scored by both candidate and production
+    X_train, X_test, y_train, y_test = holdout_split(
+        df, seen_by_production(df, production_ids, production_started)
+    )
+    timings["load_data"] = time.perf_counter() - start
+
+    training_ids = vehicle_id_hashes(df.loc[X_train.index, "vehicle_id"])
+
+    start = time.perf_counter()
+    if mode == "warm_start":
+        candidate = warm_start(production, X_train, y_train)
+        # The production trees stay: so does what they were trained on
+        if production_ids is not None:
+            training_ids = np.union1d(training_ids, production_ids)
+    else:
+        candidate = refit(X_train, y_train)
+    timings["fit"] = time.perf_counter() - start
+
+    prod_auc = None
+    if production is not None:
+        prod_auc = roc_auc_score(y_test, production.predict_proba(X_test)[:, 1])
+
+    params = {"retrain_mode": mode, "retrain_rows": len(df)}
+    if prod_auc is not None:
+        # Read back by promote_challenger()
+        params["production_roc_auc"] = prod_auc
+
+    timings["total"] = time.perf_counter() - total_start
+    new_auc, version = log_run(
+        candidate, X_train, X_test, y_train, y_test, timings,
+        promote_model=False,
+        params=params,
+        training_ids=training_ids
+    )
+
+    prod_text = "none" if prod_auc is None else f"{prod_auc:.4f}"
+    print(
+        f"Retrained ({mode}, {len(df)} rows) in {timings['total']:.1f}s: "
+        f"candidate AUC {new_auc:.4f} vs production {prod_text}"
+    )
+
+    return new_auc, prod_auc, promote_candidate(version, new_auc, prod_auc)
+
+
+def promote_candidate(version, new_auc, prod_auc, require_shadow=REQUIRE_SHADOW_PROMOTION):
+    """
+    Promote a registered candidate that beats production on the held-out
+    AUC, or any candidate when there is no production model. With
+    ``require_shadow`` a candidate that has a production model to be
+    compared with gets the challenger alias instead. Returns the version
+    given an alias, or None.
+    """
+    if prod_auc is not None and new_auc <= prod_auc:
+        print("New model worse. Not promoted.")
+        return None
+
+    if require_shadow and prod_auc is not None:
+        if promote(version, alias=CHALLENGER_ALIAS):
+            print("New model is the challenger; promote it with promote_challenger() once shadow-scored.")
+            return version
+        return None
+
+    if promote(version):
+        print("New model promoted to production.")
+        return version
+    return None
+
+
+def shadow_agreement(challenger_version, production_version):
+    """
+    Rows of shadow_prediction_logs comparing the two warranty model
+    versions: {"scored", "risk_disagreement_rate", "mean_abs_probability_diff"}.
+    """
+    query = text("""
+        SELECT COUNT(*) AS scored,
+               SUM(CASE WHEN risk_level <> challenger_risk_level THEN 1 ELSE 0 END) AS risk_disagreements,
+               AVG(ABS(challenger_probability - warranty_probability)) AS mean_abs_diff
+        FROM shadow_prediction_logs
+        WHERE challenger_version = :challenger AND production_version = :production
+    """)
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                query, {"challenger": str(challenger_version), "production": str(production_version)}
+            ).one()
+    except Exception as e:
+        print("Could not read shadow_prediction_logs:", e)
+        return {"scored": 0, "risk_disagreement_rate": None, "mean_abs_probability_diff": None}
+
+    scored = int(row.scored or 0)
+    return {
+        "scored": scored,
+        "risk_disagreement_rate": int(row.risk_disagreements or 0) / scored if scored else None,
+        "mean_abs_probability_diff": None if row.mean_abs_diff is None else float(row.mean_abs_diff)
+    }
+
+
+def promote_challenger(min_rows=PROMOTE_MIN_SHADOW_ROWS, max_risk_disagreement=PROMOTE_MAX_RISK_DISAGREEMENT):
+    """
+    Move the production alias to the challenger once it has been
+    shadow-scored on at least ``min_rows`` live rows against the current
+    production version and its risk levels differ on at most
+    ``max_risk_disagreement`` of them. Returns the promoted version or None.
+    """
+    client = MlflowClient()
+    try:
+        challenger = client.get_model_version_by_alias(MODEL_NAME, CHALLENGER_ALIAS)
+    except Exception as e:
+        print("No challenger to promote:", e)
+        return None
+    try:
+        production = client.get_model_version_by_alias(MODEL_NAME, "production")
+    except Exception:
+        production = None
+
+    if production is not None:
+        if production.version == challenger.version:
+            print(f"Challenger version {challenger.version} is already in production.")
+            return None
+
+        stats = shadow_agreement(challenger.version, production.version)
+        print(f"Shadow comparison of v{challenger.version} with v{production.version}: {stats}")
+
+        if stats["scored"] < min_rows:
+            print(f"Only {stats['scored']} shadow-scored rows (need {min_rows}). Not promoted.")
+            return None
+        if stats["risk_disagreement_rate"] > max_risk_disagreement:
+            print(
+                f"Risk levels differ on {stats['risk_disagreement_rate']:.1%} of rows "
+                f"(limit {max_risk_disagreement:.1%}). Not promoted."
+            )
+            return None
+
+    if promote(challenger.version):
+        print("Challenger promoted to production.")
+        return challenger.version
+    return None
+
+
+def retrain_if_needed(mode=RETRAIN_MODE):
+
+    report = detect_drift()
+
+    if not report["drift_detected"]:
         print("No drift detected. Skipping retrain.")
         return
 
-    print("Drift detected. Retraining model...")
+    drifted = [f for f, r in report["features"].items() if r["drift"]]
+    print(f"Drift detected in {drifted}. Retraining model...")
 
-    new_auc = train_model()
+    return retrain(mode)
 
-    client = MlflowClient()
 
-    # Get production version
-    mv = client.get_model_version_by_alias(MODEL_NAME, "production")
-    prod_run = client.get_run(mv.run_id)
-    prod_auc = prod_run.data.metrics.get("roc_auc")
-
-    if new_auc > prod_auc:
-        client.set_registered_model_alias(
-            name=MODEL_NAME,
-            alias="production",
-            version=mv.version
-        )
-        print("New model promoted to production.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain the warranty model and promote challengers")
+    parser.add_argument("--mode", choices=RETRAIN_MODES, default=RETRAIN_MODE, help="Retrain mode")
+    parser.add_argument("--if-drift", action="store_true", help="Retrain only when drift is detected")
+    parser.add_argument(
+        "--promote", action="store_true",
+        help="Do not retrain; promote the challenger if its shadow results pass"
+    )
+    args = parser.parse_args()
+
+    if args.promote:
+        promote_challenger()
+    elif args.if_drift:
+        retrain_if_needed(args.mode)
     else:
-        print("New model worse. Not promoted.")
\ No newline at end of file
+        retrain(args.mode)
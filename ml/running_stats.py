@@ -0,0 +1,340 @@
+# ml/running_stats.py
+
+"""
+Mergeable streaming statistics for live feature monitoring.
+
+Served payloads are folded into per-feature RunningStats (Welford/Chan
+mean and variance) and QuantileSketch (relative-error log buckets), kept
+per time bucket by LiveStatsAggregator and written to
+feature_stats_buckets. A drift check merges the stored buckets, so its
+cost depends on the number of buckets, not on the traffic.
+"""
+
+import datetime
+import json
+import math
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from database.models import FeatureStatsBucket
+from ml.utils import bin_counts
+from utils.logger import logger
+
+
+class RunningStats:
+    """Count, mean, sum of squared deviations (M2), min and max."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min_value=math.inf, max_value=-math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min_value
+        self.max = max_value
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        batch_mean = values.mean()
+        self._combine(
+            len(values),
+            batch_mean,
+            float(((values - batch_mean) ** 2).sum()),
+            float(values.min()),
+            float(values.max())
+        )
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, count, mean, m2, min_value, max_value):
+        # Chan et al. parallel update
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, min_value)
+        self.max = max(self.max, max_value)
+
+    @property
+    def variance(self):
+        # Sample variance, as pandas .std() / .var()
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else float("nan")
+
+
+class QuantileSketch:
+    """
+    Relative-error quantile sketch (DDSketch-style log buckets).
+
+    Every value lands in bucket ceil(log_gamma(|x|)) with its sign; any
+    quantile is returned within ``relative_accuracy`` of the true value.
+    Two sketches with the same accuracy merge by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_indexable=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_indexable = min_indexable
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.positive = defaultdict(int)
+        self.negative = defaultdict(int)
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.positive.values()) + sum(self.negative.values())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+
+        small = np.abs(values) < self.min_indexable
+        self.zero_count += int(small.sum())
+
+        for store, part in ((self.positive, values[values >= self.min_indexable]),
+                            (self.negative, -values[values <= -self.min_indexable])):
+            if len(part) == 0:
+                continue
+            keys, counts = np.unique(np.ceil(np.log(part) / self._log_gamma).astype(int), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                store[key] += count
+
+    def merge(self, other):
+        for key, count in other.positive.items():
+            self.positive[key] += count
+        for key, count in other.negative.items():
+            self.negative[key] += count
+        self.zero_count += other.zero_count
+
+    def _buckets(self):
+        """Representative values and counts, sorted ascending."""
+        neg_keys = sorted(self.negative, reverse=True)
+        pos_keys = sorted(self.positive)
+
+        values = (
+            [-self._value(k) for k in neg_keys]
+            + ([0.0] if self.zero_count else [])
+            + [self._value(k) for k in pos_keys]
+        )
+        counts = (
+            [self.negative[k] for k in neg_keys]
+            + ([self.zero_count] if self.zero_count else [])
+            + [self.positive[k] for k in pos_keys]
+        )
+        return np.asarray(values, dtype=float), np.asarray(counts, dtype=float)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        values, counts = self._buckets()
+        if len(values) == 0:
+            return float("nan")
+        rank = q * (counts.sum() - 1)
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side="right")])
+
+    def cdf(self, points):
+        """Fraction of values <= each point."""
+        values, counts = self._buckets()
+        points = np.asarray(points, dtype=float)
+        if len(values) == 0:
+            return np.full(points.shape, np.nan)
+        cumulative = np.concatenate([[0.0], np.cumsum(counts)]) / counts.sum()
+        return cumulative[np.searchsorted(values, points, side="right")]
+
+    def to_dict(self):
+        return {
+            "a": self.relative_accuracy,
+            "z": self.zero_count,
+            "p": {str(k): c for k, c in self.positive.items()},
+            "n": {str(k): c for k, c in self.negative.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(relative_accuracy=data["a"])
+        sketch.zero_count = data["z"]
+        sketch.positive.update({int(k): c for k, c in data["p"].items()})
+        sketch.negative.update({int(k): c for k, c in data["n"].items()})
+        return sketch
+
+
+class FeatureStats:
+    """
+    RunningStats and QuantileSketch for one feature, plus exact counts on
+    the training histogram bins when ``edges`` are known.
+    """
+
+    def __init__(self, stats=None, sketch=None, edges=None, bin_counts=None):
+        self.stats = stats or RunningStats()
+        self.sketch = sketch or QuantileSketch()
+        self.edges = edges
+        self.bin_counts = bin_counts
+        if edges is not None and bin_counts is None:
+            self.bin_counts = np.zeros(len(edges) - 1, dtype=np.int64)
+
+    def update(self, values):
+        self.stats.update(values)
+        self.sketch.update(values)
+        if self.edges is not None:
+            self.bin_counts += bin_counts(values, self.edges)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        if other.bin_counts is not None:
+            if self.bin_counts is None:
+                self.bin_counts = other.bin_counts.copy()
+            else:
+                self.bin_counts = self.bin_counts + other.bin_counts
+
+    def summary(self):
+        return {
+            "count": self.stats.count,
+            "mean": self.stats.mean,
+            "std": self.stats.std,
+            "min": self.stats.min,
+            "max": self.stats.max,
+            "p05": self.sketch.quantile(0.05),
+            "p50": self.sketch.quantile(0.50),
+            "p95": self.sketch.quantile(0.95)
+        }
+
+    def to_row(self, bucket_start, feature_name, histogram_run_id=None):
+        return {
+            "bucket_start": bucket_start,
+            "feature_name": feature_name,
+            "count": self.stats.count,
+            "mean": self.stats.mean,
+            "m2": self.stats.m2,
+            "min_value": self.stats.min,
+            "max_value": self.stats.max,
+            "sketch": json.dumps(self.sketch.to_dict()),
+            "histogram_run_id": histogram_run_id if self.bin_counts is not None else None,
+            "bin_counts": json.dumps(self.bin_counts.tolist()) if self.bin_counts is not None else None
+        }
+
+    @classmethod
+    def from_row(cls, row, histogram_run_id=None):
+        stats = RunningStats(row.count, row.mean, row.m2, row.min_value, row.max_value)
+        sketch = QuantileSketch.from_dict(json.loads(row.sketch))
+
+        # Bin counts are only comparable when taken on the same baseline bins
+        bin_counts = None
+        if row.bin_counts and histogram_run_id is not None and row.histogram_run_id == histogram_run_id:
+            bin_counts = np.asarray(json.loads(row.bin_counts), dtype=np.int64)
+
+        return cls(stats, sketch, bin_counts=bin_counts)
+
+
+class LiveStatsAggregator:
+    """
+    Per-feature FeatureStats for the current time bucket.
+
+    update() folds a batch of payload dicts into the bucket for "now";
+    flush() writes every bucket older than the current one (or all of
+    them with ``force=True``) as rows of feature_stats_buckets. Rows are
+    insert-only; several rows for one bucket and feature simply merge.
+    """
+
+    def __init__(self, engine, features, bucket_seconds=300):
+        self.engine = engine
+        self.features = list(features)
+        self.bucket_seconds = bucket_seconds
+
+        # Training histogram bins to count live values on (see set_baseline)
+        self.histogram_run_id = None
+        self.edges = {}
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def set_baseline(self, run_id, histograms):
+        """Count live values on the bins of training run ``run_id`` from now on."""
+        # Close the open buckets so no bucket mixes two sets of bins
+        self.flush(force=True)
+        with self._lock:
+            self.histogram_run_id = run_id
+            self.edges = {f: np.asarray(h[0], dtype=float) for f, h in histograms.items()}
+
+    def _bucket_start(self, now):
+        epoch = int(now.replace(tzinfo=datetime.timezone.utc).timestamp())
+        start = epoch - epoch % self.bucket_seconds
+        return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).replace(tzinfo=None)
+
+    def update(self, payloads, now=None):
+        if not payloads:
+            return
+
+        bucket_start = self._bucket_start(now or datetime.datetime.utcnow())
+
+        with self._lock:
+            bucket = self._buckets.setdefault(
+                bucket_start, {f: FeatureStats(edges=self.edges.get(f)) for f in self.features}
+            )
+            for feature in self.features:
+                bucket[feature].update([p.get(feature, np.nan) for p in payloads])
+
+    def update_from_log_rows(self, rows):
+        """Callback for BufferedLogWriter: fold the written payloads in."""
+        self.update([json.loads(row["request_payload"]) for row in rows])
+        self.flush()
+
+    def flush(self, force=False):
+        current = self._bucket_start(datetime.datetime.utcnow())
+
+        with self._lock:
+            ready = [b for b in self._buckets if force or b < current]
+            closed = {b: self._buckets.pop(b) for b in ready}
+            histogram_run_id = self.histogram_run_id
+
+        rows = [
+            stats.to_row(bucket_start, feature, histogram_run_id)
+            for bucket_start, bucket in closed.items()
+            for feature, stats in bucket.items()
+            if stats.stats.count
+        ]
+        if not rows:
+            return 0
+
+        if not self._table_ready:
+            FeatureStatsBucket.__table__.create(bind=self.engine, checkfirst=True)
+            self._table_ready = True
+
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(FeatureStatsBucket.__table__.insert(), rows)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} feature stat rows: {e}")
+            return 0
+
+        return len(rows)
+
+
+def merge_feature_rows(rows, histogram_run_id=None):
+    """
+    Merge feature_stats_buckets rows into one FeatureStats per feature.
+
+    Bin counts are kept only from rows taken on the bins of
+    ``histogram_run_id``.
+    """
+    merged = {}
+    for row in rows:
+        stats = FeatureStats.from_row(row, histogram_run_id)
+        if row.feature_name in merged:
+            merged[row.feature_name].merge(stats)
+        else:
+            merged[row.feature_name] = stats
+    return merged
@@ -1,103 +1,67 @@
+import time
+
 import mlflow
 import mlflow.sklearn
 from mlflow.tracking import MlflowClient
 from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
-from ml.utils import load_feature_data
-import numpy as np
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import PowerTransformer, FunctionTransformer, OneHotEncoder
-from pandas.api.types import is_numeric_dtype
+from ml.compact_model import export_compact
+from ml.utils import load_feature_data, split_features, build_preprocessor, serving_frame
 from mlflow.models import infer_signature
 
 MODEL_NAME = "AnomalyModel"
 
+CONTAMINATION = 0.05
 
-def train():
-
-    mlflow.set_tracking_uri("file:./mlruns")
-    mlflow.set_experiment("Anomaly_Detection")
-
-    df = load_feature_data().dropna()
-
-    X = df.drop(["vehicle_id", "warranty_flag", "feature_snapshot_timestamp" , "data_version"], axis=1)
-    yj_cols = []
-    log_cols = []
-
-    for col in X.columns:
-        # Only consider numeric columns for transformations that expect numbers
-        if not is_numeric_dtype(X[col]):
-            # leave non-numeric columns out of numeric pipelines; they will be
-            # passed through by the ColumnTransformer remainder
-            continue
-
-        if (
-            X[col].max() < 1e6 and
-            X[col].skew() < 2 and
-            X[col].nunique() > 10
-        ):
-            yj_cols.append(col)
-        else:
-            log_cols.append(col)
-
-    def clip_function(x):
-        return np.clip(x, -0.999, None)
-
-    numeric_log_pipe = Pipeline([
-            ("clip", FunctionTransformer(clip_function, validate=False)),
-                ("log", FunctionTransformer(np.log1p, validate=False))
-                ])
-
-    numeric_yj_pipe = Pipeline([
-        ( "power", PowerTransformer(method="yeo-johnson"))])
-
-    with mlflow.start_run():
-
-        contamination = 0.05
-
-        model = IsolationForest(
-            n_estimators=100,
-            contamination=contamination,
-            random_state=42
-        )
-
-         # Preprocessor + classifier pipeline so we can fit/predict and log the
-        # whole pipeline via MLflow.
-        # Identify categorical (non-numeric) columns to encode
-        cat_cols = [c for c in X.columns if not is_numeric_dtype(X[c])]
-
-        transformers = [
-            ("num_log", numeric_log_pipe, log_cols),
-            ("num_yj", numeric_yj_pipe, yj_cols),
-        ]
 
-        if cat_cols:
-            transformers.append(("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols))
+def build_anomaly_model(n_jobs=None):
+    return IsolationForest(
+        n_estimators=100,
+        contamination=CONTAMINATION,
+        random_state=42,
+        n_jobs=n_jobs
+    )
 
-        preprocessor = ColumnTransformer(transformers=transformers, remainder="passthrough")
 
+def log_run(pipeline, X, timings=None):
+    """
+    Log a fitted pipeline to MLflow, register it and point the production
+    alias at the new version. ``timings`` ({stage: seconds}) are logged as
+    time_<stage>_s metrics.
+    """
 
-        pipeline = Pipeline([
-            ("preprocessor", preprocessor),
-            ("model", model)
-        ])
+    mlflow.set_tracking_uri("file:./mlruns")
+    mlflow.set_experiment("Anomaly_Detection")
 
-        pipeline.fit(X)
+    with mlflow.start_run():
 
-        mlflow.log_param("contamination", contamination)
+        model = pipeline.named_steps["model"]
+        mlflow.log_param("contamination", model.contamination)
         mlflow.log_param("model_type", "IsolationForest")
+        mlflow.log_param("n_jobs", model.n_jobs)
+        # Fit-time parallelism only, see ml.train_supervised.log_run
+        model.set_params(n_jobs=None)
+
+        if timings:
+            mlflow.log_metrics({f"time_{stage}_s": seconds for stage, seconds in timings.items()})
 
-        signature = infer_signature(X, pipeline.predict(X))
+        serving_X = serving_frame(X)
+        signature = infer_signature(serving_X, pipeline.predict(X))
 
         mlflow.sklearn.log_model(
             pipeline,
             artifact_path="model",
             registered_model_name=MODEL_NAME,
             signature=signature,
-            input_example=X.head(5)
+            input_example=serving_X.head(5)
         )
 
+        # Array-backed copy of the ensemble, compared against the pickle
+        try:
+            export_compact(pipeline, X)
+        except Exception as e:
+            print("Warning: could not export compact model:", e)
+
         client = MlflowClient()
 
         # Get all versions
@@ -115,5 +79,26 @@ def train():
         print(f"Anomaly model version {latest_version.version} promoted to Production.")
 
 
+def train(n_jobs=None):
+
+    timings = {}
+
+    start = time.perf_counter()
+    df = load_feature_data().dropna()
+    X, _ = split_features(df)
+    timings["load_data"] = time.perf_counter() - start
+
+    pipeline = Pipeline([
+        ("preprocessor", build_preprocessor(X)),
+        ("model", build_anomaly_model(n_jobs))
+    ])
+
+    start = time.perf_counter()
+    pipeline.fit(X)
+    timings["fit"] = time.perf_counter() - start
+
+    log_run(pipeline, X, timings)
+
+
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    train()
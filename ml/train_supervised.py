@@ -1,120 +1,108 @@
+import os
+import tempfile
+import time
+
 import mlflow
+import mlflow.artifacts
 import mlflow.sklearn
 from mlflow.tracking import MlflowClient
+import numpy as np
+import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score, precision_score, recall_score
-from sklearn.impute import SimpleImputer
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import PowerTransformer
-from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
 from sklearn.pipeline import Pipeline
-from ml.utils import load_feature_data
-from pandas.api.types import is_numeric_dtype
-import numpy as np
+from ml.compact_model import export_compact
+from ml.utils import (
+    load_feature_data,
+    split_features,
+    serving_frame,
+    build_preprocessor,
+    baseline_histograms,
+    save_baseline_histograms
+)
 from mlflow.models import infer_signature
 
 MODEL_NAME = "WarrantyModel"
 
+# Hashes of the vehicle ids a run was trained on, so a later retrain can
+# compare against production on rows production has not seen
+TRAINING_IDS_ARTIFACT = "training_vehicle_ids.npy"
 
-def train():
-
-    mlflow.set_tracking_uri("file:./mlruns")
-    mlflow.set_experiment("Warranty_Prediction")
-
-    df = load_feature_data().dropna()
-
-    X = df.drop(["vehicle_id", "warranty_flag", "feature_snapshot_timestamp" , "data_version"], axis=1)
-    y = df["warranty_flag"]
-
-    yj_cols = []
-    log_cols = []
+# Training hyperparameters
+PARAMS = {
+    "n_estimators": 100,
+    "random_state": 42,
+    "max_samples": 0.5,
+    "max_features": 0.75,
+    "max_depth": 15,
+    "class_weight": "balanced"
+}
 
-    for col in X.columns:
-        # Only consider numeric columns for transformations that expect numbers
-        if not is_numeric_dtype(X[col]):
-            # leave non-numeric columns out of numeric pipelines; they will be
-            # passed through by the ColumnTransformer remainder
-            continue
 
-        if (
-            X[col].max() < 1e6 and
-            X[col].skew() < 2 and
-            X[col].nunique() > 10
-        ):
-            yj_cols.append(col)
-        else:
-            log_cols.append(col)
+def build_classifier(n_jobs=None):
+    return RandomForestClassifier(n_jobs=n_jobs, **PARAMS)
 
-    def clip_function(x):
-        return np.clip(x, -0.999, None)
 
-    numeric_log_pipe = Pipeline([
-            ("clip", FunctionTransformer(clip_function, validate=False)),
-                ("log", FunctionTransformer(np.log1p, validate=False))
-                ])
+def split_train_test(X, y):
+    return train_test_split(X, y, test_size=0.2, random_state=42)
 
-    numeric_yj_pipe = Pipeline([
-        ( "power", PowerTransformer(method="yeo-johnson"))])
 
+def hash_vehicle_ids(vehicle_ids):
+    """64-bit hash of each vehicle id."""
+    return pd.util.hash_array(np.asarray(vehicle_ids, dtype=object))
 
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42)
+def vehicle_id_hashes(vehicle_ids):
+    """Sorted unique hashes of vehicle ids, as logged in TRAINING_IDS_ARTIFACT."""
+    return np.unique(hash_vehicle_ids(vehicle_ids))
 
-    baseline_stats = {}
 
-    for col in X_train.columns:
-        baseline_stats[col] = {
-        "mean": float(X_train[col].mean()),
-        "std": float(X_train[col].std())
-    }
-    
+def load_training_ids(run_id):
+    """Training vehicle id hashes logged by run ``run_id``, or None."""
+    try:
+        path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=TRAINING_IDS_ARTIFACT)
+    except Exception as e:
+        print(f"No training ids logged by run {run_id}:", e)
+        return None
+    return np.load(path)
 
-    
-    with mlflow.start_run() as run:
 
-        # Training hyperparameters
-        n_estimators = 100
-        random_state = 42
-        max_samples = 0.5
-        max_features = 0.75
-        max_depth = 15
-        class_weight = "balanced"
-
-        # Build classifier
-        clf = RandomForestClassifier(
-            n_estimators=n_estimators,
-            random_state=random_state,
-            max_samples=max_samples,
-            max_features=max_features,
-            max_depth=max_depth,
-            class_weight=class_weight,
+def promote(version, alias="production"):
+    """Point ``alias`` at ``version``; returns whether it moved."""
+    client = MlflowClient()
+    try:
+        # Note: transitioning stages may raise errors on some MLflow setups
+        # (file store YAML serialization). Catch and warn rather than fail.
+        client.set_registered_model_alias(
+            name=MODEL_NAME,
+            alias=alias,
+            version=version
         )
+        print(f"Model version {version} promoted to {alias}.")
+        return True
+    except Exception as e:
+        print("Warning: could not transition model version stage:", e)
+        print(f"Model version {version} registered (no stage transition).")
+        return False
+
+
+def log_run(full_pipeline, X_train, X_test, y_train, y_test, timings=None, promote_model=True, params=None,
+            training_ids=None):
+    """
+    Evaluate a fitted pipeline, log it to MLflow and register it; unless
+    ``promote_model`` is False, point the production alias at the new
+    version. ``timings`` ({stage: seconds}) are logged as time_<stage>_s
+    metrics, ``params`` as extra run parameters and ``training_ids``
+    (vehicle_id_hashes of the training rows) as TRAINING_IDS_ARTIFACT.
+    Returns the test ROC AUC and the registered version.
+    """
 
-        # Preprocessor + classifier pipeline so we can fit/predict and log the
-        # whole pipeline via MLflow.
-        # Identify categorical (non-numeric) columns to encode
-        cat_cols = [c for c in X.columns if not is_numeric_dtype(X[c])]
-
-        transformers = [
-            ("num_log", numeric_log_pipe, log_cols),
-            ("num_yj", numeric_yj_pipe, yj_cols),
-        ]
-
-        if cat_cols:
-            transformers.append(("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols))
-
-        preprocessor = ColumnTransformer(transformers=transformers, remainder="passthrough")
+    mlflow.set_tracking_uri("file:./mlruns")
+    mlflow.set_experiment("Warranty_Prediction")
 
-        full_pipeline = Pipeline([
-            ("preprocessor", preprocessor),
-            ("classifier", clf),
-        ])
+    with mlflow.start_run() as run:
 
-        # Fit and predict using the full pipeline
-        full_pipeline.fit(X_train, y_train)
         y_pred = full_pipeline.predict(X_test)
         # predict_proba on the classifier step
         y_prob = full_pipeline.predict_proba(X_test)[:, 1]
@@ -124,51 +112,97 @@ def train():
         recall = recall_score(y_test, y_pred)
 
         # Log parameters
-        mlflow.log_param("n_estimators", n_estimators)
-        mlflow.log_param("class_weight", class_weight)
-        mlflow.log_param("max_samples", max_samples)
-        mlflow.log_param("max_features", max_features)
-        mlflow.log_param("max_depth", max_depth)
-        
+        clf = full_pipeline.named_steps["classifier"]
+        mlflow.log_param("n_estimators", clf.n_estimators)
+        mlflow.log_param("class_weight", clf.class_weight)
+        mlflow.log_param("max_samples", clf.max_samples)
+        mlflow.log_param("max_features", clf.max_features)
+        mlflow.log_param("max_depth", clf.max_depth)
+        mlflow.log_param("n_jobs", clf.n_jobs)
+        # Fit-time parallelism only; a served model should not start a thread
+        # per core on every predict call
+        clf.set_params(n_jobs=None)
 
         # Log metrics
         mlflow.log_metric("roc_auc", auc)
         mlflow.log_metric("precision", precision)
         mlflow.log_metric("recall", recall)
 
-        signature = infer_signature(X_train, full_pipeline.predict(X_train))
+        if params:
+            mlflow.log_params(params)
+
+        if timings:
+            mlflow.log_metrics({f"time_{stage}_s": seconds for stage, seconds in timings.items()})
+
+        # Fixed-bin training histograms for distribution-level drift checks
+        histograms = baseline_histograms(X_train)
+        mlflow.log_dict(histograms, "baseline_histograms.json")
+        # Stored for every run; drift checks read those of the production run
+        save_baseline_histograms(histograms, run.info.run_id)
+
+        if training_ids is not None:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, TRAINING_IDS_ARTIFACT)
+                np.save(path, training_ids)
+                mlflow.log_artifact(path)
+
+        serving_X = serving_frame(X_train)
+        signature = infer_signature(serving_X, full_pipeline.predict(X_train))
 
         # Register model
-        mlflow.sklearn.log_model(
+        model_info = mlflow.sklearn.log_model(
             full_pipeline,
             artifact_path="model",
             registered_model_name=MODEL_NAME,
             signature=signature,
-            input_example=X_train.head(5)
+            input_example=serving_X.head(5)
         )
 
+        # Array-backed copy of the ensemble, compared against the pickle on the test set
+        try:
+            export_compact(full_pipeline, X_test, y_test)
+        except Exception as e:
+            print("Warning: could not export compact model:", e)
+
         print(f"ROC AUC: {auc}")
 
-        client = MlflowClient()
-        # Get all versions
-        versions = client.search_model_versions(f"name='{MODEL_NAME}'")
+        # The version this run registered, even if another run registered one since
+        version = model_info.registered_model_version
 
-        # Get highest version number
-        latest_version = max(versions, key=lambda v: int(v.version))
+        if promote_model:
+            promote(version)
 
-        try:
-            # Note: transitioning stages may raise errors on some MLflow setups
-            # (file store YAML serialization). Catch and warn rather than fail.
-           client.set_registered_model_alias(
-                    name=MODEL_NAME,
-                    alias="production",
-                    version=latest_version.version
-                )
-           print(f"Model version {latest_version.version} promoted to Production.")
-        except Exception as e:
-            print("Warning: could not transition model version stage:", e)
-            print(f"Model version {latest_version.version} registered (no stage transition).")
+    return auc, version
+
+
+def train(n_jobs=None):
+
+    timings = {}
+
+    start = time.perf_counter()
+    df = load_feature_data().dropna()
+    X, y = split_features(df)
+    timings["load_data"] = time.perf_counter() - start
+
+    X_train, X_test, y_train, y_test = split_train_test(X, y)
+
+    # Preprocessor + classifier pipeline so we can fit/predict and log the
+    # whole pipeline via MLflow.
+    full_pipeline = Pipeline([
+        ("preprocessor", build_preprocessor(X)),
+        ("classifier", build_classifier(n_jobs)),
+    ])
+
+    start = time.perf_counter()
+    full_pipeline.fit(X_train, y_train)
+    timings["fit"] = time.perf_counter() - start
+
+    auc, _ = log_run(
+        full_pipeline, X_train, X_test, y_train, y_test, timings,
+        training_ids=vehicle_id_hashes(df.loc[X_train.index, "vehicle_id"])
+    )
+    return auc
 
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    train()
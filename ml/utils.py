@@ -1,24 +1,364 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
-from database.session import DATABASE_URL
+from pandas.api.types import is_bool_dtype, is_integer_dtype, is_numeric_dtype
+from sqlalchemy import select, text
+from database.session import engine
+from database.models import FeatureBaselineHistogram
+from utils.logger import logger
+
+# Bins per feature in the stored baseline histograms
+HISTOGRAM_BINS = 20
+
+# Local columnar snapshots of vehicle_features
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", ".feature_cache")
+# Rows per chunk when streaming vehicle_features
+FEATURE_CHUNK_SIZE = int(os.getenv("FEATURE_CHUNK_SIZE", "50000"))
+
+# vehicle_features columns that are not model inputs
+NON_FEATURE_COLUMNS = ["vehicle_id", "warranty_flag", "feature_snapshot_timestamp", "data_version"]
+
+FEATURE_DTYPES = {
+    "total_error_count": "int16",
+    "avg_cycle_time": "float32",
+    "cycle_time_variance": "float32",
+    "rework_ratio": "float32",
+    "vendor_defect_ratio": "float32",
+    "avg_torque": "float32",
+    "torque_deviation": "float32",
+    "warranty_flag": "bool"
+}
+
 
+def _apply_dtypes(df):
+    for col, dtype in FEATURE_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype != "float32" and df[col].isna().any():
+            # NULLs cannot live in int/bool columns; keep them as NaN
+            df[col] = df[col].astype("float32")
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
 
-def load_feature_data(data_version=None):
+
+def _table_watermark(conn):
+    """
+    Latest finished feature build run, or None when vehicle_features has no
+    recorded builds (then nothing is cached). Every rebuild, full or
+    incremental, records a run, so a new run_id means new table contents.
+    """
+    try:
+        return conn.execute(text(
+            "SELECT MAX(run_id) FROM feature_build_runs WHERE finished_at IS NOT NULL"
+        )).scalar()
+    except Exception as e:
+        logger.warning(f"Could not read feature_build_runs: {e}")
+        conn.rollback()
+        return None
+
+
+def _cache_prefix(data_version):
+    key = hashlib.sha1(str(data_version).encode()).hexdigest()[:12]
+    return os.path.join(FEATURE_CACHE_DIR, f"vehicle_features-{key}-")
+
+
+def _cache_path(data_version, watermark):
+    return f"{_cache_prefix(data_version)}{watermark}"
+
+
+def _remove_stale_caches(data_version, keep):
+    # Older snapshots of the same data_version; in-progress .tmp- dirs are left alone.
+    # Readers that still have files open keep them until they close them.
+    prefix = _cache_prefix(data_version)
+    for path in glob.glob(f"{glob.escape(prefix)}*"):
+        if path != keep and ".tmp-" not in path:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_cache(df, data_version, path):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype == object:
+            # Fixed-width strings so the column can be memory-mapped; the
+            # null mask is stored alongside so None does not come back as "None"
+            nulls = pd.isna(values)
+            if nulls.any():
+                np.save(os.path.join(tmp, f"{col}.null.npy"), nulls, allow_pickle=False)
+            values = np.where(nulls, "", values).astype(str)
+        np.save(os.path.join(tmp, f"{col}.npy"), values, allow_pickle=False)
+
+    with open(os.path.join(tmp, "columns.json"), "w") as f:
+        json.dump(list(df.columns), f)
+
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process published the same snapshot first
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    _remove_stale_caches(data_version, keep=path)
+
+
+def _read_cache(path):
+    with open(os.path.join(path, "columns.json")) as f:
+        columns = json.load(f)
+
+    data = {}
+    for col in columns:
+        values = np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r")
+        null_path = os.path.join(path, f"{col}.null.npy")
+        if os.path.exists(null_path):
+            values = values.astype(object)
+            values[np.load(null_path)] = None
+        data[col] = values
+
+    # copy=False keeps the numeric columns on the memory maps
+    return pd.DataFrame(data, copy=False)
+
+
+def load_feature_data(data_version=None, use_cache=True):
     """
     Loads feature snapshot from vehicle_features table.
     Optionally filter by data_version.
+
+    Rows are streamed in chunks of FEATURE_CHUNK_SIZE and stored with the
+    compact dtypes in FEATURE_DTYPES. The result is cached as one
+    memory-mapped .npy file per column under FEATURE_CACHE_DIR, keyed by
+    data_version and the latest feature_build_runs run, so later calls skip
+    MySQL until the features are rebuilt. Publishing a snapshot removes the
+    older ones for the same data_version.
     """
 
-    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        watermark = _table_watermark(conn) if use_cache else None
+        use_cache = watermark is not None
+        path = _cache_path(data_version, watermark)
+
+        if use_cache and os.path.isdir(path):
+            logger.info(f"Loading features from local cache {path}")
+            try:
+                return _read_cache(path)
+            except OSError as e:
+                # Removed by a newer build's writer while being read
+                logger.warning(f"Feature cache {path} unreadable ({e}); reading MySQL")
 
-    if data_version:
-        query = f"""
-        SELECT * FROM vehicle_features
-        WHERE data_version = '{data_version}'
-        """
+        if data_version:
+            query = text("SELECT * FROM vehicle_features WHERE data_version = :data_version")
+            params = {"data_version": data_version}
+        else:
+            query = text("SELECT * FROM vehicle_features")
+            params = {}
+
+        chunks = [
+            _apply_dtypes(chunk)
+            for chunk in pd.read_sql(
+                query,
+                conn.execution_options(stream_results=True),
+                params=params,
+                chunksize=FEATURE_CHUNK_SIZE
+            )
+        ]
+
+    if chunks:
+        df = _apply_dtypes(pd.concat(chunks, ignore_index=True))
     else:
-        query = "SELECT * FROM vehicle_features"
+        df = pd.DataFrame()
+
+    if use_cache and not df.empty:
+        _write_cache(df, data_version, path)
+
+    return df
+
+
+def split_features(df):
+    """Model inputs X and warranty label y of a vehicle_features frame."""
+    X = df.drop(NON_FEATURE_COLUMNS, axis=1)
+    y = df["warranty_flag"]
+    return X, y
+
+
+def serving_frame(X):
+    """
+    X with the 64-bit dtypes the API sends, for MLflow signatures and
+    input examples (the compact FEATURE_DTYPES would make pyfunc reject
+    int64 / float64 requests).
+    """
+    return X.astype({
+        col: "int64" if is_integer_dtype(X[col]) else "float64"
+        for col in X.columns
+        if is_numeric_dtype(X[col]) and not is_bool_dtype(X[col])
+    })
+
+
+def clip_function(x):
+    return np.clip(x, -0.999, None)
+
+
+def classify_columns(X):
+    """
+    Split numeric columns into (log_cols, yj_cols).
+
+    Bounded, mildly skewed columns with enough distinct values get
+    Yeo-Johnson; the rest get clip + log1p.
+    """
+    yj_cols = []
+    log_cols = []
+
+    for col in X.columns:
+        # Non-numeric columns are one-hot encoded by build_preprocessor
+        if not is_numeric_dtype(X[col]):
+            continue
+
+        if (
+            X[col].max() < 1e6 and
+            X[col].skew() < 2 and
+            X[col].nunique() > 10
+        ):
+            yj_cols.append(col)
+        else:
+            log_cols.append(col)
+
+    return log_cols, yj_cols
+
+
+def build_preprocessor(X):
+    """Unfitted ColumnTransformer shared by the warranty and anomaly models."""
+    # Imported here so the API, which only reads histograms, starts without sklearn
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, PowerTransformer
+
+    log_cols, yj_cols = classify_columns(X)
+
+    numeric_log_pipe = Pipeline([
+        ("clip", FunctionTransformer(clip_function, validate=False)),
+        ("log", FunctionTransformer(np.log1p, validate=False))
+    ])
+
+    numeric_yj_pipe = Pipeline([
+        ("power", PowerTransformer(method="yeo-johnson"))
+    ])
+
+    cat_cols = [c for c in X.columns if not is_numeric_dtype(X[c])]
+
+    transformers = [
+        ("num_log", numeric_log_pipe, log_cols),
+        ("num_yj", numeric_yj_pipe, yj_cols),
+    ]
+
+    if cat_cols:
+        transformers.append(("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols))
+
+    return ColumnTransformer(transformers=transformers, remainder="passthrough")
+
+
+def bin_counts(values, edges):
+    """
+    Counts of ``values`` in the bins defined by ``edges``.
+
+    The outer bins are open-ended, so live values outside the training
+    range still land in the first or last bin.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    n_bins = len(edges) - 1
+    index = np.searchsorted(edges[1:-1], values, side="right")
+    return np.bincount(index, minlength=n_bins)
+
+
+def baseline_histograms(X, n_bins=HISTOGRAM_BINS):
+    """
+    Fixed-bin histogram per numeric column of X.
+
+    Edges are training quantiles, so every feature has exactly ``n_bins``
+    bins (repeated quantiles of discrete features give empty bins).
+    """
+    histograms = {}
+
+    for col in X.columns:
+        values = X[col].to_numpy(dtype=float)
+        edges = np.quantile(values, np.linspace(0, 1, n_bins + 1))
+        histograms[col] = {
+            "bin_edges": edges.tolist(),
+            "counts": bin_counts(values, edges).tolist()
+        }
+
+    return histograms
+
+
+def save_baseline_histograms(histograms, run_id):
+    FeatureBaselineHistogram.__table__.create(bind=engine, checkfirst=True)
+
+    rows = [
+        {
+            "run_id": run_id,
+            "feature_name": feature,
+            "bin_edges": json.dumps(hist["bin_edges"]),
+            "counts": json.dumps(hist["counts"])
+        }
+        for feature, hist in histograms.items()
+    ]
+
+    with engine.begin() as conn:
+        conn.execute(FeatureBaselineHistogram.__table__.insert(), rows)
+
+
+def production_run_id(model_name="WarrantyModel", alias="production"):
+    """MLflow run behind ``model_name@alias``, or None when it cannot be resolved."""
+    from mlflow.tracking import MlflowClient
+
+    try:
+        return MlflowClient().get_model_version_by_alias(model_name, alias).run_id
+    except Exception as e:
+        logger.warning(f"Could not resolve {model_name}@{alias}: {e}")
+        return None
+
+
+def load_baseline_histograms(engine, run_id=None):
+    """
+    Histograms of training run ``run_id``, by default the run behind
+    WarrantyModel@production, so runs that were never promoted do not move
+    the drift reference. Without a resolvable production model the most
+    recent run's histograms are used.
+
+    Returns (run_id, {feature: (edges, counts)}); run_id is None when there
+    are no histograms for that run.
+    """
+    FeatureBaselineHistogram.__table__.create(bind=engine, checkfirst=True)
+
+    if run_id is None:
+        run_id = production_run_id()
+
+    if run_id is not None:
+        wanted_run = run_id
+    else:
+        wanted_run = (
+            select(FeatureBaselineHistogram.run_id)
+            .order_by(FeatureBaselineHistogram.histogram_id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+    query = select(FeatureBaselineHistogram).where(FeatureBaselineHistogram.run_id == wanted_run)
+
+    with engine.connect() as conn:
+        rows = conn.execute(query).all()
 
-    df = pd.read_sql(query, engine)
+    if not rows:
+        if run_id is not None:
+            logger.warning(f"No baseline histograms stored for run {run_id}")
+        return None, {}
 
-    return df
\ No newline at end of file
+    histograms = {
+        row.feature_name: (np.asarray(json.loads(row.bin_edges)), np.asarray(json.loads(row.counts)))
+        for row in rows
+    }
+    return rows[0].run_id, histograms
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Project modules build the shared engine at import; keep tests off MySQL
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,59 @@
+# Incremental vehicle_features builds (feature_pipeline.build_features)
+
+import datetime
+
+from sqlalchemy import text
+
+from benchmarks.env import EXTRA_TABLES
+from database.models import Base, StationOperation, Vehicle, VendorComponent, WarrantyClaim
+from database.session import SessionLocal, engine
+from feature_pipeline.build_features import build_features
+
+
+def _warranty_flags():
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT vehicle_id, warranty_flag FROM vehicle_features")).all())
+
+
+def test_incremental_build_picks_up_updated_claim():
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(EXTRA_TABLES[0]))
+
+    session = SessionLocal()
+    try:
+        for vid in ("veh-a", "veh-b"):
+            session.add(Vehicle(vehicle_id=vid, model_type="SUV", plant_id="P1", shift="A"))
+            session.add(StationOperation(
+                vehicle_id=vid, station_id="S1", cycle_time=60.0, error_count=0,
+                rework_flag=False, torque_value=100.0, temperature=20.0,
+                operation_timestamp=datetime.datetime(2026, 1, 1, 8)
+            ))
+            session.add(VendorComponent(
+                vehicle_id=vid, component_type="engine", vendor_id="V1",
+                batch_id="B1", defect_flag=False
+            ))
+            session.add(WarrantyClaim(vehicle_id=vid, warranty_flag=False, claim_type="none", days_to_claim=0))
+        session.commit()
+
+        assert build_features(full_rebuild=True) == 2
+        assert _warranty_flags() == {"veh-a": 0, "veh-b": 0}
+
+        # A later operation moves the operations watermark past veh-a's
+        session.add(StationOperation(
+            vehicle_id="veh-b", station_id="S2", cycle_time=61.0, error_count=1,
+            rework_flag=False, torque_value=101.0, temperature=20.0,
+            operation_timestamp=datetime.datetime(2026, 1, 1, 10)
+        ))
+        session.commit()
+        build_features()
+
+        # Flip an existing claim in place: no new ids anywhere
+        claim = session.query(WarrantyClaim).filter_by(vehicle_id="veh-a").one()
+        claim.warranty_flag = True
+        session.commit()
+    finally:
+        session.close()
+
+    build_features()
+    assert _warranty_flags()["veh-a"] == 1
@@ -0,0 +1,196 @@
+# Parity of ml.compiled_model with the sklearn pipelines it is compiled from
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from api.model_loader import ServingModels
+from ml.compiled_model import CompiledPipeline, check_parity, compile_pipeline
+from ml.utils import build_preprocessor
+
+FEATURES = [
+    "total_error_count",
+    "avg_cycle_time",
+    "cycle_time_variance",
+    "rework_ratio",
+    "vendor_defect_ratio",
+    "avg_torque",
+    "torque_deviation"
+]
+
+
+def _features(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "total_error_count": rng.poisson(3, n),
+        "avg_cycle_time": rng.normal(50, 5, n),
+        "cycle_time_variance": rng.gamma(2.0, 2.0, n),
+        "rework_ratio": rng.beta(1, 15, n),
+        "vendor_defect_ratio": rng.beta(1, 10, n),
+        "avg_torque": rng.normal(100, 8, n),
+        "torque_deviation": rng.gamma(3.0, 1.5, n)
+    })
+
+
+@pytest.fixture(scope="module")
+def training():
+    X = _features(2000, seed=0)
+    score = X["total_error_count"] * 0.4 + X["rework_ratio"] * 20 + (X["avg_torque"] - 100).abs() * 0.1
+    y = (score + np.random.default_rng(1).normal(0, 1, len(X)) > 3).astype(int)
+    # Trained on the compact FEATURE_DTYPES, like ml.train_supervised
+    return X.astype({c: "float32" for c in FEATURES if c != "total_error_count"}).astype(
+        {"total_error_count": "int16"}
+    ), y
+
+
+@pytest.fixture(scope="module")
+def classifier(training):
+    X, y = training
+    pipeline = Pipeline([
+        ("preprocessor", build_preprocessor(X)),
+        ("classifier", RandomForestClassifier(n_estimators=30, max_depth=12, random_state=0))
+    ])
+    return pipeline.fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def anomaly(training):
+    X, _ = training
+    pipeline = Pipeline([
+        ("preprocessor", build_preprocessor(X)),
+        ("model", IsolationForest(n_estimators=50, contamination=0.05, random_state=0))
+    ])
+    return pipeline.fit(X)
+
+
+def _inputs(training):
+    """Serving-style float64 frames: in-distribution, training rows, edge cases."""
+    X, _ = training
+    train = X.astype(np.float64)
+    rng = np.random.default_rng(7)
+
+    # One value nudged to the neighbouring doubles, the spots where <= vs < matters
+    nudged = pd.concat([
+        train.head(200).apply(lambda col: np.nextafter(col, np.inf)),
+        train.head(200).apply(lambda col: np.nextafter(col, -np.inf))
+    ])
+
+    edges = []
+    for col in FEATURES:
+        for value in [0.0, -0.5, -0.999, -0.9995, -1.0, -5.0, 1e-12, 1e6, 1e12]:
+            row = train.iloc[0].copy()
+            row[col] = value
+            edges.append(row)
+    edges.append(pd.Series(0.0, index=FEATURES))
+    edges.append(pd.Series(1e9, index=FEATURES))
+
+    return {
+        "random": _features(1000, seed=3).astype(np.float64),
+        "training_rows": train,
+        "nudged": nudged,
+        "shifted": (train.head(300) * rng.uniform(0.5, 2.0, (300, len(FEATURES)))),
+        "edges": pd.DataFrame(edges).reset_index(drop=True),
+        "single_row": train.head(1)
+    }
+
+
+@pytest.fixture(scope="module")
+def inputs(training):
+    return _inputs(training)
+
+
+CASES = ["random", "training_rows", "nudged", "shifted", "edges", "single_row"]
+
+
+def _matrix(compiled, df):
+    return df[compiled.input_columns].to_numpy(dtype=np.float64)
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_classifier_parity(classifier, inputs, case):
+    df = inputs[case]
+    compiled = compile_pipeline(classifier)
+    X = _matrix(compiled, df)
+    Xt = compiled.preprocessor.transform(X)
+
+    np.testing.assert_allclose(
+        compiled.model.predict_proba(Xt), classifier.predict_proba(df), rtol=0, atol=1e-12
+    )
+    np.testing.assert_array_equal(compiled.predict(X), classifier.predict(df))
+    assert check_parity(compiled, classifier, df) == 0
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_isolation_forest_parity(anomaly, inputs, case):
+    df = inputs[case]
+    compiled = compile_pipeline(anomaly)
+    X = _matrix(compiled, df)
+    Xt = compiled.preprocessor.transform(X)
+
+    np.testing.assert_allclose(
+        compiled.model.decision_function(Xt), anomaly.decision_function(df), rtol=0, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        compiled.model.score_samples(Xt), anomaly.score_samples(df), rtol=0, atol=1e-12
+    )
+    np.testing.assert_array_equal(compiled.predict(X), anomaly.predict(df))
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_preprocessor_parity(classifier, inputs, case):
+    df = inputs[case]
+    compiled = compile_pipeline(classifier)
+    expected = classifier.named_steps["preprocessor"].transform(df)
+    # Fitted on float32 features, sklearn's negative Yeo-Johnson branch takes
+    # 2 - lambda in float32; the compiled transform keeps float64 throughout
+    rtol = 1e-6 if (df.to_numpy() < 0).any() else 1e-12
+    np.testing.assert_allclose(
+        compiled.preprocessor.transform(_matrix(compiled, df)), expected, rtol=rtol, atol=1e-12
+    )
+
+
+@pytest.mark.parametrize("pipeline_name", ["classifier", "anomaly"])
+def test_saved_model_matches(request, inputs, tmp_path, pipeline_name):
+    pipeline = request.getfixturevalue(pipeline_name)
+    compiled = compile_pipeline(pipeline)
+    compiled.save(tmp_path / "model")
+    loaded = CompiledPipeline.load(tmp_path / "model")
+
+    for case in CASES:
+        X = _matrix(compiled, inputs[case])
+        np.testing.assert_array_equal(loaded.predict(X), pipeline.predict(inputs[case]))
+
+
+def test_compact_model_close(classifier, inputs, tmp_path):
+    compiled = compile_pipeline(classifier)
+    compiled.save(tmp_path / "compact", compact=True)
+    compact = CompiledPipeline.load(tmp_path / "compact")
+
+    df = inputs["random"]
+    X = _matrix(compact, df)
+    prob = compact.model.predict_proba(compact.preprocessor.transform(X))[:, 1]
+    # uint16 leaf values: within a quantization step of the exact probabilities
+    assert np.abs(prob - classifier.predict_proba(df)[:, 1]).max() < 1e-4
+    assert (compact.predict(X) == classifier.predict(df)).mean() > 0.99
+
+
+def test_serving_models_use_each_models_column_order(training, classifier, inputs):
+    X, _ = training
+    reordered = list(reversed(FEATURES))
+    anomaly = Pipeline([
+        ("preprocessor", build_preprocessor(X[reordered])),
+        ("model", IsolationForest(n_estimators=20, random_state=0))
+    ]).fit(X[reordered])
+
+    models = ServingModels(
+        None, None, "1", "1",
+        warranty_fast=compile_pipeline(classifier),
+        anomaly_fast=compile_pipeline(anomaly)
+    )
+    df = inputs["random"].head(100)
+    warranty, flags = models.score(df.to_dict("records"))
+
+    np.testing.assert_array_equal(warranty, classifier.predict(df))
+    np.testing.assert_array_equal(flags, anomaly.predict(df[reordered]))
@@ -0,0 +1,24 @@
+# Local vehicle_features snapshots (ml.utils)
+
+import os
+
+import pandas as pd
+
+from ml import utils
+
+
+def _frame(n):
+    return pd.DataFrame({"vehicle_id": [f"veh-{i}" for i in range(n)], "avg_torque": [100.0] * n})
+
+
+def test_publishing_a_snapshot_removes_older_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "FEATURE_CACHE_DIR", str(tmp_path))
+
+    utils._write_cache(_frame(2), "v1", utils._cache_path("v1", 1))
+    utils._write_cache(_frame(3), "v2", utils._cache_path("v2", 1))
+    utils._write_cache(_frame(4), "v1", utils._cache_path("v1", 2))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(utils._cache_path(version, run)) for version, run in [("v1", 2), ("v2", 1)]
+    )
+    assert len(utils._read_cache(utils._cache_path("v1", 2))) == 4
@@ -0,0 +1,29 @@
+# Schema migrations (database.migrations)
+
+from sqlalchemy import create_engine, inspect, text
+
+from database.migrations import PREDICTION_LOG_COLUMNS, add_prediction_log_columns
+
+
+def _columns(engine):
+    return {c["name"] for c in inspect(engine).get_columns("prediction_logs")}
+
+
+def test_adds_missing_prediction_log_columns_once():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE prediction_logs (
+                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                risk_level VARCHAR(20),
+                risk_rule VARCHAR(64)
+            )
+        """))
+
+    assert add_prediction_log_columns(engine) == ["cache_hit"]
+    assert set(PREDICTION_LOG_COLUMNS) <= _columns(engine)
+    assert add_prediction_log_columns(engine) == []
+
+
+def test_no_prediction_logs_table():
+    assert add_prediction_log_columns(create_engine("sqlite://")) == []
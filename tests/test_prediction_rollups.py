@@ -0,0 +1,50 @@
+# Hourly rollups of prediction_logs rows (ml.prediction_rollups)
+
+import datetime
+import json
+
+import pandas as pd
+
+from ml.prediction_rollups import hourly_rollups
+
+HOUR = datetime.datetime(2026, 1, 1, 10)
+
+
+def _log_rows(anomaly_flags, risk_levels, minute_step=5):
+    return pd.DataFrame({
+        "prediction_timestamp": [
+            HOUR + datetime.timedelta(minutes=i * minute_step) for i in range(len(anomaly_flags))
+        ],
+        "model_version": "3",
+        "warranty_probability": 0.25,
+        "anomaly_flag": anomaly_flags,
+        "risk_level": risk_levels,
+        "request_payload": [json.dumps({"avg_torque": 100.0 + i}) for i in range(len(anomaly_flags))],
+        "latency_ms": [float(i + 1) for i in range(len(anomaly_flags))],
+        "cache_hit": [i % 2 == 0 for i in range(len(anomaly_flags))]
+    })
+
+
+def test_anomaly_count_uses_isolation_forest_convention():
+    # -1 is an anomaly, 1 is normal
+    df = _log_rows([-1, 1, 1, -1, 1], ["HIGH", "LOW", "LOW", "HIGH", "MEDIUM"])
+    hourly, _ = hourly_rollups(df)
+
+    assert len(hourly) == 1
+    assert hourly[0]["anomaly_count"] == 2
+    assert hourly[0]["request_count"] == 5
+
+
+def test_counts_split_by_hour():
+    df = _log_rows([1, -1, 1, 1], ["LOW", "HIGH", "LOW", "MEDIUM"], minute_step=30)
+    hourly, features = hourly_rollups(df)
+
+    assert [row["hour_start"] for row in hourly] == [HOUR, HOUR + datetime.timedelta(hours=1)]
+    assert [row["request_count"] for row in hourly] == [2, 2]
+    assert [row["anomaly_count"] for row in hourly] == [1, 0]
+    assert [(row["risk_low"], row["risk_medium"], row["risk_high"]) for row in hourly] == [
+        (1, 0, 1), (1, 1, 0)
+    ]
+    assert [row["cache_hits"] for row in hourly] == [1, 1]
+    assert [row["count"] for row in features] == [2, 2]
+    assert features[0]["value_sum"] == 201.0
@@ -0,0 +1,40 @@
+# Promotion of retrained warranty models (ml.retrain)
+
+import pytest
+
+from ml import retrain
+
+
+@pytest.fixture
+def aliases(monkeypatch):
+    moved = []
+
+    def promote(version, alias="production"):
+        moved.append((alias, version))
+        return True
+
+    monkeypatch.setattr(retrain, "promote", promote)
+    return moved
+
+
+def test_better_model_goes_to_production_by_default(aliases):
+    assert retrain.promote_candidate("7", new_auc=0.91, prod_auc=0.88) == "7"
+    assert aliases == [("production", "7")]
+
+
+def test_shadow_gate_makes_better_model_the_challenger(aliases):
+    assert retrain.promote_candidate("7", new_auc=0.91, prod_auc=0.88, require_shadow=True) == "7"
+    assert aliases == [(retrain.CHALLENGER_ALIAS, "7")]
+
+
+def test_first_model_goes_to_production_with_shadow_gate(aliases):
+    # Nothing to shadow against
+    assert retrain.promote_candidate("1", new_auc=0.85, prod_auc=None, require_shadow=True) == "1"
+    assert aliases == [("production", "1")]
+
+
+@pytest.mark.parametrize("require_shadow", [False, True])
+def test_worse_model_is_not_promoted(aliases, require_shadow):
+    assert retrain.promote_candidate("7", new_auc=0.85, prod_auc=0.88, require_shadow=require_shadow) is None
+    assert aliases == []
+